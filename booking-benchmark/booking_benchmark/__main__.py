@@ -0,0 +1,112 @@
+import argparse
+import sys
+from pathlib import Path
+
+from booking_benchmark.benchmarks import (
+    BENCHMARKS,
+    BenchmarkResult,
+    run_benchmarks,
+)
+from booking_benchmark.report import (
+    BenchmarkReport,
+    compare,
+    formatted_value,
+    new_report,
+)
+
+
+def sizes_argument(value: str):
+    return [int(float(size)) for size in value.split(",")]
+
+
+def print_result(result: BenchmarkResult):
+    print(
+        f"{result.benchmark:<44} {result.size:>9}"
+        f" {formatted_value(result.value, result.unit):>12}",
+        flush=True,
+    )
+
+
+def entrypoint():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Time the allocation and serialization paths of the booking server"
+            " on synthetic states."
+        )
+    )
+    parser.add_argument(
+        "--sizes",
+        type=sizes_argument,
+        default=[100, 1000, 10000, 100000],
+        help=(
+            "Comma separated numbers of bookings and resources in the"
+            " synthetic states, e.g. 1e2,1e4,1e6."
+        ),
+    )
+    parser.add_argument(
+        "--only",
+        choices=BENCHMARKS,
+        action="append",
+        help="Run only the given benchmark. Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="Seconds each timed benchmark runs at least.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="JSON file to write the results to.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help=(
+            "JSON file of earlier results to compare to. Exits with status 1"
+            " if any benchmark got slower or bigger than the tolerance."
+        ),
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative increase over the baseline.",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline is not None:
+        baseline = BenchmarkReport.model_validate_json(
+            args.baseline.read_text()
+        )
+
+    results = run_benchmarks(
+        args.sizes, set(args.only or BENCHMARKS), args.min_time, print_result
+    )
+    report = new_report(results)
+
+    if args.output is not None:
+        args.output.write_text(report.model_dump_json(indent=2))
+
+    if baseline is None:
+        return
+
+    comparisons = compare(baseline, report, args.tolerance)
+    print()
+    for comparison in comparisons:
+        print(
+            f"{comparison.benchmark:<44} {comparison.size:>9}"
+            f" {comparison.change:>+8.1%}"
+            f"{'  REGRESSED' if comparison.regressed else ''}"
+        )
+
+    if any(comparison.regressed for comparison in comparisons):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    entrypoint()
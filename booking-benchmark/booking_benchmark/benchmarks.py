@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import time
+import tracemalloc
+from asyncio import AbstractEventLoop
+from collections import deque
+from typing import Awaitable, Callable
+
+from booking_benchmark.read_scaling import read_scaling
+from booking_benchmark.synthetic import (
+    BUSY_TYPE,
+    END_TIME,
+    FREE_TYPES,
+    START_TIME,
+    resource_identifier,
+    synthetic_raw_state,
+    synthetic_server_state,
+)
+from booking_common.models import (
+    BookingRequest,
+    BookingStatus,
+    RequestedResource,
+)
+from booking_server.booking import add_new_booking, finish_booking
+from booking_server.broker import match_resources_and_bookings
+from booking_server.persistence import paused_gc, restore_server_state
+from booking_server.server import ServerState, dumpable_server_state
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ConfigDict
+
+# Runs the measured operation the given number of times
+Operations = Callable[[int], Awaitable[None]]
+
+
+class BenchmarkResult(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    benchmark: str
+    size: int
+    value: float
+    unit: str
+
+
+def time_per_operation(
+    loop: AbstractEventLoop, operations: Operations, min_time: float
+):
+    # Repeats the operation until a run takes long enough to measure
+    count = 1
+    while True:
+        gc.collect()
+        started = time.perf_counter()
+        loop.run_until_complete(operations(count))
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return elapsed / count
+        count *= 10 if elapsed < min_time / 10 else 2
+
+
+def booking_request(requested: RequestedResource):
+    return BookingRequest(
+        name="benchmark",
+        resource=requested,
+        start_time=START_TIME,
+        end_time=END_TIME,
+    )
+
+
+def new_booking_rounds(state: ServerState, requested: RequestedResource):
+    # A new booking gets a free resource in its allocator round and
+    # finishes, leaving the state as it was apart from the closed booking
+    request = booking_request(requested)
+
+    async def operations(count: int):
+        for _ in range(count):
+            booking = await add_new_booking(request, state)
+            for assigned in match_resources_and_bookings([], [booking], state):
+                if assigned.used_resource is not None:
+                    finish_booking(assigned, assigned.used_resource, state)
+
+    return operations
+
+
+def freed_resource_rounds(state: ServerState):
+    # A booking finishes and its resource goes to the first waiting booking
+    # while a new one starts waiting, so the queue keeps its length
+    request = booking_request(RequestedResource(type=BUSY_TYPE))
+    on = deque(
+        booking
+        for booking in state.ids_to_bookings.values()
+        if booking.info.status == BookingStatus.ON
+    )
+
+    async def operations(count: int):
+        for _ in range(count):
+            booking = on.popleft()
+            resource = booking.used_resource
+            if resource is None:
+                continue
+            finish_booking(booking, resource, state)
+            waiting = await add_new_booking(request, state)
+            on.extend(
+                match_resources_and_bookings([resource], [waiting], state)
+            )
+
+    return operations
+
+
+def timing_benchmarks(size: int) -> dict[str, Operations]:
+    server_state = synthetic_server_state(size)
+    fair_share_state = synthetic_server_state(size, "fair-share")
+    new_booking = booking_request(RequestedResource(type=BUSY_TYPE))
+    free_resources = [
+        resource
+        for resource in server_state.resources
+        if resource.used_by is None
+    ]
+
+    raw_state = synthetic_raw_state(size)
+
+    async def restore_state(count: int):
+        for _ in range(count):
+            with paused_gc():
+                restore_server_state(raw_state, ServerState())
+
+    async def add_booking(count: int):
+        for _ in range(count):
+            await add_new_booking(new_booking, server_state)
+
+    async def dump_state(count: int):
+        for _ in range(count):
+            await dumpable_server_state(server_state)
+
+    async def encode_state(count: int):
+        for _ in range(count):
+            jsonable_encoder(await dumpable_server_state(server_state))
+
+    async def encode_free_resources(count: int):
+        for _ in range(count):
+            jsonable_encoder([resource.info for resource in free_resources])
+
+    # Ordered so that the ones adding bookings run last
+    return {
+        "restore_server_state": restore_state,
+        "dumpable_server_state": dump_state,
+        "jsonable_encoder[state]": encode_state,
+        "jsonable_encoder[free_resources]": encode_free_resources,
+        "allocator_round[new booking, type]": new_booking_rounds(
+            server_state, RequestedResource(type="free_0")
+        ),
+        "allocator_round[new booking, identifier]": new_booking_rounds(
+            server_state,
+            RequestedResource(
+                type=f"free_{(size - 1) % FREE_TYPES}",
+                identifier=resource_identifier(size - 1),
+            ),
+        ),
+        "allocator_round[freed resource, first-come]": freed_resource_rounds(
+            server_state
+        ),
+        "allocator_round[freed resource, fair-share]": freed_resource_rounds(
+            fair_share_state
+        ),
+        "add_new_booking": add_booking,
+    }
+
+
+def traced_size(size: int, with_bookings: bool):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        server_state = synthetic_server_state(
+            size, with_bookings=with_bookings
+        )
+        gc.collect()
+        traced, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    del server_state
+    return traced
+
+
+def memory_per_booking(size: int):
+    # Resources are left out by subtracting a state without bookings
+    with_bookings = traced_size(size, with_bookings=True)
+    without_bookings = traced_size(size, with_bookings=False)
+    return (with_bookings - without_bookings) / size
+
+
+BENCHMARKS = (
+    "restore_server_state",
+    "dumpable_server_state",
+    "jsonable_encoder[state]",
+    "jsonable_encoder[free_resources]",
+    "allocator_round[new booking, type]",
+    "allocator_round[new booking, identifier]",
+    "allocator_round[freed resource, first-come]",
+    "allocator_round[freed resource, fair-share]",
+    "add_new_booking",
+    "memory_per_booking",
+    "read_request",
+)
+
+
+def run_benchmarks(
+    sizes: list[int],
+    selected: set[str],
+    min_time: float,
+    progress: Callable[[BenchmarkResult], None],
+):
+    loop = asyncio.new_event_loop()
+    results: list[BenchmarkResult] = []
+
+    try:
+        for size in sizes:
+            if selected - {"memory_per_booking", "read_request"}:
+                for name, operations in timing_benchmarks(size).items():
+                    if name not in selected:
+                        continue
+                    result = BenchmarkResult(
+                        benchmark=name,
+                        size=size,
+                        value=time_per_operation(loop, operations, min_time),
+                        unit="seconds",
+                    )
+                    results.append(result)
+                    progress(result)
+
+            if "memory_per_booking" in selected:
+                result = BenchmarkResult(
+                    benchmark="memory_per_booking",
+                    size=size,
+                    value=memory_per_booking(size),
+                    unit="bytes",
+                )
+                results.append(result)
+                progress(result)
+
+            if "read_request" in selected:
+                for workers, value in read_scaling(
+                    loop, size, min_time
+                ).items():
+                    result = BenchmarkResult(
+                        benchmark=f"read_request[workers={workers}]",
+                        size=size,
+                        value=value,
+                        unit="seconds",
+                    )
+                    results.append(result)
+                    progress(result)
+    finally:
+        loop.close()
+
+    return results
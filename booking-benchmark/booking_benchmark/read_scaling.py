@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import tempfile
+import time
+from asyncio import AbstractEventLoop
+from http import HTTPStatus
+from multiprocessing.queues import SimpleQueue
+from multiprocessing.synchronize import Barrier
+from pathlib import Path
+
+import aiohttp
+from booking_benchmark.synthetic import synthetic_server_state
+from booking_server.replica import ReplicaStore, resync_replica
+from booking_server.replica_api import run_read_worker
+from hypercorn import Config
+
+READ_WORKERS = (1, 2, 4)
+# Same load for every number of workers, so that only the servers change
+LOAD_PROCESSES = 4
+REQUESTS_IN_FLIGHT = 16
+READ_PATH = "/booking/all?limit=100"
+
+
+async def counted_reads(url: str, start_at: float, end_at: float):
+    count = 0
+
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=REQUESTS_IN_FLIGHT)
+    ) as session:
+
+        async def read_until_end():
+            nonlocal count
+            # Reads before the start warm up the connections
+            while time.time() < end_at:
+                async with session.get(url) as response:
+                    await response.read()
+                if start_at <= time.time() < end_at:
+                    count += 1
+
+        await asyncio.gather(
+            *(read_until_end() for _ in range(REQUESTS_IN_FLIGHT))
+        )
+
+    return count
+
+
+def generated_reads(
+    url: str, ready: Barrier, duration: float, counts: SimpleQueue[int]
+):
+    # Started together once every process has imported everything. Late
+    # workers get their share of the connections only after they have
+    # started, so the measuring waits a while.
+    ready.wait()
+    start_at = time.time() + 2
+    counts.put(asyncio.run(counted_reads(url, start_at, start_at + duration)))
+
+
+async def wait_until_serving(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    if response.status == HTTPStatus.OK:
+                        return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+            await asyncio.sleep(0.1)
+
+
+def seconds_per_read(
+    loop: AbstractEventLoop, replica_path: Path, workers: int, duration: float
+):
+    config = Config()
+    config.bind = ["127.0.0.1:0"]
+    sockets = config.create_sockets()
+    host, port = sockets.insecure_sockets[0].getsockname()[:2]
+    url = f"http://{host}:{port}{READ_PATH}"
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(LOAD_PROCESSES + 1)
+    counts: SimpleQueue[int] = context.SimpleQueue()
+    processes = [
+        context.Process(
+            target=run_read_worker,
+            args=(replica_path, config, sockets),
+            daemon=True,
+        )
+        for _ in range(workers)
+    ] + [
+        context.Process(
+            target=generated_reads,
+            args=(url, ready, duration, counts),
+            daemon=True,
+        )
+        for _ in range(LOAD_PROCESSES)
+    ]
+
+    try:
+        for process in processes:
+            process.start()
+        loop.run_until_complete(wait_until_serving(url))
+        ready.wait()
+        total = sum(counts.get() for _ in range(LOAD_PROCESSES))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        for sock in sockets.insecure_sockets:
+            sock.close()
+
+    return duration / max(total, 1)
+
+
+def read_scaling(loop: AbstractEventLoop, size: int, min_time: float):
+    # Throughput of the read workers serving booking pages from a replica
+    # of the synthetic state, as seconds per read over all workers. With
+    # enough cores the time halves when the workers double.
+    with tempfile.TemporaryDirectory() as directory:
+        replica_path = Path(directory) / "replica.sqlite"
+        store = ReplicaStore(replica_path)
+        try:
+            loop.run_until_complete(
+                resync_replica(store, synthetic_server_state(size), True)
+            )
+        finally:
+            store.connection.close()
+
+        return {
+            workers: seconds_per_read(
+                loop, replica_path, workers, max(min_time, 1)
+            )
+            for workers in READ_WORKERS
+        }
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import platform
+import sys
+from datetime import datetime, timezone
+
+from booking_benchmark.benchmarks import BenchmarkResult
+from pydantic import BaseModel, ConfigDict
+
+
+class BenchmarkReport(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    python: str
+    platform: str
+    created: datetime
+    results: list[BenchmarkResult]
+
+
+class Comparison(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    benchmark: str
+    size: int
+    baseline: float
+    current: float
+    change: float
+    regressed: bool
+
+
+def new_report(results: list[BenchmarkResult]):
+    return BenchmarkReport(
+        python=sys.version.split()[0],
+        platform=platform.platform(),
+        created=datetime.now(timezone.utc),
+        results=results,
+    )
+
+
+def compare(
+    baseline: BenchmarkReport, current: BenchmarkReport, tolerance: float
+):
+    # Only benchmarks measured in both reports are compared
+    baseline_values = {
+        (result.benchmark, result.size): result.value
+        for result in baseline.results
+    }
+
+    comparisons: list[Comparison] = []
+    for result in current.results:
+        baseline_value = baseline_values.get((result.benchmark, result.size))
+        if not baseline_value:
+            continue
+
+        change = result.value / baseline_value - 1
+        comparisons.append(
+            Comparison(
+                benchmark=result.benchmark,
+                size=result.size,
+                baseline=baseline_value,
+                current=result.value,
+                change=change,
+                regressed=change > tolerance,
+            )
+        )
+
+    return comparisons
+
+
+def formatted_value(value: float, unit: str):
+    if unit == "bytes":
+        return f"{value:.0f} B"
+    for scale, suffix in ((1, "s"), (1e-3, "ms"), (1e-6, "us")):
+        if value >= scale:
+            return f"{value / scale:.2f} {suffix}"
+    return f"{value / 1e-9:.0f} ns"
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any
+
+from booking_common.models import BookingStatus
+from booking_server.broker import allocation_policy
+from booking_server.persistence import (
+    empty_raw_state,
+    paused_gc,
+    restore_server_state,
+)
+from booking_server.server import ServerState
+
+START_TIME = datetime(2020, 1, 1, tzinfo=timezone.utc)
+END_TIME = datetime(2099, 1, 1, tzinfo=timezone.utc)
+BUSY_TYPE = "busy"
+FREE_TYPES = 10
+
+
+def resource_identifier(index: int):
+    return f"resource_{index:07d}"
+
+
+def synthetic_raw_state(size: int, with_bookings: bool = True):
+    # Half of the resources are in use by the first half of the bookings,
+    # the other half of the bookings waits for the same type. The rest of
+    # the resources are free and spread over other types.
+    raw_state: dict[str, Any] = empty_raw_state()
+    resources = raw_state["resources"]
+    bookings = raw_state["bookings"]
+    in_use = size // 2
+
+    for index in range(size):
+        identifier = resource_identifier(index)
+        resource_type = (
+            BUSY_TYPE if index < in_use else f"free_{index % FREE_TYPES}"
+        )
+        resources[identifier] = (resource_type, identifier, None)
+
+    if not with_bookings:
+        return raw_state
+
+    for booking_id in range(size):
+        on = booking_id < in_use
+        # Same layout as the booking rows of the write-ahead log
+        row = (
+            booking_id,
+            f"user_{booking_id % 100}",
+            BUSY_TYPE,
+            None,
+            START_TIME,
+            END_TIME,
+            (booking_id, booking_id, f"owner_{booking_id % 50}", "repo"),
+            START_TIME,
+            (BookingStatus.ON if on else BookingStatus.WAITING).value,
+            1 if on else 0,
+            0,
+        )
+        used_identifier = resource_identifier(booking_id) if on else None
+        bookings[booking_id] = [row, used_identifier, None, None]
+    raw_state["booking_id_counter"] = size
+
+    return raw_state
+
+
+def synthetic_server_state(
+    size: int, policy: str = "first-come", with_bookings: bool = True
+):
+    server_state = ServerState(waiting_bookings=allocation_policy(policy))
+    with paused_gc():
+        restore_server_state(
+            synthetic_raw_state(size, with_bookings), server_state
+        )
+    return server_state
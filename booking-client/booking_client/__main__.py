@@ -1,9 +1,12 @@
-from typing import Callable, NoReturn, cast
+import sys
+from typing import Any, Callable, Coroutine, cast
 
 from booking_client.cli import main_arg_parser
+from booking_client.client import BookingClient
+from booking_client.exceptions import BookingClientError
 from booking_client.interactive_cli import interactive_cli_arg_parser
 
-# TODO: Read configuration and environment
+# TODO: Read configuration file
 
 
 def entrypoint():
@@ -11,8 +14,22 @@ def entrypoint():
     main_parser = main_arg_parser(interactive_cli_parser)
 
     args = vars(main_parser.parse_args())
-    subcommand = cast(Callable[..., NoReturn], args.pop("func"))
-    subcommand(**args)
+    subcommand = cast(
+        Callable[..., Coroutine[Any, Any, None]], args.pop("func")
+    )
+
+    # Every request of the command, also the ones made from the
+    # interactive CLI, goes through the same client and its connections
+    with BookingClient(
+        args.pop("server"),
+        timeout=args.pop("timeout"),
+        retries=args.pop("retries"),
+    ) as client:
+        try:
+            client.run(subcommand(client.client, **args))
+        except BookingClientError as error:
+            print(error.message, file=sys.stderr)
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,26 +1,20 @@
 from __future__ import annotations
 
 import asyncio
-import sys
 from argparse import ArgumentError
 from asyncio import Task
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 from signal import SIGINT
 from time import time
-from typing import TYPE_CHECKING, Callable, NoReturn
+from typing import TYPE_CHECKING, Any, Callable, Coroutine
 
-import aiohttp
-import requests
 from aioconsole import ainput, aprint  # type: ignore
-from booking_common.models import (
-    BookingRequest,
-    BookingResponse,
-    RequestedResource,
-)
-from requests.exceptions import HTTPError
+from booking_client.exceptions import BookingClientError
+from booking_common.models import BookingRequest, RequestedResource
 
 if TYPE_CHECKING:
+    from booking_client.client import AsyncBookingClient
     from booking_client.custom_argparse import FixedArgumentParser
 
 
@@ -38,7 +32,8 @@ class BookingSlot:
     end_time: datetime
 
 
-def book_with_wait(
+async def book_with_wait(
+    client: AsyncBookingClient,
     resource_type: str,
     resource_identifier: None | str,
     booking_time: BookingSlot,
@@ -58,55 +53,44 @@ def book_with_wait(
         ),
     )
 
-    try:
-        response = requests.post(
-            "http://localhost:8000/booking",
-            data=body.model_dump_json(),
-            timeout=0.1,
-        )
-    except ConnectionError:
-        print("Could not connect to booking server", file=sys.stderr)
-        sys.exit(1)
-
-    try:
-        response.raise_for_status()
-    except HTTPError:
-        print(response.json()["detail"], file=sys.stderr)
-        sys.exit(1)
-
-    booking = BookingResponse(**response.json())
+    booking = await client.create_booking(body)
 
     print(f"Booking id is {booking.info.id}")
 
     if wait:
-        wait_booking_with_interactive_cli(parser, booking.info.id)
+        await wait_booking_with_interactive_cli(
+            client, parser, booking.info.id
+        )
 
 
-def book(
-    resource_type: str, resource_identifier: None | str, workflow_id: int
+async def book(
+    client: AsyncBookingClient,
+    resource_type: str,
+    resource_identifier: None | str,
+    workflow_id: int,
 ):
     print(f"Booking resource {resource_type}")
 
     if workflow_id:
         pass  # TODO
 
-    response = requests.post(
-        "http://localhost:8000/booking",
-        json={
-            "name": "Some client",
-            "resource": {
-                "type": resource_type,
-                "identifier": resource_identifier,
-            },
-        },
-        timeout=0.1,
+    start_time = datetime.now().astimezone()
+    booking = await client.create_booking(
+        BookingRequest(
+            name="Some Client",
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=30),
+            resource=RequestedResource(
+                identifier=resource_identifier, type=resource_type
+            ),
+        )
     )
 
-    print(response.json())
+    print(f"Booking id is {booking.info.id}")
 
 
-def cancel_booking(booking_id: int):
-    print(booking_id)
+async def cancel_booking(client: AsyncBookingClient, booking_id: int):
+    print(await client.cancel_booking(booking_id))
 
 
 @dataclass
@@ -146,44 +130,42 @@ def ask_exit(tasks: list[Task], status: InterruptInfo):
     print(f"{GREEN}> {RESET_COLOR}", end="", flush=True)
 
 
-def wait_booking_with_interactive_cli(
-    parser: FixedArgumentParser, booking_id: int
+async def wait_booking_with_interactive_cli(
+    client: AsyncBookingClient, parser: FixedArgumentParser, booking_id: int
 ):
     async def wait_booking(tasks: list[Task], booking_id: int):
-        url = f"ws://localhost:8000/booking/{booking_id}/wait"
-        async with aiohttp.TCPConnector(limit=1) as connector:
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.ws_connect(url) as websocket:
-                    message = await websocket.receive_json()
-                    await aprint(f"\n{message}")
-                    cancel_all(tasks)
+        try:
+            message = await client.wait_booking(booking_id)
+        except BookingClientError as error:
+            message = error.message
+        await aprint(f"\n{message}")
+        cancel_all(tasks)
 
     async def open_interactive_cli(tasks: list[Task]):
         while True:
             command: str = await ainput(f"{GREEN}> {RESET_COLOR}")
             try:
                 args = vars(parser.parse_args(command.split()))
-                subcommand: Callable[..., NoReturn] = args.pop("func")
-                subcommand(**args)
+                subcommand: Callable[..., Coroutine[Any, Any, None]] = (
+                    args.pop("func")
+                )
+                await subcommand(client, **args)
             except CliExit:
                 cancel_all(tasks)
                 return
-            except ArgumentError as error:
+            except (ArgumentError, BookingClientError) as error:
                 await aprint(error.message)
 
-    async def wait_and_open_cli() -> None:
-        async with asyncio.TaskGroup() as group:
-            tasks: list[Task] = []
-            tasks.append(group.create_task(open_interactive_cli(tasks)))
-            tasks.append(group.create_task(wait_booking(tasks, booking_id)))
+    async with asyncio.TaskGroup() as group:
+        tasks: list[Task] = []
+        tasks.append(group.create_task(open_interactive_cli(tasks)))
+        tasks.append(group.create_task(wait_booking(tasks, booking_id)))
 
-            asyncio.get_running_loop().add_signal_handler(
-                SIGINT, ask_exit, tasks, InterruptInfo(3, 3)
-            )
-        asyncio.get_running_loop().remove_signal_handler(SIGINT)
-
-    asyncio.run(wait_and_open_cli())
+        asyncio.get_running_loop().add_signal_handler(
+            SIGINT, ask_exit, tasks, InterruptInfo(3, 3)
+        )
+    asyncio.get_running_loop().remove_signal_handler(SIGINT)
 
 
-def finish_booking(booking_id: int):
-    print(booking_id)
+async def finish_booking(client: AsyncBookingClient, booking_id: int):
+    print(await client.finish_booking(booking_id))
@@ -1,3 +1,6 @@
+from __future__ import annotations
+
+import os
 import re
 from argparse import (
     Action,
@@ -7,7 +10,8 @@ from argparse import (
     _SubParsersAction,
 )
 from datetime import datetime, timedelta
-from typing import Sequence
+from pathlib import Path
+from typing import TYPE_CHECKING, Sequence
 
 from booking_client.booking import (
     BookingSlot,
@@ -16,8 +20,16 @@ from booking_client.booking import (
     finish_booking,
     wait_booking_with_interactive_cli,
 )
+from booking_client.client import DEFAULT_BASE_URL
 from booking_client.custom_argparse import FixedArgumentParser
-from booking_client.resource import resource_add, resource_delete
+from booking_client.resource import (
+    resource_add,
+    resource_delete,
+    resource_sync,
+)
+
+if TYPE_CHECKING:
+    from booking_client.client import AsyncBookingClient
 
 
 class ValidateTime(Action):
@@ -134,7 +146,8 @@ class ValidateTime(Action):
 def add_book_command_with_waiting_option(
     interactive_cli_parser: FixedArgumentParser, subparsers: _SubParsersAction
 ):
-    def callback_function(
+    async def callback_function(
+        client: AsyncBookingClient,
         resource_type: str,
         resource_identifier: None | str,
         booking_time: BookingSlot,
@@ -142,7 +155,8 @@ def add_book_command_with_waiting_option(
         workflow_id: int,
         interactive_cli_parser: FixedArgumentParser,
     ):
-        book_with_wait(
+        await book_with_wait(
+            client,
             resource_type,
             resource_identifier,
             booking_time,
@@ -172,8 +186,12 @@ def add_book_command_with_waiting_option(
 
 
 def add_resource_add_command(resource_subparsers: _SubParsersAction):
-    def callback_function(resource_type: str, resource_identifier: str):
-        resource_add(resource_type, resource_identifier)
+    async def callback_function(
+        client: AsyncBookingClient,
+        resource_type: str,
+        resource_identifier: str,
+    ):
+        await resource_add(client, resource_type, resource_identifier)
 
     subcommand: FixedArgumentParser = resource_subparsers.add_parser("add")
     subcommand.set_defaults(func=callback_function)
@@ -182,24 +200,45 @@ def add_resource_add_command(resource_subparsers: _SubParsersAction):
 
 
 def add_resource_delete_command(resource_subparsers: _SubParsersAction):
-    def callback_function(resource_identifier: str):
-        resource_delete(resource_identifier)
+    async def callback_function(
+        client: AsyncBookingClient, resource_identifier: str
+    ):
+        await resource_delete(client, resource_identifier)
 
     subcommand: FixedArgumentParser = resource_subparsers.add_parser("delete")
     subcommand.set_defaults(func=callback_function)
     subcommand.add_argument("resource_identifier")
 
 
+def add_resource_sync_command(resource_subparsers: _SubParsersAction):
+    async def callback_function(
+        client: AsyncBookingClient, inventory_file: Path
+    ):
+        await resource_sync(client, inventory_file)
+
+    subcommand: FixedArgumentParser = resource_subparsers.add_parser(
+        "sync",
+        help=(
+            "replace the resources of a label with the ones listed in a JSON"
+            ' file like {"label": "...", "resources": [{"type": "...",'
+            ' "identifier": "..."}]}'
+        ),
+    )
+    subcommand.set_defaults(func=callback_function)
+    subcommand.add_argument("inventory_file", type=Path)
+
+
 def add_resource_commands(subparsers: _SubParsersAction):
     subcommand: FixedArgumentParser = subparsers.add_parser("resource")
     subsubcommand = subcommand.add_subparsers(required=True)
     add_resource_add_command(subsubcommand)
     add_resource_delete_command(subsubcommand)
+    add_resource_sync_command(subsubcommand)
 
 
 def add_cancel_command(subparsers: _SubParsersAction):
-    def callback_function(booking_id: int):
-        cancel_booking(booking_id)
+    async def callback_function(client: AsyncBookingClient, booking_id: int):
+        await cancel_booking(client, booking_id)
 
     subcommand: FixedArgumentParser = subparsers.add_parser("cancel")
     subcommand.set_defaults(func=callback_function)
@@ -209,10 +248,14 @@ def add_cancel_command(subparsers: _SubParsersAction):
 def add_wait_command(
     interactive_cli_parser: FixedArgumentParser, subparsers: _SubParsersAction
 ):
-    def callback_function(
-        interactive_cli_parser: FixedArgumentParser, booking_id: int
+    async def callback_function(
+        client: AsyncBookingClient,
+        interactive_cli_parser: FixedArgumentParser,
+        booking_id: int,
     ):
-        wait_booking_with_interactive_cli(interactive_cli_parser, booking_id)
+        await wait_booking_with_interactive_cli(
+            client, interactive_cli_parser, booking_id
+        )
 
     subcommand: FixedArgumentParser = subparsers.add_parser("wait")
     subcommand.set_defaults(func=callback_function)
@@ -223,8 +266,8 @@ def add_wait_command(
 def add_finish_command(subparsers: _SubParsersAction):
     subcommand: FixedArgumentParser = subparsers.add_parser("finish")
 
-    def callback_function(booking_id: int):
-        finish_booking(booking_id)
+    async def callback_function(client: AsyncBookingClient, booking_id: int):
+        await finish_booking(client, booking_id)
 
     subcommand.set_defaults(func=callback_function)
     subcommand.add_argument("booking_id", type=int)
@@ -232,6 +275,23 @@ def add_finish_command(subparsers: _SubParsersAction):
 
 def main_arg_parser(interactive_cli_parser):
     parser = FixedArgumentParser()
+    parser.add_argument(
+        "--server",
+        default=os.environ.get("BOOKING_SERVER_URL", DEFAULT_BASE_URL),
+        help="booking server URL, BOOKING_SERVER_URL by default",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10,
+        help="seconds to wait for a response from the booking server",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="attempts after the first one for requests safe to repeat",
+    )
     subparsers = parser.add_subparsers(required=True)
 
     add_book_command_with_waiting_option(interactive_cli_parser, subparsers)
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Container,
+    Coroutine,
+    TypeVar,
+)
+
+import aiohttp
+from booking_client.exceptions import BookingClientError
+from booking_common.models import (
+    BookingBatchRequest,
+    BookingBatchResponse,
+    BookingRequest,
+    BookingResponse,
+    BookingStatus,
+    ResourceInfo,
+    ResourceInventory,
+    ResourceInventoryChanges,
+)
+
+DEFAULT_BASE_URL = "http://localhost:8000"
+
+# Worth another attempt, the request most likely never got handled
+RETRIED_STATUSES = {
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+}
+
+T = TypeVar("T")
+
+
+def error_message(status: int, body: str):
+    # Errors come either as plain text or as FastAPI details with or
+    # without a message inside
+    try:
+        detail = json.loads(body)["detail"]
+    except (ValueError, KeyError, TypeError):
+        return body or HTTPStatus(status).phrase
+
+    if isinstance(detail, dict) and "message" in detail:
+        return str(detail["message"])
+    return detail if isinstance(detail, str) else json.dumps(detail)
+
+
+class AsyncBookingClient:
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: float = 10,
+        connect_timeout: float = 5,
+        retries: int = 3,
+        backoff: float = 0.2,
+        max_backoff: float = 5,
+        connections: int = 8,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connections = connections
+        self.session: None | aiohttp.ClientSession = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_: Any):
+        await self.close()
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connections, keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=self.timeout, connect=self.connect_timeout
+                ),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    def next_backoff(self, attempt: int):
+        # Full jitter, so that clients failing together don't retry together
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2**attempt)
+        )
+
+    async def _retrying(
+        self, attempt_once: Callable[[], Awaitable[T]], idempotent: bool
+    ) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await attempt_once()
+            except BookingClientError as error:
+                if (
+                    attempt >= self.retries
+                    or not idempotent
+                    or error.status not in RETRIED_STATUSES
+                ):
+                    raise
+            except aiohttp.ClientConnectorError as error:
+                # Nothing was sent, so any request can be tried again
+                if attempt >= self.retries:
+                    raise BookingClientError(
+                        f"Could not connect to booking server at"
+                        f" {self.base_url}: {error}"
+                    ) from error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if attempt >= self.retries or not idempotent:
+                    raise BookingClientError(
+                        f"Request to booking server failed: {error!r}"
+                    ) from error
+
+            await asyncio.sleep(self.next_backoff(attempt))
+            attempt += 1
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        idempotent: bool,
+        body: None | str = None,
+        params: None | dict[str, str] = None,
+        accepted: Container[int] = (),
+    ):
+        async def attempt_once():
+            async with self._session().request(
+                method,
+                f"{self.base_url}{path}",
+                data=body,
+                params=params,
+                headers=(
+                    {"Content-Type": "application/json"}
+                    if body is not None
+                    else None
+                ),
+            ) as response:
+                text = await response.text()
+                if (
+                    response.status >= HTTPStatus.BAD_REQUEST
+                    and response.status not in accepted
+                ):
+                    raise BookingClientError(
+                        error_message(response.status, text), response.status
+                    )
+                return text
+
+        return await self._retrying(attempt_once, idempotent)
+
+    async def add_resource(self, resource: ResourceInfo):
+        await self._request(
+            "POST", "/resource", False, resource.model_dump_json()
+        )
+
+    async def sync_resources(self, inventory: ResourceInventory):
+        # Setting the same inventory twice changes nothing the second time
+        return ResourceInventoryChanges.model_validate_json(
+            await self._request(
+                "PUT", "/resource/set", True, inventory.model_dump_json()
+            )
+        )
+
+    async def create_booking(self, booking: BookingRequest):
+        return BookingResponse.model_validate_json(
+            await self._request(
+                "POST", "/booking", False, booking.model_dump_json()
+            )
+        )
+
+    async def create_bookings(self, batch: BookingBatchRequest):
+        # Every booking of the batch failing still has the results
+        return BookingBatchResponse.model_validate_json(
+            await self._request(
+                "POST",
+                "/booking/batch",
+                False,
+                batch.model_dump_json(),
+                accepted=(HTTPStatus.BAD_REQUEST,),
+            )
+        )
+
+    async def get_booking(self, booking_id: int):
+        return BookingResponse.model_validate_json(
+            await self._request("GET", f"/booking/{booking_id}", True)
+        )
+
+    async def bookings(
+        self,
+        status: None | BookingStatus = None,
+        resource_type: None | str = None,
+        page_size: int = 100,
+    ) -> AsyncIterator[BookingResponse]:
+        params = {"limit": str(page_size)}
+        if status is not None:
+            params["status"] = status.value
+        if resource_type is not None:
+            params["type"] = resource_type
+
+        after: None | int = -1
+        while after is not None:
+            page = json.loads(
+                await self._request(
+                    "GET",
+                    "/booking/all",
+                    True,
+                    params={**params, "after": str(after)},
+                )
+            )
+            for booking in page["bookings"]:
+                yield BookingResponse.model_validate(booking)
+            after = page["next_cursor"]
+
+    async def finish_booking(self, booking_id: int):
+        return await self._request(
+            "POST", f"/booking/{booking_id}/finish", False
+        )
+
+    async def cancel_booking(self, booking_id: int):
+        return await self._request(
+            "POST", f"/booking/{booking_id}/cancel", False
+        )
+
+    @asynccontextmanager
+    async def _websocket(self, path: str):
+        # Waiting can take hours, so only the handshake has a timeout
+        url = f"{self.base_url.replace('http', 'ws', 1)}{path}"
+        async with self._session().ws_connect(
+            url,
+            timeout=aiohttp.ClientWSTimeout(ws_close=self.connect_timeout),
+            heartbeat=30,
+        ) as websocket:
+            yield websocket
+
+    async def wait_booking(self, booking_id: int) -> str:
+        # The server answers with the current state of the booking, so
+        # waiting again after losing the connection is safe
+        async def attempt_once():
+            async with self._websocket(
+                f"/booking/{booking_id}/wait"
+            ) as websocket:
+                message = await websocket.receive()
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    raise aiohttp.ServerDisconnectedError()
+                return json.loads(message.data)["message"]
+
+        return await self._retrying(attempt_once, True)
+
+
+class BookingClient:
+    # Runs the asynchronous client on a private event loop, which keeps
+    # the session and its pooled connections between the calls
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, **options: Any):
+        self.runner = asyncio.Runner()
+        self.client = AsyncBookingClient(base_url, **options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_: Any):
+        self.close()
+
+    def run(self, routine: Coroutine[Any, Any, T]) -> T:
+        return self.runner.run(routine)
+
+    def close(self):
+        self.run(self.client.close())
+        self.runner.close()
+
+    def add_resource(self, resource: ResourceInfo):
+        return self.run(self.client.add_resource(resource))
+
+    def sync_resources(self, inventory: ResourceInventory):
+        return self.run(self.client.sync_resources(inventory))
+
+    def create_booking(self, booking: BookingRequest):
+        return self.run(self.client.create_booking(booking))
+
+    def create_bookings(self, batch: BookingBatchRequest):
+        return self.run(self.client.create_bookings(batch))
+
+    def get_booking(self, booking_id: int):
+        return self.run(self.client.get_booking(booking_id))
+
+    def bookings(
+        self,
+        status: None | BookingStatus = None,
+        resource_type: None | str = None,
+        page_size: int = 100,
+    ):
+        async def collected():
+            return [
+                booking
+                async for booking in self.client.bookings(
+                    status, resource_type, page_size
+                )
+            ]
+
+        return self.run(collected())
+
+    def finish_booking(self, booking_id: int):
+        return self.run(self.client.finish_booking(booking_id))
+
+    def cancel_booking(self, booking_id: int):
+        return self.run(self.client.cancel_booking(booking_id))
+
+    def wait_booking(self, booking_id: int):
+        return self.run(self.client.wait_booking(booking_id))
@@ -0,0 +1,8 @@
+class BookingClientError(Exception):
+    message: str
+    # None when the server couldn't be reached
+    status: None | int
+
+    def __init__(self, message: str, status: None | int = None) -> None:
+        self.message = message
+        self.status = status
@@ -1,4 +1,8 @@
+from __future__ import annotations
+
 from argparse import _SubParsersAction
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 from booking_client.booking import (
     GREEN,
@@ -9,12 +13,23 @@ from booking_client.booking import (
     finish_booking,
 )
 from booking_client.custom_argparse import FixedArgumentParser
-from booking_client.resource import resource_add, resource_delete
+from booking_client.resource import (
+    resource_add,
+    resource_delete,
+    resource_sync,
+)
+
+if TYPE_CHECKING:
+    from booking_client.client import AsyncBookingClient
 
 
 def add_resource_add_command(subparsers: _SubParsersAction):
-    def callback_function(resource_type: str, resource_identifier: str):
-        resource_add(resource_type, resource_identifier)
+    async def callback_function(
+        client: AsyncBookingClient,
+        resource_type: str,
+        resource_identifier: str,
+    ):
+        await resource_add(client, resource_type, resource_identifier)
 
     subcommand: FixedArgumentParser = subparsers.add_parser(
         "add", exit_on_error=False
@@ -25,8 +40,10 @@ def add_resource_add_command(subparsers: _SubParsersAction):
 
 
 def add_resource_delete_command(subparsers: _SubParsersAction):
-    def callback_function(resource_identifier: str):
-        resource_delete(resource_identifier)
+    async def callback_function(
+        client: AsyncBookingClient, resource_identifier: str
+    ):
+        await resource_delete(client, resource_identifier)
 
     subcommand: FixedArgumentParser = subparsers.add_parser(
         "delete", exit_on_error=False
@@ -35,6 +52,19 @@ def add_resource_delete_command(subparsers: _SubParsersAction):
     subcommand.add_argument("resource_identifier")
 
 
+def add_resource_sync_command(subparsers: _SubParsersAction):
+    async def callback_function(
+        client: AsyncBookingClient, inventory_file: Path
+    ):
+        await resource_sync(client, inventory_file)
+
+    subcommand: FixedArgumentParser = subparsers.add_parser(
+        "sync", exit_on_error=False
+    )
+    subcommand.set_defaults(func=callback_function)
+    subcommand.add_argument("inventory_file", type=Path)
+
+
 def add_resource_commands(subparsers: _SubParsersAction):
     subcommand: FixedArgumentParser = subparsers.add_parser(
         "resource", exit_on_error=False
@@ -42,15 +72,20 @@ def add_resource_commands(subparsers: _SubParsersAction):
     subsubparsers = subcommand.add_subparsers(required=True)
     add_resource_add_command(subsubparsers)
     add_resource_delete_command(subsubparsers)
+    add_resource_sync_command(subsubparsers)
 
 
 def add_help_command(
     parser: FixedArgumentParser, subparsers: _SubParsersAction
 ):
+    async def callback_function(client: AsyncBookingClient):
+        del client
+        parser.print_help()
+
     subcommand: FixedArgumentParser = subparsers.add_parser(
         "help", exit_on_error=False
     )
-    subcommand.set_defaults(func=parser.print_help)
+    subcommand.set_defaults(func=callback_function)
 
 
 def add_finish_command(subparsers: _SubParsersAction):
@@ -58,15 +93,15 @@ def add_finish_command(subparsers: _SubParsersAction):
         "finish", exit_on_error=False
     )
 
-    def callback_function(booking_id: int):
-        finish_booking(booking_id)
+    async def callback_function(client: AsyncBookingClient, booking_id: int):
+        await finish_booking(client, booking_id)
 
     subcommand.set_defaults(func=callback_function)
     subcommand.add_argument("booking_id", type=int)
 
 
 def add_exit_command(subparsers: _SubParsersAction):
-    def callback_function(code: int):
+    async def callback_function(client: AsyncBookingClient, code: int):
         raise CliExit()
 
     subcommand: FixedArgumentParser = subparsers.add_parser(
@@ -77,8 +112,8 @@ def add_exit_command(subparsers: _SubParsersAction):
 
 
 def add_cancel_command(subparsers: _SubParsersAction):
-    def callback_function(booking_id: int):
-        cancel_booking(booking_id)
+    async def callback_function(client: AsyncBookingClient, booking_id: int):
+        await cancel_booking(client, booking_id)
 
     subcommand: FixedArgumentParser = subparsers.add_parser(
         "cancel", exit_on_error=False
@@ -88,10 +123,13 @@ def add_cancel_command(subparsers: _SubParsersAction):
 
 
 def add_book_command(subparsers: _SubParsersAction):
-    def callback_function(
-        resource_type: str, resource_identifier: None | str, workflow_id: int
+    async def callback_function(
+        client: AsyncBookingClient,
+        resource_type: str,
+        resource_identifier: None | str,
+        workflow_id: int,
     ):
-        book(resource_type, resource_identifier, workflow_id)
+        await book(client, resource_type, resource_identifier, workflow_id)
 
     subcommand: FixedArgumentParser = subparsers.add_parser(
         "book", exit_on_error=False
@@ -1,13 +1,44 @@
-import requests
+from __future__ import annotations
 
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-def resource_add(resource_type: str, resource_identifier: str):
-    requests.post(
-        "http://localhost:8000/resource",
-        json={"type": resource_type, "identifier": resource_identifier},
-        timeout=0.1,
+from booking_common.models import ResourceInfo, ResourceInventory
+from pydantic import ValidationError
+
+if TYPE_CHECKING:
+    from booking_client.client import AsyncBookingClient
+
+
+async def resource_add(
+    client: AsyncBookingClient, resource_type: str, resource_identifier: str
+):
+    await client.add_resource(
+        ResourceInfo(type=resource_type, identifier=resource_identifier)
     )
 
+    print(f"Added {resource_identifier}")
+
 
-def resource_delete(resource_identifier: str):
+async def resource_delete(
+    client: AsyncBookingClient, resource_identifier: str
+):
+    del client
     print(resource_identifier)
+
+
+async def resource_sync(client: AsyncBookingClient, inventory_file: Path):
+    try:
+        inventory = ResourceInventory.model_validate_json(
+            inventory_file.read_text()
+        )
+    except (OSError, ValidationError) as error:
+        print(f"Could not read {inventory_file}: {error}", file=sys.stderr)
+        sys.exit(1)
+
+    changes = await client.sync_resources(inventory)
+
+    print(f"Added: {', '.join(changes.added)}")
+    print(f"Removed: {', '.join(changes.removed)}")
+    print(f"Kept: {', '.join(changes.kept)}")
@@ -31,6 +31,9 @@ class BookingRequest(BaseModel):
     start_time: datetime
     end_time: datetime
     github: JobInfo | None = None
+    # Served before the other waiting bookings of the same repository or
+    # user when the server allocates by fair share
+    priority: int = Field(default=0, examples=[0])
 
 
 class BookingStatus(str, Enum):
@@ -45,6 +48,7 @@ class BookingInfo(BookingRequest):
     id: int
     booking_time: datetime
     status: BookingStatus
+    version: int = 0
 
 
 class ResourceInfo(BaseModel):
@@ -52,11 +56,66 @@ class ResourceInfo(BaseModel):
 
     type: str
     identifier: str
+    label: None | str = None
     # TODO: Allow adding arbitrary commands to be ran when resource is reserved or freed
 
 
+class ResourceInventory(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # Resources of the label that are not listed get removed
+    label: str = Field(examples=["runners_host_1"])
+    resources: list[ResourceInfo] = Field(max_length=1000)
+
+
+class ResourceInventoryChanges(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    added: list[str]
+    removed: list[str]
+    kept: list[str]
+
+
 class BookingResponse(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
     info: BookingInfo
     used_resource: ResourceInfo | None
+    reserved_resource: ResourceInfo | None = None
+
+
+class BookingBatchRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    bookings: list[BookingRequest] = Field(max_length=1000)
+    # Create none of the bookings if any of them is invalid
+    atomic: bool = False
+
+
+class BookingBatchResult(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    booking: None | BookingResponse = None
+    error: None | str = None
+
+
+class BookingBatchResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    results: list[BookingBatchResult]
+
+
+class BookingNotification(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    id: int
+    version: int
+    status: BookingStatus
+
+
+class BookingSubscription(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # Booking id to last seen version, -1 if none was seen
+    subscribe: dict[int, int] = Field(default={}, examples=[{12: -1}])
+    unsubscribe: list[int] = Field(default=[], examples=[[11]])
@@ -1,10 +1,29 @@
 import argparse
+import multiprocessing
+from datetime import timedelta
 from functools import partial
+from pathlib import Path
 from typing import cast
 
 import uvloop
+from booking_server.allocator import run_allocator
 from booking_server.api import router
-from booking_server.server import BookingApp, fire_and_forget, periodic_cleanup
+from booking_server.archive import BookingArchive
+from booking_server.broker import ALLOCATION_POLICIES, allocation_policy
+from booking_server.diagnostics import LoopMonitor
+from booking_server.github import GITHUB_API_URL, GitHubClient, GitHubSettings
+from booking_server.metrics import Metrics
+from booking_server.replica_api import run_read_worker
+from booking_server.server import (
+    BookingApp,
+    ServerState,
+    fire_and_forget,
+    periodic_cleanup,
+    restore_persisted_state,
+    run_booking_timers,
+    start_replica_publisher,
+)
+from booking_server.supervisor import DEFAULT_LIMITS, TaskKind, TaskSupervisor
 from hypercorn import Config
 from hypercorn.app_wrappers import ASGIWrapper
 from hypercorn.asyncio.run import worker_serve
@@ -19,22 +38,302 @@ parser.add_argument(
         ' "Actions" in your repository.'
     ),
 )
-github_token: str = parser.parse_args().github_token
+parser.add_argument(
+    "--github-api-url",
+    type=str,
+    default=GITHUB_API_URL,
+    help="GitHub REST API root, e.g. a local fake API for testing.",
+)
+parser.add_argument(
+    "--github-webhook-secret",
+    type=str,
+    default=None,
+    help=(
+        "Secret of the GitHub webhook delivering workflow_run and"
+        " workflow_job events to /github/webhook. Enables the endpoint."
+    ),
+)
+parser.add_argument(
+    "--github-poll-fallback",
+    type=float,
+    default=60,
+    help=(
+        "Seconds without webhook deliveries for a workflow run before it is"
+        " polled instead."
+    ),
+)
+parser.add_argument(
+    "--archive-after",
+    type=float,
+    default=3600,
+    help=(
+        "Seconds after which finished and cancelled bookings are moved to"
+        " the archive."
+    ),
+)
+parser.add_argument(
+    "--archive-size",
+    type=int,
+    default=10000,
+    help="Number of archived bookings kept in memory.",
+)
+parser.add_argument(
+    "--archive-file",
+    type=Path,
+    default=None,
+    help=(
+        "SQLite file where bookings evicted from the in-memory archive are"
+        " stored. Evicted bookings are dropped if not given."
+    ),
+)
+parser.add_argument(
+    "--state-dir",
+    type=Path,
+    default=None,
+    help=(
+        "Directory for the write-ahead log and snapshots of the server state."
+        " State is kept only in memory if not given."
+    ),
+)
+parser.add_argument(
+    "--log-flush-interval",
+    type=float,
+    default=0.05,
+    help="Seconds to batch write-ahead log records before writing them.",
+)
+parser.add_argument(
+    "--snapshot-interval",
+    type=float,
+    default=300,
+    help="Seconds between snapshots compacting the write-ahead log.",
+)
+parser.add_argument(
+    "--replica-file",
+    type=Path,
+    default=None,
+    help=(
+        "SQLite file where changes of the server state are published for"
+        " read workers."
+    ),
+)
+parser.add_argument(
+    "--read-workers",
+    type=int,
+    default=0,
+    help=(
+        "Number of processes serving bookings, resources, booking waits and"
+        " changes from the replica file. Bookings and resources are only"
+        " changed through the main server."
+    ),
+)
+parser.add_argument(
+    "--read-bind",
+    type=str,
+    default="127.0.0.1:8001",
+    help="Address the read workers listen on.",
+)
+parser.add_argument(
+    "--bind",
+    type=str,
+    default="127.0.0.1:8000",
+    help="Address the server listens on.",
+)
+parser.add_argument(
+    "--shard-index",
+    type=int,
+    default=0,
+    help="Index of this server among the shards behind a shard router.",
+)
+parser.add_argument(
+    "--shard-count",
+    type=int,
+    default=1,
+    help="Number of shards behind the shard router.",
+)
+parser.add_argument(
+    "--allocation-policy",
+    choices=ALLOCATION_POLICIES,
+    default="first-come",
+    help=(
+        "Order in which waiting bookings get freed resources. fair-share"
+        " shares resources between repositories, or booking names for"
+        " bookings without a workflow, by their weights. Reserved bookings"
+        " keep their slots outside of the shares."
+    ),
+)
+parser.add_argument(
+    "--tenant-weight",
+    type=str,
+    action="append",
+    default=[],
+    metavar="TENANT=WEIGHT",
+    help=(
+        "Weight of a repository (OWNER/REPO) or booking name under fair-share"
+        " allocation. Tenants not given have weight 1."
+    ),
+)
+parser.add_argument(
+    "--admin-token",
+    type=str,
+    default=None,
+    help=(
+        "Bearer token for the /debug endpoints listing event loop stalls and"
+        " taking CPU profiles. Enables the endpoints."
+    ),
+)
+parser.add_argument(
+    "--loop-lag-interval",
+    type=float,
+    default=0.05,
+    help="Seconds between samples of the event loop lag.",
+)
+parser.add_argument(
+    "--slow-callback-threshold",
+    type=float,
+    default=0.25,
+    help=(
+        "Seconds the event loop can be blocked before the stack of the"
+        " blocking callback is recorded."
+    ),
+)
+parser.add_argument(
+    "--github-concurrency",
+    type=int,
+    default=DEFAULT_LIMITS[TaskKind.GITHUB],
+    help=(
+        "Number of background tasks re-running GitHub jobs that run at once."
+        " The rest wait in a queue."
+    ),
+)
+parser.add_argument(
+    "--shutdown-timeout",
+    type=float,
+    default=10,
+    help=(
+        "Seconds to let accepted background work finish on shutdown before"
+        " it is cancelled."
+    ),
+)
+args = parser.parse_args()
+if args.github_concurrency < 1:
+    parser.error("--github-concurrency must be at least 1")
+if args.read_workers and args.replica_file is None:
+    parser.error("--read-workers requires --replica-file")
+if not 0 <= args.shard_index < args.shard_count:
+    parser.error("--shard-index must be between 0 and --shard-count - 1")
+
+tenant_weights: dict[str, float] = {}
+for tenant_weight in args.tenant_weight:
+    tenant, _, weight = tenant_weight.rpartition("=")
+    try:
+        tenant_weights[tenant] = float(weight)
+    except ValueError:
+        parser.error(f"Invalid tenant weight {tenant_weight}")
+    if not tenant or tenant_weights[tenant] <= 0:
+        parser.error(f"Invalid tenant weight {tenant_weight}")
+github_token: str = args.github_token
 
 
+metrics = Metrics()
 app = BookingApp(
-    github_token=github_token,
+    server_state=ServerState(
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        booking_id_counter=args.shard_index,
+        waiting_bookings=allocation_policy(
+            args.allocation_policy, tenant_weights
+        ),
+        metrics=metrics,
+    ),
+    github_client=GitHubClient(
+        github_token,
+        GitHubSettings(
+            base_url=args.github_api_url,
+            webhook_secret=args.github_webhook_secret,
+            webhook_timeout=args.github_poll_fallback,
+        ),
+        metrics=metrics,
+    ),
+    booking_archive=BookingArchive(
+        max_age=timedelta(seconds=args.archive_after),
+        capacity=args.archive_size,
+        spill_path=args.archive_file,
+    ),
+    loop_monitor=LoopMonitor(
+        metrics,
+        interval=args.loop_lag_interval,
+        threshold=args.slow_callback_threshold,
+    ),
+    admin_token=args.admin_token,
+    supervisor=TaskSupervisor(
+        metrics,
+        {TaskKind.GITHUB: args.github_concurrency},
+    ),
 )
 app.include_router(router)
+# Drained first so that the work finishing can still use the GitHub client
+# and gets flushed to the write-ahead log
+app.router.on_shutdown.append(
+    partial(app.supervisor.drain, args.shutdown_timeout)
+)
+app.router.on_shutdown.append(app.github_client.close)
+if args.state_dir is not None:
+    app.router.on_startup.append(
+        partial(
+            restore_persisted_state,
+            app,
+            args.state_dir,
+            args.log_flush_interval,
+            args.snapshot_interval,
+        )
+    )
+if args.replica_file is not None:
+    app.router.on_startup.append(
+        partial(
+            start_replica_publisher,
+            app,
+            args.replica_file,
+            args.state_dir is None,
+        )
+    )
+app.router.on_startup.append(
+    partial(
+        fire_and_forget,
+        app,
+        periodic_cleanup(
+            app.server_state, app.supervisor, app.booking_archive
+        ),
+    )
+)
+app.router.on_startup.append(
+    partial(fire_and_forget, app, run_booking_timers(app))
+)
 app.router.on_startup.append(
     partial(
         fire_and_forget,
         app,
-        periodic_cleanup(app.server_state, app.background_tasks),
+        run_allocator(app.server_state, app.supervisor, app.github_client),
     )
 )
+app.router.on_startup.append(
+    partial(fire_and_forget, app, app.loop_monitor.run())
+)
+
+if args.read_workers:
+    read_config = Config()
+    read_config.bind = [args.read_bind]
+    read_config.accesslog = "-"
+    read_sockets = read_config.create_sockets()
+    context = multiprocessing.get_context("spawn")
+    for _ in range(args.read_workers):
+        context.Process(
+            target=run_read_worker,
+            args=(args.replica_file, read_config, read_sockets),
+            daemon=True,
+        ).start()
 
 asgi_app = ASGIWrapper(cast(ASGIFramework, app))
 config = Config()
+config.bind = [args.bind]
 config.accesslog = "-"
 uvloop.run(worker_serve(asgi_app, config))
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+from itertools import islice
+from typing import TYPE_CHECKING, TypeVar
+
+from booking_server.booking import Booking
+from booking_server.broker import (
+    match_resources_and_bookings,
+    re_run_github_jobs,
+)
+from booking_server.github import GitHubClient
+from booking_server.resource import Resource
+from booking_server.supervisor import TaskSupervisor
+
+if TYPE_CHECKING:
+    from booking_server.server import ServerState
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+def take(pending: dict[K, V], count: None | int):
+    return [pending.pop(key) for key in list(islice(pending, count))]
+
+
+class Allocator:
+    # The only place where waiting bookings and free resources are matched.
+    # Events arriving while a round runs are coalesced into the next one.
+    def __init__(self) -> None:
+        self.new_bookings: dict[int, Booking] = {}
+        self.freed_resources: dict[str, Resource] = {}
+        self.has_events = asyncio.Event()
+
+    def booking_added(self, booking: Booking):
+        self.new_bookings[booking.info.id] = booking
+        self.has_events.set()
+
+    def bookings_added(self, bookings: list[Booking]):
+        for booking in bookings:
+            self.new_bookings[booking.info.id] = booking
+        self.has_events.set()
+
+    def resource_freed(self, resource: Resource):
+        self.freed_resources[resource.info.identifier] = resource
+        self.has_events.set()
+
+    def resources_freed(self, resources: list[Resource]):
+        for resource in resources:
+            self.freed_resources[resource.info.identifier] = resource
+        self.has_events.set()
+
+
+def allocation_round(
+    server_state: ServerState,
+    supervisor: TaskSupervisor,
+    github_client: GitHubClient,
+    batch_size: None | int = None,
+):
+    allocator = server_state.allocator
+    metrics = server_state.metrics
+
+    resources = take(allocator.freed_resources, batch_size)
+    bookings = take(allocator.new_bookings, batch_size)
+    if not resources and not bookings:
+        return []
+
+    assigned = match_resources_and_bookings(resources, bookings, server_state)
+    re_run_github_jobs(assigned, supervisor, github_client)
+
+    metrics.allocator_rounds.inc()
+    metrics.allocator_events.inc(amount=len(resources) + len(bookings))
+    return assigned
+
+
+async def run_allocator(
+    server_state: ServerState,
+    supervisor: TaskSupervisor,
+    github_client: GitHubClient,
+    batch_size: int = 1000,
+):
+    allocator = server_state.allocator
+
+    while True:
+        await allocator.has_events.wait()
+        allocator.has_events.clear()
+
+        allocation_round(server_state, supervisor, github_client, batch_size)
+
+        if allocator.freed_resources or allocator.new_bookings:
+            # Let requests through between batches of a burst
+            allocator.has_events.set()
+            await asyncio.sleep(0)
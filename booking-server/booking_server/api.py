@@ -1,41 +1,238 @@
 from __future__ import annotations
 
+import asyncio
+import hmac
+import json
+from asyncio import Queue
+from datetime import datetime
+from enum import Enum
+from functools import partial
 from http import HTTPStatus
+from typing import (
+    Annotated,
+    Awaitable,
+    Callable,
+    Iterable,
+    Sequence,
+    TypeVar,
+)
 
+from booking_common.models import (
+    BookingBatchRequest,
+    BookingBatchResponse,
+    BookingBatchResult,
+    BookingNotification,
+    BookingSubscription,
+    ResourceInfo,
+    ResourceInventory,
+    ResourceInventoryChanges,
+)
+from booking_server.allocator import allocation_round
 from booking_server.booking import (
     Booking,
     BookingError,
+    BookingFilter,
     BookingRequest,
     BookingResponse,
     BookingStatus,
+    TenantStats,
     add_new_booking,
-    dumpable_booking,
-    dumpable_bookings,
+    add_new_bookings,
+    booking_response,
+    cancel_booking,
+    cancel_bookings_of_run,
+    encoded_booking,
+    finish_booking,
+    query_bookings,
 )
-from booking_server.broker import (
-    try_assigning_new_resource,
-    try_assigning_to_booking,
+from booking_server.broker import planned_changes, sync_resources
+from booking_server.diagnostics import LoopStall
+from booking_server.exceptions import (
+    AlreadyExistingId,
+    ProfilerBusy,
+    ResourceError,
 )
-from booking_server.exceptions import AlreadyExistingId
+from booking_server.feed import ChangeFeed
+from booking_server.github import (
+    WorkflowJobEvent,
+    WorkflowRunEvent,
+    verify_webhook_signature,
+)
+from booking_server.metrics import CONTENT_TYPE, exposition, state_gauges
+from booking_server.notifications import NotificationHub, booking_notification
 from booking_server.resource import (
     DumpableResource,
     NewResource,
+    Resource,
+    ResourceBatchRequest,
+    ResourceBatchResponse,
+    ResourceBatchResult,
+    ResourceFilter,
     add_new_resource,
-    dumpable_resources,
+    add_new_resources,
+    encoded_resource,
+    query_resources,
+)
+from booking_server.server import (
+    AppRequest,
+    AppWebSocket,
+    BookingApp,
+    DumpableServerState,
+    ServerState,
+    dumpable_server_state,
+)
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
 )
-from booking_server.server import AppRequest, AppWebSocket, fire_and_forget
-from fastapi import APIRouter, HTTPException
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, Response
-from pydantic import BaseModel
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from pydantic import BaseModel, ValidationError
+from starlette.requests import Request
 
 router = APIRouter()
 
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+NotificationReader = Callable[[int], Awaitable[None | BookingNotification]]
+
+Cursor = TypeVar("Cursor", bound=None | int | str)
+# Items after the cursor with their own cursors, already encoded
+PageQuery = Callable[[Cursor, int], Sequence[tuple[Cursor, bytes]]]
+
 
 class Message(BaseModel):
     message: str
 
 
+class ChangeFeedFormat(str, Enum):
+    NDJSON = "ndjson"
+    SSE = "sse"
+
+
+class BookingPage(BaseModel):
+    bookings: list[BookingResponse]
+    next_cursor: None | int
+
+
+class ResourcePage(BaseModel):
+    resources: list[DumpableResource]
+    next_cursor: None | str
+
+
+def encoded_page(
+    key: str, items: Iterable[bytes], next_cursor: None | int | str
+):
+    # Joined from the cached item encodings instead of re-encoding every
+    # item through a page model
+    cursor = json.dumps(next_cursor).encode()
+    return b'{"%s":[%s],"next_cursor":%s}' % (
+        key.encode(),
+        b",".join(items),
+        cursor,
+    )
+
+
+async def streamed_pages(query: PageQuery[Cursor], after: Cursor, limit: int):
+    # Each page is queried separately so the state can change in between
+    while found := query(after, limit):
+        yield b"".join(item + b"\n" for _, item in found)
+        after = found[-1][0]
+
+
+def paged_response(
+    key: str,
+    query: PageQuery[Cursor],
+    after: Cursor,
+    limit: int,
+    stream: bool,
+):
+    if stream:
+        return StreamingResponse(
+            streamed_pages(query, after, limit),
+            media_type="application/x-ndjson",
+        )
+
+    return page_response(key, query(after, limit), limit)
+
+
+def page_response(
+    key: str, found: Sequence[tuple[None | int | str, bytes]], limit: int
+):
+    page = encoded_page(
+        key,
+        (item for _, item in found),
+        found[-1][0] if len(found) == limit else None,
+    )
+    return Response(page, media_type="application/json")
+
+
+def booking_filter_query(
+    status: None | BookingStatus = None,
+    resource_type: Annotated[None | str, Query(alias="type")] = None,
+    identifier: None | str = None,
+    repo_owner: None | str = None,
+    from_time: None | datetime = None,
+    until_time: None | datetime = None,
+):
+    # Also the read workers take their filters as these query parameters
+    return BookingFilter(
+        status=status,
+        type=resource_type,
+        identifier=identifier,
+        repo_owner=repo_owner,
+        from_time=from_time,
+        until_time=until_time,
+    )
+
+
+def resource_filter_query(
+    resource_type: Annotated[None | str, Query(alias="type")] = None,
+    identifier: None | str = None,
+    free: None | bool = None,
+):
+    return ResourceFilter(type=resource_type, identifier=identifier, free=free)
+
+
+def encoded_bookings(
+    booking_filter: BookingFilter,
+    server_state: ServerState,
+    after: int,
+    limit: int,
+):
+    return [
+        (booking.info.id, encoded_booking(booking))
+        for booking in query_bookings(
+            booking_filter, after, limit, server_state
+        )
+    ]
+
+
+def encoded_resources(
+    resource_filter: ResourceFilter,
+    server_state: ServerState,
+    after: None | str,
+    limit: int,
+):
+    return [
+        (resource.info.identifier, encoded_resource(resource))
+        for resource in query_resources(
+            resource_filter, after, limit, server_state
+        )
+    ]
+
+
 @router.post("/resource", status_code=HTTPStatus.CREATED)
 async def post_resource(new_resource: NewResource, request: AppRequest):
     app = request.app
@@ -48,16 +245,78 @@ async def post_resource(new_resource: NewResource, request: AppRequest):
             HTTPStatus.CONFLICT, exception.message
         ) from exception
 
-    fire_and_forget(
-        request.app,
-        try_assigning_to_booking(
-            resource, server_state.bookings, app.github_token
-        ),
-    )
+    server_state.allocator.resource_freed(resource)
 
     return Response(status_code=HTTPStatus.CREATED)
 
 
+@router.post(
+    "/resource/batch",
+    response_model=ResourceBatchResponse,
+    status_code=HTTPStatus.CREATED,
+    responses={HTTPStatus.CONFLICT: {"model": ResourceBatchResponse}},
+)
+async def post_resource_batch(
+    batch: ResourceBatchRequest, request: AppRequest
+):
+    app = request.app
+    server_state = app.server_state
+
+    added = add_new_resources(batch.resources, server_state)
+    created = [
+        resource for resource in added if isinstance(resource, Resource)
+    ]
+
+    server_state.allocator.resources_freed(created)
+
+    response = ResourceBatchResponse(
+        results=[
+            (
+                ResourceBatchResult(resource=resource.info)
+                if isinstance(resource, Resource)
+                else ResourceBatchResult(error=resource.message)
+            )
+            for resource in added
+        ]
+    )
+
+    return Response(
+        response.model_dump_json(),
+        HTTPStatus.CREATED if created or not added else HTTPStatus.CONFLICT,
+        media_type="application/json",
+    )
+
+
+@router.put(
+    "/resource/set",
+    response_model=ResourceInventoryChanges,
+    status_code=HTTPStatus.OK,
+    responses={HTTPStatus.CONFLICT: {"model": Message}},
+)
+async def put_resource_set(
+    inventory: ResourceInventory, request: AppRequest, dry_run: bool = False
+):
+    app = request.app
+    server_state = app.server_state
+
+    try:
+        if dry_run:
+            return planned_changes(inventory, server_state)
+        added, removed, kept = sync_resources(inventory, server_state)
+    except ResourceError as error:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT, detail={"message": error.message}
+        ) from error
+
+    server_state.allocator.resources_freed(added)
+
+    return ResourceInventoryChanges(
+        added=[resource.info.identifier for resource in added],
+        removed=[resource.info.identifier for resource in removed],
+        kept=[resource.info.identifier for resource in kept],
+    )
+
+
 @router.post(
     "/booking", response_model=BookingResponse, status_code=HTTPStatus.CREATED
 )
@@ -72,68 +331,141 @@ async def post_booking(new_booking: BookingRequest, request: AppRequest):
             status_code=HTTPStatus.BAD_REQUEST, detail=error.message
         ) from error
 
-    fire_and_forget(
-        request.app,
-        try_assigning_new_resource(
-            booking, server_state.resources, app.github_token
-        ),
-    )
+    server_state.allocator.booking_added(booking)
 
-    return JSONResponse(
-        jsonable_encoder(await dumpable_booking(booking)), HTTPStatus.CREATED
+    return Response(
+        encoded_booking(booking),
+        HTTPStatus.CREATED,
+        media_type="application/json",
     )
 
 
-@router.get(
-    "/booking/{booking_id}",
-    response_model=BookingResponse,
-    status_code=HTTPStatus.OK,
-    responses={HTTPStatus.NOT_FOUND: {"model": Message}},
+@router.post(
+    "/booking/batch",
+    response_model=BookingBatchResponse,
+    status_code=HTTPStatus.CREATED,
+    responses={HTTPStatus.BAD_REQUEST: {"model": BookingBatchResponse}},
 )
-async def get_booking_by_id(booking_id: int, request: AppRequest):
-    try:
-        booking = request.app.server_state.ids_to_bookings[booking_id]
-    except KeyError as error:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail={"message": f"Booking id {booking_id} doesn't exist."},
-        ) from error
+async def post_booking_batch(batch: BookingBatchRequest, request: AppRequest):
+    app = request.app
+    server_state = app.server_state
 
-    return JSONResponse(
-        content=jsonable_encoder(await dumpable_booking(booking))
+    added = add_new_bookings(batch.bookings, batch.atomic, server_state)
+    created = [booking for booking in added if isinstance(booking, Booking)]
+
+    # Matched before responding so that the results show which bookings
+    # are ON. Events still pending go in the same round to keep their order.
+    server_state.allocator.bookings_added(created)
+    allocation_round(server_state, app.supervisor, app.github_client)
+
+    response = BookingBatchResponse(
+        results=[
+            (
+                BookingBatchResult(error=booking.message)
+                if isinstance(booking, BookingError)
+                else BookingBatchResult(booking=booking_response(booking))
+            )
+            for booking in added
+        ]
+    )
+
+    return Response(
+        response.model_dump_json(),
+        HTTPStatus.CREATED if created or not added else HTTPStatus.BAD_REQUEST,
+        media_type="application/json",
     )
 
 
 @router.get(
     "/resource/all",
-    response_model=list[DumpableResource],
+    response_model=ResourcePage,
     status_code=HTTPStatus.OK,
 )
 async def get_all_resources(
     request: AppRequest,
+    resource_filter: Annotated[ResourceFilter, Depends(resource_filter_query)],
+    after: None | str = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE,
+    stream: bool = False,
 ):
-    resources = request.app.server_state.resources
+    return paged_response(
+        "resources",
+        partial(encoded_resources, resource_filter, request.app.server_state),
+        after,
+        limit,
+        stream,
+    )
+
+
+@router.get(
+    "/resource/free",
+    response_model=list[ResourceInfo],
+    status_code=HTTPStatus.OK,
+)
+async def get_free_resources(
+    request: AppRequest,
+    resource_type: Annotated[str, Query(alias="type")],
+    start_time: datetime,
+    end_time: datetime,
+):
+    server_state = request.app.server_state
+
+    free = server_state.calendar.free_resources(
+        server_state.types_to_resources.get(resource_type, []),
+        start_time,
+        end_time,
+    )
 
     return JSONResponse(
-        content=jsonable_encoder(await dumpable_resources(resources))
+        content=jsonable_encoder([resource.info for resource in free])
     )
 
 
 @router.get(
     "/booking/all",
-    response_model=list[Booking],
+    response_model=BookingPage,
     status_code=HTTPStatus.OK,
 )
 async def get_all_bookings(
     request: AppRequest,
+    booking_filter: Annotated[BookingFilter, Depends(booking_filter_query)],
+    after: int = -1,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE,
+    stream: bool = False,
 ):
-    bookings = request.app.server_state.bookings
-
-    return JSONResponse(
-        content=jsonable_encoder(await dumpable_bookings(bookings))
+    return paged_response(
+        "bookings",
+        partial(encoded_bookings, booking_filter, request.app.server_state),
+        after,
+        limit,
+        stream,
     )
 
 
+@router.get(
+    "/booking/{booking_id}",
+    response_model=BookingResponse,
+    status_code=HTTPStatus.OK,
+    responses={HTTPStatus.NOT_FOUND: {"model": Message}},
+)
+async def get_booking_by_id(booking_id: int, request: AppRequest):
+    app = request.app
+
+    try:
+        booking = app.server_state.ids_to_bookings[booking_id]
+    except KeyError as error:
+        archived = await app.booking_archive.get(booking_id)
+        if archived is not None:
+            return Response(content=archived, media_type="application/json")
+
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail={"message": f"Booking id {booking_id} doesn't exist."},
+        ) from error
+
+    return Response(encoded_booking(booking), media_type="application/json")
+
+
 @router.post("/booking/{booking_id}/finish", status_code=HTTPStatus.OK)
 async def post_finish_booking(booking_id: int, request: AppRequest):
     app = request.app
@@ -177,14 +509,9 @@ async def post_finish_booking(booking_id: int, request: AppRequest):
             "Booking didn't have resource even when it should have."
         )
 
-    freed_resource.used_by = None
-    booking.info.status = BookingStatus.FINISHED
+    finish_booking(booking, freed_resource, server_state)
 
-    bookings = server_state.bookings
-    fire_and_forget(
-        request.app,
-        try_assigning_to_booking(freed_resource, bookings, app.github_token),
-    )
+    server_state.allocator.resource_freed(freed_resource)
 
     return Response(content=f"Booking id {booking_id} finished.")
 
@@ -228,39 +555,384 @@ async def post_cancel_booking(booking_id: int, request: AppRequest):
             ),
         )
 
-    booking.info.status = BookingStatus.CANCELLED
+    cancel_booking(booking, server_state)
 
     return Response(content=f"Booking id {booking_id} cancelled.")
 
 
+async def current_notification(booking_id: int, app: BookingApp):
+    booking = app.server_state.ids_to_bookings.get(booking_id)
+    if booking is not None:
+        return booking_notification(booking)
+
+    archived = await app.booking_archive.get(booking_id)
+    if archived is None:
+        return None
+
+    info = BookingResponse.model_validate_json(archived).info
+    return BookingNotification(
+        id=info.id, version=info.version, status=info.status
+    )
+
+
+async def wait_for_booking(
+    booking_id: int,
+    websocket: WebSocket,
+    notifications: NotificationHub,
+    read_notification: NotificationReader,
+):
+    await websocket.accept()
+
+    queue: Queue[BookingNotification] = Queue()
+    notifications.subscribe(booking_id, queue)
+
+    try:
+        current = await read_notification(booking_id)
+        if current is None:
+            await websocket.send_json({"message": "No such booking id"})
+            return
+
+        if current.status == BookingStatus.FINISHED:
+            return await websocket.send_json(
+                {"message": "Booking was already finished"}
+            )
+
+        if current.status == BookingStatus.CANCELLED:
+            return await websocket.send_json(
+                {"message": "Booking was already cancelled"}
+            )
+
+        while current.status == BookingStatus.WAITING:
+            # Read workers can be notified of versions already read
+            notification = await queue.get()
+            if notification.version > current.version:
+                current = notification
+
+        if current.status == BookingStatus.CANCELLED:
+            return await websocket.send_json(
+                {"message": "Booking was cancelled"}
+            )
+
+        await websocket.send_json({"message": "Resource is yours"})
+    finally:
+        notifications.unsubscribe(booking_id, queue)
+
+
 @router.websocket("/booking/{booking_id}/wait")
 async def websocket_wait_booking(booking_id: int, websocket: AppWebSocket):
-    server_state = websocket.app.server_state
+    app = websocket.app
+    await wait_for_booking(
+        booking_id,
+        websocket,
+        app.server_state.notifications,
+        partial(current_notification, app=app),
+    )
+
+
+async def forward_notifications(
+    websocket: WebSocket,
+    notifications: NotificationHub,
+    read_notification: NotificationReader,
+):
     await websocket.accept()
 
+    queue: Queue[BookingNotification] = Queue()
+    subscribed: set[int] = set()
+    sent_versions: dict[int, int] = {}
+
+    async def receive_subscriptions():
+        while True:
+            try:
+                subscription = BookingSubscription.model_validate_json(
+                    await websocket.receive_text()
+                )
+            except ValidationError as error:
+                # The subscriptions so far stay, only this message is dropped
+                await websocket.send_json(
+                    {"message": f"Invalid subscription: {error}"}
+                )
+                continue
+
+            for booking_id in subscription.unsubscribe:
+                notifications.unsubscribe(booking_id, queue)
+                subscribed.discard(booking_id)
+
+            for booking_id, last_seen in subscription.subscribe.items():
+                # Subscribe before reading the current version so that no
+                # transition can fall in between
+                notifications.subscribe(booking_id, queue)
+                subscribed.add(booking_id)
+                sent_versions[booking_id] = last_seen
+                current = await read_notification(booking_id)
+
+                if current is None:
+                    notifications.unsubscribe(booking_id, queue)
+                    subscribed.discard(booking_id)
+                    await websocket.send_json(
+                        {"id": booking_id, "message": "No such booking id"}
+                    )
+                elif current.version > last_seen:
+                    queue.put_nowait(current)
+
+    async def send_notifications():
+        while True:
+            notification = await queue.get()
+            if notification.version <= sent_versions.get(notification.id, -1):
+                continue
+            sent_versions[notification.id] = notification.version
+            await websocket.send_text(notification.model_dump_json())
+
     try:
-        booking = server_state.ids_to_bookings[booking_id]
-    except KeyError:
-        await websocket.send_json({"message": "No such booking id"})
-        return
+        async with asyncio.TaskGroup() as group:
+            group.create_task(receive_subscriptions())
+            group.create_task(send_notifications())
+    except* WebSocketDisconnect:
+        pass
+    finally:
+        for booking_id in subscribed:
+            notifications.unsubscribe(booking_id, queue)
+
+
+@router.websocket("/booking/subscribe")
+async def websocket_subscribe_bookings(websocket: AppWebSocket):
+    app = websocket.app
+    await forward_notifications(
+        websocket,
+        app.server_state.notifications,
+        partial(current_notification, app=app),
+    )
 
-    if booking.info.status == BookingStatus.FINISHED:
-        return await websocket.send_json(
-            {"message": "Booking was already finished"}
+
+@router.post("/github/webhook", status_code=HTTPStatus.NO_CONTENT)
+async def post_github_webhook(request: AppRequest):
+    app = request.app
+    github_client = app.github_client
+
+    webhook_secret = github_client.settings.webhook_secret
+    if webhook_secret is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail={"message": "Webhooks are not enabled."},
         )
 
-    if booking.info.status == BookingStatus.CANCELLED:
-        return await websocket.send_json(
-            {"message": "Booking was already cancelled"}
+    body = await request.body()
+    if not verify_webhook_signature(
+        webhook_secret,
+        body,
+        request.headers.get("X-Hub-Signature-256"),
+    ):
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail={"message": "Invalid webhook signature."},
         )
 
-    if booking.info.status == BookingStatus.WAITING:
-        await booking.event.wait()
+    event = request.headers.get("X-GitHub-Event")
 
-    if booking.info.status == BookingStatus.CANCELLED:
-        return await websocket.send_json({"message": "Booking was cancelled"})
+    # Signed by GitHub but still not the payload this server expects, e.g.
+    # after GitHub changes it, is the sender's error and not the server's
+    try:
+        job_event = (
+            WorkflowJobEvent.model_validate_json(body)
+            if event == "workflow_job"
+            else None
+        )
+        run_event = (
+            WorkflowRunEvent.model_validate_json(body)
+            if event == "workflow_run"
+            else None
+        )
+    except ValidationError as error:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail={"message": f"Unexpected {event} webhook payload: {error}"},
+        ) from error
+
+    if job_event is not None:
+        github_client.run_webhook_delivered(job_event.workflow_job.run_id)
+
+    elif run_event is not None:
+        run = run_event.workflow_run
+        github_client.run_webhook_delivered(run.id)
+
+        if run_event.action != "completed":
+            github_client.run_restarted(run.id)
+        else:
+            github_client.run_completed(run.id, run.model_dump())
+            if run.conclusion == "cancelled":
+                cancel_bookings_of_run(run.id, app.server_state)
+
+    return Response(status_code=HTTPStatus.NO_CONTENT)
+
+
+def changes_response(
+    feed: ChangeFeed,
+    request: Request,
+    since: None | int,
+    stream: ChangeFeedFormat,
+):
+    last_event_id = request.headers.get("Last-Event-ID")
+    if since is None and last_event_id is not None:
+        try:
+            since = int(last_event_id)
+        except ValueError as error:
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail={
+                    "message": f"Invalid Last-Event-ID {last_event_id!r}."
+                },
+            ) from error
+    if since is None:
+        since = feed.sequence
+
+    if since + 1 < feed.oldest_available():
+        raise HTTPException(
+            status_code=HTTPStatus.GONE,
+            detail={
+                "message": (
+                    f"Changes after {since} are no longer available, oldest"
+                    f" is {feed.oldest_available()}."
+                )
+            },
+        )
+
+    if stream == ChangeFeedFormat.SSE:
+        server_sent_events = (
+            f"id: {sequence}\ndata: {event}\n\n"
+            async for sequence, event in feed.events(since)
+        )
+        return StreamingResponse(
+            server_sent_events, media_type="text/event-stream"
+        )
+
+    lines = (f"{event}\n" async for _, event in feed.events(since))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
-    await websocket.send_json({"message": "Resource is yours"})
+
+@router.get(
+    "/changes",
+    status_code=HTTPStatus.OK,
+    responses={
+        HTTPStatus.BAD_REQUEST: {"model": Message},
+        HTTPStatus.GONE: {"model": Message},
+    },
+)
+async def get_changes(
+    request: AppRequest,
+    since: None | int = None,
+    stream: ChangeFeedFormat = ChangeFeedFormat.NDJSON,
+):
+    return changes_response(
+        request.app.server_state.feed, request, since, stream
+    )
+
+
+@router.get(
+    "/tenants",
+    response_model=list[TenantStats],
+    status_code=HTTPStatus.OK,
+    responses={HTTPStatus.CONFLICT: {"model": Message}},
+)
+async def get_tenants(request: AppRequest):
+    stats = request.app.server_state.waiting_bookings.tenant_stats()
+    if stats is None:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail={"message": "Fair share policy is not enabled."},
+        )
+    return stats
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    status_code=HTTPStatus.OK,
+)
+async def get_metrics(request: AppRequest):
+    server_state = request.app.server_state
+
+    return PlainTextResponse(
+        exposition(
+            [*server_state.metrics.registered(), *state_gauges(server_state)]
+        ),
+        media_type=CONTENT_TYPE,
+    )
+
+
+def check_admin_token(request: AppRequest):
+    admin_token = request.app.admin_token
+
+    if admin_token is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail={"message": "Admin endpoints are not enabled."},
+        )
+
+    if not hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(),
+        f"Bearer {admin_token}".encode(),
+    ):
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail={"message": "Invalid admin token."},
+        )
+
+
+@router.get(
+    "/debug/stalls",
+    response_model=list[LoopStall],
+    status_code=HTTPStatus.OK,
+    responses={
+        HTTPStatus.NOT_FOUND: {"model": Message},
+        HTTPStatus.UNAUTHORIZED: {"model": Message},
+    },
+)
+async def get_loop_stalls(request: AppRequest):
+    check_admin_token(request)
+    return list(request.app.loop_monitor.stalls)
+
+
+@router.get(
+    "/debug/profile",
+    status_code=HTTPStatus.OK,
+    responses={
+        HTTPStatus.NOT_FOUND: {"model": Message},
+        HTTPStatus.UNAUTHORIZED: {"model": Message},
+        HTTPStatus.CONFLICT: {"model": Message},
+    },
+)
+async def get_profile(
+    request: AppRequest,
+    seconds: Annotated[float, Query(gt=0, le=300)] = 10,
+):
+    check_admin_token(request)
+
+    try:
+        profile = await request.app.loop_monitor.profile(seconds)
+    except ProfilerBusy as error:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail={"message": error.message},
+        ) from error
+
+    filename = f"booking-server-{datetime.now():%Y%m%dT%H%M%S}.prof"
+    return Response(
+        profile,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get(
+    "/state",
+    response_model=DumpableServerState,
+    status_code=HTTPStatus.OK,
+)
+async def get_server_state(request: AppRequest):
+    server_state = request.app.server_state
+
+    return JSONResponse(
+        content=jsonable_encoder(await dumpable_server_state(server_state))
+    )
 
 
 # TODO: Add /booking/extend
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from booking_server.booking import Booking, encoded_booking
+
+if TYPE_CHECKING:
+    from booking_server.server import ServerState
+
+
+class BookingArchive:
+    def __init__(
+        self,
+        max_age: timedelta,
+        capacity: int,
+        spill_path: None | Path = None,
+    ) -> None:
+        self.max_age = max_age
+        self.capacity = capacity
+        self.recent: OrderedDict[int, bytes] = OrderedDict()
+        self.spill: None | sqlite3.Connection = None
+        self.spill_lock = Lock()
+
+        if spill_path is not None:
+            self.spill = sqlite3.connect(spill_path, check_same_thread=False)
+            self.spill.execute(
+                "CREATE TABLE IF NOT EXISTS archived_bookings"
+                " (id INTEGER PRIMARY KEY, booking BLOB NOT NULL)"
+            )
+            self.spill.commit()
+
+    def _write_spill(self, rows: list[tuple[int, bytes]]):
+        if self.spill is None:
+            return
+
+        with self.spill_lock:
+            self.spill.executemany(
+                "INSERT OR REPLACE INTO archived_bookings VALUES (?, ?)", rows
+            )
+            self.spill.commit()
+
+    def _read_spill(self, booking_id: int):
+        if self.spill is None:
+            return None
+
+        with self.spill_lock:
+            row = self.spill.execute(
+                "SELECT booking FROM archived_bookings WHERE id = ?",
+                (booking_id,),
+            ).fetchone()
+
+        return None if row is None else bytes(row[0])
+
+    async def add(self, bookings: list[Booking]):
+        for booking in bookings:
+            self.recent[booking.info.id] = encoded_booking(booking)
+
+        evicted: list[tuple[int, bytes]] = []
+        while len(self.recent) > self.capacity:
+            evicted.append(self.recent.popitem(last=False))
+
+        if evicted and self.spill is not None:
+            await asyncio.to_thread(self._write_spill, evicted)
+
+    async def get(self, booking_id: int):
+        try:
+            return self.recent[booking_id]
+        except KeyError:
+            pass
+
+        if self.spill is None:
+            return None
+
+        return await asyncio.to_thread(self._read_spill, booking_id)
+
+
+async def archive_closed_bookings(
+    server_state: ServerState, archive: BookingArchive
+):
+    cutoff = datetime.now(timezone.utc) - archive.max_age
+    closed_bookings = server_state.closed_bookings
+
+    expired: list[Booking] = []
+    while closed_bookings and closed_bookings[0][0] < cutoff:
+        _, booking = closed_bookings.popleft()
+        del server_state.ids_to_bookings[booking.info.id]
+        server_state.booking_indexes.remove(booking)
+        server_state.journal.booking_archived(booking)
+        expired.append(booking)
+
+    await archive.add(expired)
+    if expired and server_state.replica is not None:
+        await asyncio.to_thread(
+            server_state.replica.archive_bookings,
+            [booking.info.id for booking in expired],
+        )
+
+    return len(expired)
@@ -1,29 +1,38 @@
 from __future__ import annotations
 
-from asyncio import Event
-from datetime import datetime, timezone
-from typing import TYPE_CHECKING
+import heapq
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator
 
 from booking_common.models import (
     BookingInfo,
     BookingRequest,
     BookingResponse,
     BookingStatus,
+    RequestedResource,
 )
 from booking_server.exceptions import BookingError
-from booking_server.resource import Resource
-from pydantic import BaseModel, ConfigDict
+from booking_server.resource import Resource, release_resource
+from booking_server.scheduler import TimerKind
+from pydantic import BaseModel, ConfigDict, Field
 
 if TYPE_CHECKING:
     from booking_server.server import ServerState
 
+# Clients fill in the start time from their own clocks, so bookings starting
+# about now queue like the ones starting now instead of reserving a slot
+RESERVATION_GRACE = timedelta(minutes=1)
+
 
 class Booking(BaseModel):
     model_config = ConfigDict(extra="forbid", arbitrary_types_allowed=True)
 
     info: BookingInfo
     used_resource: None | Resource = None
-    event: Event = Event()
+    reserved_resource: None | Resource = None
+    encoded: None | bytes = Field(default=None, exclude=True, repr=False)
     # Add optional booking time
     # Add privileged client compared to workflow
     # Add callback address to trigger workflows later
@@ -32,17 +41,301 @@ class Booking(BaseModel):
 Resource.model_rebuild()
 
 
-async def dumpable_booking(
-    booking: Booking,
+class WaitingBookings:
+    def __init__(self) -> None:
+        self.types_to_bookings: dict[str, OrderedDict[int, Booking]] = {}
+        self.identifiers_to_bookings: dict[
+            tuple[str, str], OrderedDict[int, Booking]
+        ] = {}
+        self.runs_to_bookings: dict[int, dict[int, Booking]] = {}
+        # Waiting bookings per requested type, kept for metrics
+        self.depths: dict[str, int] = {}
+
+    def _queues_and_key(
+        self, booking: Booking
+    ) -> tuple[dict, str | tuple[str, str]]:
+        requested = booking.info.resource
+        if requested.identifier is None:
+            return self.types_to_bookings, requested.type
+        return self.identifiers_to_bookings, (
+            requested.type,
+            requested.identifier,
+        )
+
+    def _waiting_changed(self, booking: Booking, change: int):
+        resource_type = booking.info.resource.type
+        self.depths[resource_type] = self.depths.get(resource_type, 0) + change
+
+    def _add_to_run(self, booking: Booking):
+        if booking.info.github is not None:
+            self.runs_to_bookings.setdefault(booking.info.github.run_id, {})[
+                booking.info.id
+            ] = booking
+
+    def _remove_from_run(self, booking: Booking):
+        if booking.info.github is not None:
+            run_id = booking.info.github.run_id
+            of_run = self.runs_to_bookings.get(run_id)
+            if of_run is not None:
+                of_run.pop(booking.info.id, None)
+                if not of_run:
+                    del self.runs_to_bookings[run_id]
+
+    def add(self, booking: Booking):
+        queues, key = self._queues_and_key(booking)
+        queues.setdefault(key, OrderedDict())[booking.info.id] = booking
+        self._waiting_changed(booking, 1)
+        self._add_to_run(booking)
+
+    def remove(self, booking: Booking):
+        self._remove_from_run(booking)
+
+        queues, key = self._queues_and_key(booking)
+        queue = queues.get(key)
+        if queue is None:
+            return
+
+        if queue.pop(booking.info.id, None) is not None:
+            self._waiting_changed(booking, -1)
+        if not queue:
+            del queues[key]
+
+    def reserved(self, booking: Booking):
+        # Not waiting in the queues but still cancelled with their run
+        self._add_to_run(booking)
+
+    def of_run(self, run_id: int):
+        return list(self.runs_to_bookings.get(run_id, {}).values())
+
+    def assigned(self, booking: Booking):
+        self.remove(booking)
+
+    def tenant_stats(self) -> None | list[TenantStats]:
+        # Bookings are served in order without sharing between tenants
+        return None
+
+    def candidates(
+        self, resource_type: str, identifiers: Iterable[str]
+    ) -> Iterator[Booking]:
+        # Waiting bookings that could use a resource of the type or one of
+        # the identifiers, in the order they would be served
+        queues: list[OrderedDict[int, Booking]] = [
+            self.types_to_bookings.get(resource_type, OrderedDict())
+        ]
+        queues += [
+            queue
+            for identifier in identifiers
+            if (
+                queue := self.identifiers_to_bookings.get(
+                    (resource_type, identifier)
+                )
+            )
+            is not None
+        ]
+        return heapq.merge(
+            *(queue.values() for queue in queues),
+            key=lambda booking: booking.info.id,
+        )
+
+
+class TenantStats(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    tenant: str
+    weight: float
+    waiting: int
+    oldest_waiting_seconds: None | float
+    assigned: int
+    mean_wait_seconds: None | float
+    virtual_time: float
+
+
+class BookingFilter(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    status: None | BookingStatus = None
+    type: None | str = None
+    identifier: None | str = None
+    repo_owner: None | str = None
+    from_time: None | datetime = None
+    until_time: None | datetime = None
+
+    def matches(self, booking: Booking):
+        info = booking.info
+        if self.status is not None and info.status != self.status:
+            return False
+        if self.type is not None and info.resource.type != self.type:
+            return False
+        if self.identifier is not None and self.identifier not in (
+            info.resource.identifier,
+            booking.used_resource and booking.used_resource.info.identifier,
+        ):
+            return False
+        if self.repo_owner is not None and (
+            info.github is None or info.github.repo_owner != self.repo_owner
+        ):
+            return False
+        if self.from_time is not None and info.end_time <= self.from_time:
+            return False
+        if self.until_time is not None and info.start_time >= self.until_time:
+            return False
+        return True
+
+
+class BookingIndexes:
+    def __init__(self) -> None:
+        self.statuses_to_bookings: dict[BookingStatus, dict[int, Booking]] = {
+            status: {} for status in BookingStatus
+        }
+        self.types_to_bookings: dict[str, dict[int, Booking]] = {}
+        self.identifiers_to_bookings: dict[str, dict[int, Booking]] = {}
+        self.owners_to_bookings: dict[str, dict[int, Booking]] = {}
+
+    def _identifiers(self, booking: Booking):
+        requested = booking.info.resource.identifier
+        used = booking.used_resource
+        if used is None or used.info.identifier == requested:
+            return () if requested is None else (requested,)
+        if requested is None:
+            return (used.info.identifier,)
+        return (requested, used.info.identifier)
+
+    def add(self, booking: Booking):
+        info = booking.info
+        self.statuses_to_bookings[info.status][info.id] = booking
+        self.types_to_bookings.setdefault(info.resource.type, {})[
+            info.id
+        ] = booking
+        for identifier in self._identifiers(booking):
+            self.identifiers_to_bookings.setdefault(identifier, {})[
+                info.id
+            ] = booking
+        if info.github is not None:
+            self.owners_to_bookings.setdefault(info.github.repo_owner, {})[
+                info.id
+            ] = booking
+
+    def remove(self, booking: Booking):
+        info = booking.info
+        self.statuses_to_bookings[info.status].pop(info.id, None)
+        keys: list[tuple[dict[str, dict[int, Booking]], str]] = [
+            (self.types_to_bookings, info.resource.type)
+        ]
+        keys += [
+            (self.identifiers_to_bookings, identifier)
+            for identifier in self._identifiers(booking)
+        ]
+        if info.github is not None:
+            keys.append((self.owners_to_bookings, info.github.repo_owner))
+
+        for index, key in keys:
+            indexed = index.get(key)
+            if indexed is None:
+                continue
+            indexed.pop(info.id, None)
+            if not indexed:
+                del index[key]
+
+    def status_changed(self, booking: Booking, previous: BookingStatus):
+        self.statuses_to_bookings[previous].pop(booking.info.id, None)
+        self.statuses_to_bookings[booking.info.status][
+            booking.info.id
+        ] = booking
+        if booking.used_resource is not None:
+            self.identifiers_to_bookings.setdefault(
+                booking.used_resource.info.identifier, {}
+            )[booking.info.id] = booking
+
+    def candidates(self, booking_filter: BookingFilter):
+        # Smallest index that every match must be in, None if no index
+        # applies to the filter
+        indexed: list[dict[int, Booking]] = []
+        if booking_filter.status is not None:
+            indexed.append(self.statuses_to_bookings[booking_filter.status])
+        for index, key in (
+            (self.types_to_bookings, booking_filter.type),
+            (self.identifiers_to_bookings, booking_filter.identifier),
+            (self.owners_to_bookings, booking_filter.repo_owner),
+        ):
+            if key is not None:
+                indexed.append(index.get(key, {}))
+
+        return min(indexed, key=len, default=None)
+
+
+def shard_booking_id(at_least: int, server_state: ServerState):
+    # Smallest booking id of this shard that is not below the given one
+    return (
+        at_least
+        + (server_state.shard_index - at_least) % server_state.shard_count
+    )
+
+
+def query_bookings(
+    booking_filter: BookingFilter,
+    after: int,
+    limit: int,
+    server_state: ServerState,
 ):
+    candidates = server_state.booking_indexes.candidates(booking_filter)
+
+    if candidates is None:
+        # Booking ids are handed out in order and only the oldest ones get
+        # archived, so walking ids from the cursor visits bookings in order
+        ids_to_bookings = server_state.ids_to_bookings
+        first_id = next(iter(ids_to_bookings), server_state.booking_id_counter)
+        in_order: Iterable[Booking] = (
+            booking
+            for booking_id in range(
+                shard_booking_id(max(after + 1, first_id), server_state),
+                server_state.booking_id_counter,
+                server_state.shard_count,
+            )
+            if (booking := ids_to_bookings.get(booking_id)) is not None
+        )
+        return list(islice(filter(booking_filter.matches, in_order), limit))
+
+    return heapq.nsmallest(
+        limit,
+        (
+            booking
+            for booking_id, booking in candidates.items()
+            if booking_id > after and booking_filter.matches(booking)
+        ),
+        key=lambda booking: booking.info.id,
+    )
+
+
+def booking_response(booking: Booking):
     used_resource = (
         booking.used_resource.info if booking.used_resource else None
     )
-    return BookingResponse(info=booking.info, used_resource=used_resource)
+    reserved_resource = (
+        booking.reserved_resource.info if booking.reserved_resource else None
+    )
+    return BookingResponse(
+        info=booking.info,
+        used_resource=used_resource,
+        reserved_resource=reserved_resource,
+    )
+
+
+async def dumpable_booking(
+    booking: Booking,
+):
+    return booking_response(booking)
+
+
+def encoded_booking(booking: Booking):
+    # Polled far more often than it changes, so the response is encoded
+    # once per change and reused
+    if booking.encoded is None:
+        booking.encoded = booking_response(booking).model_dump_json().encode()
+    return booking.encoded
 
 
 async def dumpable_bookings(
-    bookings: list[Booking],
+    bookings: Iterable[Booking],
 ):
     return [await dumpable_booking(booking) for booking in bookings]
 
@@ -54,46 +347,216 @@ async def dumpable_ids_to_bookings(ids_to_bookings: dict[int, Booking]):
     }
 
 
-async def add_new_booking(
-    new_booking: BookingRequest, server_state: ServerState
+def find_reservable_resource(
+    requested: RequestedResource,
+    start_time: datetime,
+    end_time: datetime,
+    server_state: ServerState,
+):
+    if requested.identifier is None:
+        candidates = server_state.types_to_resources.get(requested.type, [])
+    else:
+        resource = server_state.ids_to_resources.get(requested.identifier)
+        candidates = (
+            []
+            if resource is None or resource.info.type != requested.type
+            else [resource]
+        )
+
+    return next(
+        (
+            resource
+            for resource in candidates
+            if server_state.calendar.is_free(resource, start_time, end_time)
+        ),
+        None,
+    )
+
+
+def check_new_booking(
+    new_booking: BookingRequest, now: datetime, server_state: ServerState
 ):
     # TODO: Error if there is no resource for the booking
-    if new_booking.end_time < datetime.now(timezone.utc):
+    if new_booking.end_time < now:
         raise BookingError(
             "Could not add new booking. End date is in the past."
         )
 
+    if new_booking.end_time <= new_booking.start_time:
+        raise BookingError(
+            "Could not add new booking. End date is not after start date."
+        )
+
+    # Bookings starting later reserve a resource for their time slot right
+    # away, others queue for the next free resource
+    reserved_resource = None
+    if new_booking.start_time > now + RESERVATION_GRACE:
+        reserved_resource = find_reservable_resource(
+            new_booking.resource,
+            new_booking.start_time,
+            new_booking.end_time,
+            server_state,
+        )
+        if reserved_resource is None:
+            raise BookingError(
+                "Could not add new booking. No requested resource is free"
+                f" between {new_booking.start_time} and"
+                f" {new_booking.end_time}."
+            )
+
+    return reserved_resource
+
+
+def create_booking(
+    new_booking: BookingRequest,
+    reserved_resource: None | Resource,
+    now: datetime,
+    server_state: ServerState,
+):
     booking_id = server_state.booking_id_counter
-    server_state.booking_id_counter += 1
+    server_state.booking_id_counter += server_state.shard_count
 
     booking = Booking(
         info=BookingInfo(
             status=BookingStatus.WAITING,
             id=booking_id,
             **new_booking.model_dump(),
-            booking_time=datetime.now(timezone.utc),
-        )
+            booking_time=now,
+        ),
+        reserved_resource=reserved_resource,
     )
 
-    server_state.bookings.append(booking)
     server_state.ids_to_bookings.update({booking_id: booking})
+    server_state.booking_indexes.add(booking)
+    if reserved_resource is None:
+        server_state.waiting_bookings.add(booking)
+    else:
+        server_state.calendar.add(reserved_resource, booking)
+        server_state.waiting_bookings.reserved(booking)
+        server_state.timers.add(
+            booking.info.start_time, TimerKind.ACTIVATE, booking_id
+        )
+    server_state.timers.add(
+        booking.info.end_time, TimerKind.EXPIRE, booking_id
+    )
+    server_state.changes.booking_changed(booking)
+    server_state.feed.booking_changed(booking)
+    server_state.journal.booking_added(booking)
+    if reserved_resource is not None:
+        server_state.journal.booking_reserved(booking, reserved_resource)
 
     return booking
 
 
-def find_waiting_booking(resource: Resource, bookings: list[Booking]):
-    for booking in bookings:
-        if booking.info.status != BookingStatus.WAITING:
-            continue
+async def add_new_booking(
+    new_booking: BookingRequest, server_state: ServerState
+):
+    now = datetime.now(timezone.utc)
+    reserved_resource = check_new_booking(new_booking, now, server_state)
+    return create_booking(new_booking, reserved_resource, now, server_state)
+
 
-        requested_resource = booking.info.resource
-        if requested_resource.type != resource.info.type:
-            continue
-        if (
-            requested_resource.identifier != resource.info.identifier
-            and requested_resource.identifier is not None
-        ):
-            continue
+def add_new_bookings(
+    new_bookings: list[BookingRequest], atomic: bool, server_state: ServerState
+):
+    now = datetime.now(timezone.utc)
+    calendar = server_state.calendar
+
+    # Every booking is checked before any is created. Reserved slots are
+    # held in the calendar meanwhile, so that bookings of the same batch
+    # cannot reserve the same slot.
+    checked: list[None | Resource | BookingError] = []
+    held: list[tuple[Resource, datetime, int]] = []
+    try:
+        for index, new_booking in enumerate(new_bookings):
+            try:
+                reserved_resource = check_new_booking(
+                    new_booking, now, server_state
+                )
+            except BookingError as error:
+                checked.append(error)
+                continue
+
+            if reserved_resource is not None:
+                slot_id = -1 - index
+                calendar.add_slot(
+                    reserved_resource,
+                    new_booking.start_time,
+                    new_booking.end_time,
+                    slot_id,
+                )
+                held.append(
+                    (reserved_resource, new_booking.start_time, slot_id)
+                )
+            checked.append(reserved_resource)
+    finally:
+        for resource, start_time, slot_id in held:
+            calendar.remove_slot(resource, start_time, slot_id)
+
+    if atomic and any(isinstance(result, BookingError) for result in checked):
+        return [
+            (
+                result
+                if isinstance(result, BookingError)
+                else BookingError(
+                    "Could not add new booking. Another booking of the batch"
+                    " was invalid."
+                )
+            )
+            for result in checked
+        ]
+
+    return [
+        (
+            result
+            if isinstance(result, BookingError)
+            else create_booking(new_booking, result, now, server_state)
+        )
+        for new_booking, result in zip(new_bookings, checked)
+    ]
 
-        return booking
-    return None
+
+def set_booking_status(
+    booking: Booking, status: BookingStatus, server_state: ServerState
+):
+    previous = booking.info.status
+    booking.info.status = status
+    booking.info.version += 1
+    booking.encoded = None
+    if booking.used_resource is not None:
+        booking.used_resource.encoded = None
+    server_state.booking_indexes.status_changed(booking, previous)
+    server_state.changes.booking_changed(booking)
+    server_state.feed.booking_changed(booking)
+    server_state.notifications.publish(booking)
+
+
+def close_booking(
+    booking: Booking, status: BookingStatus, server_state: ServerState
+):
+    closing_time = datetime.now(timezone.utc)
+    held_resource = booking.used_resource or booking.reserved_resource
+    if held_resource is not None:
+        server_state.calendar.remove(held_resource, booking)
+    set_booking_status(booking, status, server_state)
+    server_state.closed_bookings.append((closing_time, booking))
+    server_state.journal.booking_closed(booking, closing_time)
+
+
+def cancel_booking(booking: Booking, server_state: ServerState):
+    server_state.waiting_bookings.remove(booking)
+    close_booking(booking, BookingStatus.CANCELLED, server_state)
+
+
+def cancel_bookings_of_run(run_id: int, server_state: ServerState):
+    cancelled = server_state.waiting_bookings.of_run(run_id)
+    for booking in cancelled:
+        cancel_booking(booking, server_state)
+    return cancelled
+
+
+def finish_booking(
+    booking: Booking, resource: Resource, server_state: ServerState
+):
+    release_resource(resource, server_state)
+    close_booking(booking, BookingStatus.FINISHED, server_state)
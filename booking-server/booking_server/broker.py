@@ -1,78 +1,316 @@
-import asyncio
+from __future__ import annotations
 
-from booking_common.models import JobInfo
-from booking_server.booking import Booking, BookingStatus, find_waiting_booking
-from booking_server.resource import Resource, find_free_resource
-from fastcore.basics import AttrDict
-from ghapi.all import GhApi
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Container
 
+from booking_common.models import (
+    JobInfo,
+    ResourceInventory,
+    ResourceInventoryChanges,
+)
+from booking_server.booking import (
+    Booking,
+    BookingStatus,
+    WaitingBookings,
+    cancel_booking,
+    finish_booking,
+    set_booking_status,
+)
+from booking_server.exceptions import ResourceError
+from booking_server.fair_share import FairShareBookings
+from booking_server.github import GitHubClient
+from booking_server.matching import Matching
+from booking_server.resource import (
+    NewResource,
+    Resource,
+    create_resource,
+    reinstate_resource,
+    retire_resource,
+)
+from booking_server.supervisor import TaskKind, TaskSupervisor
 
-async def re_run_github_job(github: JobInfo, github_token: str):
-    api = GhApi(github.repo_owner, github.repo_name, github_token)
+if TYPE_CHECKING:
+    from booking_server.server import ServerState
+
+
+# Waiting bookings ordered by the allocation policy, the broker hands a
+# freed resource to the first one that fits
+ALLOCATION_POLICIES = ("first-come", "fair-share")
+
+
+def allocation_policy(
+    policy: str, weights: None | dict[str, float] = None
+) -> WaitingBookings:
+    if policy == "fair-share":
+        return FairShareBookings(weights)
+    return WaitingBookings()
 
-    while True:
-        run_info: AttrDict = (
-            api.actions.get_workflow_run(  # pyright: ignore[reportGeneralTypeIssues] pylint: disable=wrong-spelling-in-comment
-                run_id=github.run_id
-            )
-        )
-        print(run_info["status"])
-        if run_info["status"] == "completed":
-            break
-        await asyncio.sleep(
-            0.5
-        )  # TODO: Check if this is too often for GitHub API
-
-    api.actions.re_run_job_for_workflow_run(  # pyright: ignore[reportGeneralTypeIssues] pylint: disable=wrong-spelling-in-comment
-        job_id=github.job_id
-    )
 
+async def re_run_github_job(github: JobInfo, github_client: GitHubClient):
+    reruns = github_client.metrics.github_reruns
+    try:
+        await github_client.wait_for_run_completion(github)
+        await github_client.re_run_job_for_workflow_run(github)
+    except Exception:
+        reruns.inc("failed")
+        raise
+    reruns.inc("succeeded")
+
+
+def assign_to_each_others(
+    resource: Resource, booking: Booking, server_state: ServerState
+):
+    # Reserved bookings are counted from their start, not from being booked
+    waited = datetime.now(timezone.utc) - max(
+        booking.info.booking_time, booking.info.start_time
+    )
+    server_state.metrics.waiting_seconds.observe(
+        max(waited.total_seconds(), 0), booking.info.resource.type
+    )
 
-def assign_to_each_others(resource: Resource, booking: Booking):
-    booking.info.status = BookingStatus.ON
     booking.used_resource = resource
     resource.used_by = booking
-    booking.event.set()
-    booking.event.clear()
+    if booking.reserved_resource is None:
+        server_state.calendar.add(resource, booking)
+    resource.encoded = None
+    server_state.free_resources.remove(resource)
+    server_state.waiting_bookings.assigned(booking)
+    server_state.changes.resource_changed(resource)
+    server_state.journal.booking_assigned(booking, resource)
+    set_booking_status(booking, BookingStatus.ON, server_state)
+    server_state.feed.resource_changed(resource)
 
 
-async def try_assigning_new_resource(
-    booking: Booking, resources: list[Resource], github_token: str
+def re_run_github_jobs(
+    bookings: list[Booking],
+    supervisor: TaskSupervisor,
+    github_client: GitHubClient,
 ):
-    # TODO: What if booking was deleted from server data before this is
-    # ran and this still holds the reference to the object
+    # Re-runs wait for their workflow run to complete, so they get their
+    # own tasks instead of holding up assignments
+    for booking in bookings:
+        if booking.info.github is not None:
+            supervisor.spawn(
+                TaskKind.GITHUB,
+                re_run_github_job(booking.info.github, github_client),
+            )
 
-    if booking.info.status != BookingStatus.WAITING:
-        return
 
-    requested = booking.info.resource
+def stays_held(identifier: str, matching: Matching, fresh: Container[int]):
+    holder = matching.holders.get(identifier)
+    if holder is None:
+        return False
+    # Bookings that waited before can only move between the freed resources,
+    # so with all of them held there is nowhere left to move them to
+    if holder.info.id not in fresh:
+        return True
+    # New bookings can move to any free resource, unless a search already
+    # found no way on from the resource they hold
+    return identifier in matching.exhausted
 
-    resource = find_free_resource(requested, resources)
 
-    if resource is None:
-        return
+def match_type(
+    resource_type: str,
+    freed_resources: list[Resource],
+    new_bookings: list[Booking],
+    server_state: ServerState,
+):
+    free_of_type: dict[str, Resource] = (
+        server_state.free_resources.types_to_resources.get(resource_type, {})
+    )
+    # Events of resources taken or removed since, and of bookings no longer
+    # waiting, are dropped
+    freed = {
+        resource.info.identifier: resource
+        for resource in freed_resources
+        if free_of_type.get(resource.info.identifier) is resource
+    }
+    fresh = {
+        booking.info.id: booking
+        for booking in new_bookings
+        if booking.info.status == BookingStatus.WAITING
+        and booking.reserved_resource is None
+    }
+    if not freed and not fresh:
+        return []
+
+    # Resources free before this round have already been offered to the
+    # bookings waiting before it, so only new bookings can use them
+    matching = Matching(
+        free_of_type if fresh else freed, server_state.calendar.fits
+    )
+
+    unoffered = dict(fresh)
+    if freed:
+        unheld = set(freed)
+        identifiers = set(freed)
+        identifiers.update(
+            booking.info.resource.identifier
+            for booking in fresh.values()
+            if booking.info.resource.identifier is not None
+        )
+        for booking in server_state.waiting_bookings.candidates(
+            resource_type, identifiers
+        ):
+            if unoffered.pop(booking.info.id, None) is not None:
+                unheld.discard(matching.offer(booking))
+            else:
+                unheld.discard(matching.offer(booking, freed))
 
-    assign_to_each_others(resource, booking)
+            # Once every freed resource stays held the rest of the bookings
+            # that waited before can't get any. Resources stay held once
+            # taken, so their holders are only looked at once all are.
+            if not unheld and all(
+                stays_held(identifier, matching, fresh) for identifier in freed
+            ):
+                break
 
-    if booking.info.github is not None:
-        await re_run_github_job(booking.info.github, github_token)
+    for booking in unoffered.values():
+        matching.offer(booking)
 
+    assigned: list[Booking] = []
+    for booking, resource in matching.matched():
+        assign_to_each_others(resource, booking, server_state)
+        assigned.append(booking)
+    return assigned
 
-async def try_assigning_to_booking(
-    resource: Resource, bookings: list[Booking], github_token: str
+
+def match_resources_and_bookings(
+    resources: list[Resource],
+    bookings: list[Booking],
+    server_state: ServerState,
 ):
-    # TODO: What if resource is deleted before this runs and this still
-    # holds the reference to the object
+    # One matching for each type, over the resources freed and bookings
+    # added since the previous round
+    by_type: dict[str, tuple[list[Resource], list[Booking]]] = {}
+    for resource in resources:
+        by_type.setdefault(resource.info.type, ([], []))[0].append(resource)
+    for booking in bookings:
+        by_type.setdefault(booking.info.resource.type, ([], []))[1].append(
+            booking
+        )
+
+    return [
+        booking
+        for resource_type, (freed, added) in by_type.items()
+        for booking in match_type(resource_type, freed, added, server_state)
+    ]
+
+
+def activate_reserved_booking(booking: Booking, server_state: ServerState):
+    resource = booking.reserved_resource
+    if booking.info.status != BookingStatus.WAITING or resource is None:
+        return False
 
     if resource.used_by is not None:
-        return
+        print(
+            f"Could not activate booking {booking.info.id}, reserved"
+            f" resource {resource.info.identifier} is still in use"
+        )
+        return False
+
+    assign_to_each_others(resource, booking, server_state)
+    return True
+
+
+def expire_booking(booking: Booking, server_state: ServerState):
+    if booking.info.status == BookingStatus.WAITING:
+        cancel_booking(booking, server_state)
+        return None
+
+    resource = booking.used_resource
+    if booking.info.status != BookingStatus.ON or resource is None:
+        return None
+
+    finish_booking(booking, resource, server_state)
+    return resource
+
+
+def remove_resource(resource: Resource, server_state: ServerState):
+    calendar = server_state.calendar.resources_to_calendars.get(
+        resource.info.identifier
+    )
+    reserved_ids = (
+        [booking_id for _, _, booking_id in calendar.intervals]
+        if calendar is not None
+        else []
+    )
+
+    for booking_id in reserved_ids:
+        booking = server_state.ids_to_bookings.get(booking_id)
+        if (
+            booking is not None
+            and booking.reserved_resource is resource
+            and booking.info.status == BookingStatus.WAITING
+        ):
+            cancel_booking(booking, server_state)
+
+    retire_resource(resource, server_state)
+
+
+def planned_sync(inventory: ResourceInventory, server_state: ServerState):
+    label = inventory.label
+
+    # Everything is checked before anything changes
+    desired: dict[str, NewResource] = {}
+    for info in inventory.resources:
+        if info.label not in (None, label):
+            raise ResourceError(
+                f"Resource {info.identifier} is labeled {info.label}, not"
+                f" {label}."
+            )
+        if info.identifier in desired:
+            raise ResourceError(f"Resource {info.identifier} is listed twice.")
+
+        existing = server_state.ids_to_resources.get(info.identifier)
+        if existing is not None and (
+            existing.info.label != label or existing.info.type != info.type
+        ):
+            raise ResourceError(
+                f"Resource {info.identifier} already exists with type"
+                f" {existing.info.type} and label {existing.info.label}."
+            )
+
+        desired[info.identifier] = NewResource(
+            type=info.type, identifier=info.identifier, label=label
+        )
+
+    removed = [
+        resource
+        for resource in server_state.resources
+        if resource.info.label == label
+        and resource.info.identifier not in desired
+    ]
+    return desired, removed
+
+
+def planned_changes(inventory: ResourceInventory, server_state: ServerState):
+    # What syncing the inventory would change, without changing it
+    desired, removed = planned_sync(inventory, server_state)
+    existing = server_state.ids_to_resources
+    return ResourceInventoryChanges(
+        added=[i for i in desired if i not in existing],
+        removed=[resource.info.identifier for resource in removed],
+        kept=[i for i in desired if i in existing],
+    )
+
+
+def sync_resources(inventory: ResourceInventory, server_state: ServerState):
+    desired, removed = planned_sync(inventory, server_state)
 
-    booking = find_waiting_booking(resource, bookings)
+    for resource in removed:
+        remove_resource(resource, server_state)
 
-    if booking is None:
-        return
+    added: list[Resource] = []
+    kept: list[Resource] = []
+    for identifier, new_resource in desired.items():
+        existing = server_state.ids_to_resources.get(identifier)
+        if existing is None:
+            added.append(create_resource(new_resource, server_state))
+            continue
 
-    assign_to_each_others(resource, booking)
+        if existing.retired:
+            reinstate_resource(existing, server_state)
+        kept.append(existing)
 
-    if booking.info.github is not None:
-        await re_run_github_job(booking.info.github, github_token)
+    return added, removed, kept
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from booking_server.booking import Booking
+    from booking_server.resource import Resource
+
+
+class StateChanges:
+    def __init__(self) -> None:
+        self.bookings: dict[int, Booking] = {}
+        self.resources: dict[str, Resource] = {}
+
+    def booking_changed(self, booking: Booking):
+        self.bookings[booking.info.id] = booking
+
+    def resource_changed(self, resource: Resource):
+        self.resources[resource.info.identifier] = resource
+
+    def take(self):
+        bookings, self.bookings = self.bookings, {}
+        resources, self.resources = self.resources, {}
+        return bookings, resources
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import marshal
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from booking_server.exceptions import ProfilerBusy
+from booking_server.metrics import Metrics
+from pydantic import BaseModel, ConfigDict
+
+
+class LoopStall(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    started: datetime
+    seconds: float
+    # Where the event loop thread was when the stall was noticed
+    stack: list[str]
+
+
+class LoopMonitor:
+    # The event loop beats at every interval. A watchdog thread notices
+    # when the beats stop for longer than the threshold and takes the stack
+    # of the event loop thread, which is the callback blocking it.
+    def __init__(
+        self,
+        metrics: Metrics,
+        interval: float = 0.05,
+        threshold: float = 0.25,
+        stalls_kept: int = 100,
+    ) -> None:
+        self.metrics = metrics
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque[LoopStall] = deque(maxlen=stalls_kept)
+        self.heartbeat = time.monotonic()
+        self.stalled: None | tuple[float, list[str]] = None
+        self.loop_thread_id: None | int = None
+        self.profiling = False
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            heartbeat = self.heartbeat
+            if (
+                self.stalled is not None
+                or time.monotonic() - heartbeat < self.threshold
+            ):
+                continue
+
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            frame = frames.get(self.loop_thread_id or 0)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            self.stalled = (heartbeat, stack)
+
+    def _stall_ended(self, now: float):
+        if self.stalled is None:
+            return
+
+        started, stack = self.stalled
+        self.stalled = None
+        seconds = now - started
+        self.stalls.append(
+            LoopStall(
+                started=datetime.now(timezone.utc)
+                - timedelta(seconds=seconds),
+                seconds=seconds,
+                stack=stack,
+            )
+        )
+        self.metrics.loop_stalls.inc()
+        print(f"Event loop was blocked for {seconds:.3f} seconds at:")
+        print("".join(stack[-5:]), end="")
+
+    async def run(self):
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        ).start()
+
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.metrics.loop_lag_seconds.observe(
+                max(now - self.heartbeat - self.interval, 0)
+            )
+            self.heartbeat = now
+            self._stall_ended(now)
+
+    async def profile(self, seconds: float):
+        # Everything run by the event loop meanwhile runs on this thread,
+        # so the profile covers every request and background task
+        if self.profiling:
+            raise ProfilerBusy("A profile is already being taken.")
+
+        self.profiling = True
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+        finally:
+            self.profiling = False
+
+        # Same format as pstats.Stats.dump_stats, loadable with pstats
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)  # type: ignore
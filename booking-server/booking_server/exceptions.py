@@ -5,8 +5,22 @@ class AlreadyExistingId(Exception):
         self.message = message
 
 
+class ResourceError(Exception):
+    message: str
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+
+
 class BookingError(Exception):
     message: str
 
     def __init__(self, message: str) -> None:
         self.message = message
+
+
+class ProfilerBusy(Exception):
+    message: str
+
+    def __init__(self, message: str) -> None:
+        self.message = message
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import heapq
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, TypeVar
+
+from booking_server.booking import Booking, TenantStats, WaitingBookings
+
+QueueKey = str | tuple[str, str]
+T = TypeVar("T")
+
+
+def tenant_of(booking: Booking):
+    github = booking.info.github
+    if github is None:
+        return booking.info.name
+    return f"{github.repo_owner}/{github.repo_name}"
+
+
+def heap_in_order(heap: list[T]) -> Iterator[T]:
+    # Sorted without copying or changing the heap, visiting only as much of
+    # it as is consumed
+    if not heap:
+        return
+
+    frontier = [(heap[0], 0)]
+    while frontier:
+        entry, index = heapq.heappop(frontier)
+        yield entry
+        for child in (2 * index + 1, 2 * index + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+
+class Tenant:
+    def __init__(self, name: str, weight: float) -> None:
+        self.name = name
+        self.weight = weight
+        # Advanced by 1 / weight for every assigned booking, the waiting
+        # tenant with the lowest virtual time is served next
+        self.virtual_time = 0.0
+        self.waiting: OrderedDict[int, Booking] = OrderedDict()
+        self.assigned = 0
+        self.waited_seconds = 0.0
+
+
+class TenantQueues:
+    # Waiting bookings asking for the same type or resource, by tenant.
+    # Entries of bookings no longer waiting are skipped when met instead of
+    # being searched for, and a tenant's heap is rebuilt once half of it is
+    # such entries.
+    def __init__(self) -> None:
+        self.bookings: dict[str, list[tuple[int, int, Booking]]] = {}
+        self.left: dict[str, int] = {}
+
+    def add(self, tenant: Tenant, booking: Booking):
+        heapq.heappush(
+            self.bookings.setdefault(tenant.name, []),
+            (-booking.info.priority, booking.info.id, booking),
+        )
+
+    def discard(self, tenant: Tenant):
+        # One of the tenant's bookings in this queue stopped waiting
+        bookings = self.bookings.get(tenant.name)
+        if bookings is None:
+            return
+
+        left = self.left.get(tenant.name, 0) + 1
+        if 2 * left < len(bookings):
+            self.left[tenant.name] = left
+            return
+
+        self.left.pop(tenant.name, None)
+        bookings[:] = [
+            entry for entry in bookings if entry[1] in tenant.waiting
+        ]
+        heapq.heapify(bookings)
+        if not bookings:
+            del self.bookings[tenant.name]
+
+
+class FairShareBookings(WaitingBookings):
+    # Reserved bookings hold their slots whatever the shares and never wait
+    # in the queues, so they are neither held back nor counted here
+    def __init__(self, weights: None | dict[str, float] = None) -> None:
+        super().__init__()
+        self.weights = weights or {}
+        self.tenants: dict[str, Tenant] = {}
+        self.queues: dict[QueueKey, TenantQueues] = {}
+        self.virtual_time = 0.0
+
+    def _queue_key(self, booking: Booking) -> QueueKey:
+        requested = booking.info.resource
+        if requested.identifier is None:
+            return requested.type
+        return (requested.type, requested.identifier)
+
+    def add(self, booking: Booking):
+        name = tenant_of(booking)
+        tenant = self.tenants.get(name)
+        if tenant is None:
+            tenant = self.tenants[name] = Tenant(
+                name, self.weights.get(name, 1.0)
+            )
+
+        if not tenant.waiting:
+            # Time spent without waiting bookings is not saved up for later
+            tenant.virtual_time = max(tenant.virtual_time, self.virtual_time)
+
+        tenant.waiting[booking.info.id] = booking
+        self._waiting_changed(booking, 1)
+        self.queues.setdefault(self._queue_key(booking), TenantQueues()).add(
+            tenant, booking
+        )
+        self._add_to_run(booking)
+
+    def remove(self, booking: Booking):
+        self._remove_from_run(booking)
+
+        tenant = self.tenants.get(tenant_of(booking))
+        if tenant is None or tenant.waiting.pop(booking.info.id, None) is None:
+            return
+
+        self._waiting_changed(booking, -1)
+        key = self._queue_key(booking)
+        queue = self.queues.get(key)
+        if queue is not None:
+            queue.discard(tenant)
+            if not queue.bookings:
+                del self.queues[key]
+
+    def assigned(self, booking: Booking):
+        tenant = self.tenants.get(tenant_of(booking))
+        if tenant is not None and booking.info.id in tenant.waiting:
+            self.virtual_time = tenant.virtual_time
+            tenant.virtual_time += 1 / tenant.weight
+            tenant.assigned += 1
+            tenant.waited_seconds += (
+                datetime.now(timezone.utc) - booking.info.booking_time
+            ).total_seconds()
+
+        self.remove(booking)
+
+    def candidates(
+        self, resource_type: str, identifiers: Iterable[str]
+    ) -> Iterator[Booking]:
+        keys: list[QueueKey] = [resource_type]
+        keys += [(resource_type, identifier) for identifier in identifiers]
+
+        per_tenant: dict[str, list[list[tuple[int, int, Booking]]]] = {}
+        for key in keys:
+            queue = self.queues.get(key)
+            if queue is not None:
+                for name, bookings in queue.bookings.items():
+                    per_tenant.setdefault(name, []).append(bookings)
+
+        # Served in order of priority and id within a tenant, and by
+        # virtual time across them, as if each one got a resource
+        in_order = {
+            name: heapq.merge(*(heap_in_order(heap) for heap in heaps))
+            for name, heaps in per_tenant.items()
+        }
+        tenants = [
+            (self.tenants[name].virtual_time, name) for name in in_order
+        ]
+        heapq.heapify(tenants)
+
+        while tenants:
+            virtual_time, name = tenants[0]
+            tenant = self.tenants[name]
+            entry = next(
+                (
+                    entry
+                    for entry in in_order[name]
+                    if entry[1] in tenant.waiting
+                ),
+                None,
+            )
+            if entry is None:
+                heapq.heappop(tenants)
+                continue
+
+            yield entry[2]
+            heapq.heapreplace(
+                tenants, (virtual_time + 1 / tenant.weight, name)
+            )
+
+    def tenant_stats(self):
+        now = datetime.now(timezone.utc)
+        return [
+            TenantStats(
+                tenant=tenant.name,
+                weight=tenant.weight,
+                waiting=len(tenant.waiting),
+                oldest_waiting_seconds=(
+                    (
+                        now
+                        - next(iter(tenant.waiting.values())).info.booking_time
+                    ).total_seconds()
+                    if tenant.waiting
+                    else None
+                ),
+                assigned=tenant.assigned,
+                mean_wait_seconds=(
+                    tenant.waited_seconds / tenant.assigned
+                    if tenant.assigned
+                    else None
+                ),
+                virtual_time=tenant.virtual_time,
+            )
+            for tenant in self.tenants.values()
+        ]
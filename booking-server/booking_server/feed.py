@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+from asyncio import Queue
+from collections import deque
+from typing import TYPE_CHECKING
+
+from booking_common.models import BookingResponse
+from booking_server.booking import booking_response
+from booking_server.resource import DumpableResource
+from pydantic import BaseModel, ConfigDict
+
+if TYPE_CHECKING:
+    from booking_server.booking import Booking
+    from booking_server.resource import Resource
+
+
+class ChangeEvent(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    sequence: int
+    booking: None | BookingResponse = None
+    resource: None | DumpableResource = None
+    resource_removed: bool = False
+
+
+class FeedSubscriber:
+    def __init__(self, buffer_size: int) -> None:
+        self.queue: Queue[tuple[int, str]] = Queue(buffer_size)
+        self.overflowed = False
+
+
+class ChangeFeed:
+    def __init__(self, history_size: int = 10000, buffer_size: int = 1000):
+        self.sequence = 0
+        self.history: deque[tuple[int, str]] = deque(maxlen=history_size)
+        self.buffer_size = buffer_size
+        self.subscribers: set[FeedSubscriber] = set()
+
+    def _publish(self, event: ChangeEvent):
+        self._append((event.sequence, event.model_dump_json()))
+
+    def _append(self, encoded: tuple[int, str]):
+        self.history.append(encoded)
+
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(encoded)
+            except asyncio.QueueFull:
+                # Slow consumers are cut off instead of buffering without
+                # bound, they can resume from their last sequence number
+                subscriber.overflowed = True
+                self.subscribers.discard(subscriber)
+
+    def booking_changed(self, booking: Booking):
+        self.sequence += 1
+        self._publish(
+            ChangeEvent(
+                sequence=self.sequence, booking=booking_response(booking)
+            )
+        )
+
+    def resource_changed(self, resource: Resource, removed: bool = False):
+        self.sequence += 1
+        used_by = resource.used_by.info if resource.used_by else None
+        self._publish(
+            ChangeEvent(
+                sequence=self.sequence,
+                resource=DumpableResource(info=resource.info, used_by=used_by),
+                resource_removed=removed,
+            )
+        )
+
+    def replay(self, sequence: int, event: str):
+        # Republishes an event already encoded by the feed of another process
+        self.sequence = sequence
+        self._append((sequence, event))
+
+    def oldest_available(self):
+        return self.history[0][0] if self.history else self.sequence + 1
+
+    def subscribe(self, since: int, buffer_size: None | int = None):
+        subscriber = FeedSubscriber(
+            self.buffer_size if buffer_size is None else buffer_size
+        )
+        missed = [event for event in self.history if event[0] > since]
+        self.subscribers.add(subscriber)
+        return subscriber, missed
+
+    def unsubscribe(self, subscriber: FeedSubscriber):
+        self.subscribers.discard(subscriber)
+
+    async def events(self, since: int):
+        subscriber, missed = self.subscribe(since)
+
+        try:
+            for event in missed:
+                yield event
+
+            while not (subscriber.overflowed and subscriber.queue.empty()):
+                yield await subscriber.queue.get()
+        finally:
+            self.unsubscribe(subscriber)
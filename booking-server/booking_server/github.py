@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import time
+from asyncio import Future, Task
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Any
+
+import aiohttp
+from booking_common.models import JobInfo
+from booking_server.metrics import Metrics
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+GITHUB_API_URL = "https://api.github.com"
+
+
+class GitHubError(Exception):
+    message: str
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+
+
+class WorkflowRun(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: int
+    status: str
+    conclusion: None | str = None
+
+
+class PolledWorkflowRun(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    status: str
+
+
+class WorkflowRunEvent(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    action: str
+    workflow_run: WorkflowRun
+
+
+class WorkflowJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: int
+    run_id: int
+    status: str
+
+
+class WorkflowJobEvent(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    action: str
+    workflow_job: WorkflowJob
+
+
+def verify_webhook_signature(secret: str, body: bytes, signature: None | str):
+    if signature is None:
+        return False
+
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(f"sha256={expected}", signature)
+
+
+class GitHubSettings(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    base_url: str = GITHUB_API_URL
+    connections_per_host: int = 8
+    poll_interval: float = 5
+    max_poll_interval: float = 60
+    webhook_secret: None | str = None
+    # Runs are polled only once their webhooks have gone silent this long
+    webhook_timeout: float = 60
+    completed_runs_kept: int = 1024
+
+
+class RateLimit:
+    def __init__(self) -> None:
+        self.remaining: None | int = None
+        self.reset: float = 0
+
+    def update(self, headers: Any):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        retry_after = headers.get("Retry-After")
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset is not None:
+            self.reset = float(reset)
+        if retry_after is not None:
+            self.remaining = 0
+            self.reset = time.time() + float(retry_after)
+
+    def poll_delay(self, settings: GitHubSettings, polled_runs: int):
+        # Spread the remaining budget over every run being polled until the
+        # limit resets
+        if self.remaining is None:
+            return settings.poll_interval
+
+        until_reset = max(self.reset - time.time(), 0)
+        if self.remaining == 0:
+            return max(until_reset, settings.poll_interval)
+
+        budget_delay = until_reset * max(polled_runs, 1) / self.remaining
+        return min(
+            max(settings.poll_interval, budget_delay),
+            settings.max_poll_interval,
+        )
+
+
+@dataclass
+class PolledRun:
+    completion: Future[Any]
+    poller: None | Task[None] = None
+    webhook_delivered: None | float = None
+
+
+class WorkflowRuns:
+    def __init__(self, completed_kept: int) -> None:
+        # Runs waited for by bookings, polled until they complete
+        self.polled: dict[int, PolledRun] = {}
+        self.completed: OrderedDict[int, Any] = OrderedDict()
+        self.completed_kept = completed_kept
+
+    def add_completed(self, run_id: int, run_info: Any):
+        self.completed[run_id] = run_info
+        while len(self.completed) > self.completed_kept:
+            self.completed.popitem(last=False)
+
+    def restarted(self, run_id: int):
+        self.completed.pop(run_id, None)
+
+
+class GitHubClient:
+    def __init__(
+        self,
+        token: str,
+        settings: None | GitHubSettings = None,
+        metrics: None | Metrics = None,
+    ) -> None:
+        self.token = token
+        self.settings = settings or GitHubSettings()
+        self.metrics = metrics or Metrics()
+        self.session: None | aiohttp.ClientSession = None
+        self.cached: dict[str, tuple[str, Any]] = {}
+        self.rate_limit = RateLimit()
+        self.runs = WorkflowRuns(self.settings.completed_runs_kept)
+
+    @property
+    def base_url(self):
+        return self.settings.base_url.rstrip("/")
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self.settings.connections_per_host,
+                    keepalive_timeout=60,
+                ),
+                headers={
+                    "Accept": "application/vnd.github+json",
+                    "Authorization": f"Bearer {self.token}",
+                    "X-GitHub-Api-Version": "2022-11-28",
+                },
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self.session
+
+    async def close(self):
+        for polled_run in self.runs.polled.values():
+            if polled_run.poller is not None:
+                polled_run.poller.cancel()
+        if self.session is not None:
+            await self.session.close()
+
+    def next_poll_delay(self, failures: int = 0):
+        settings = self.settings
+        # Backing off after failed polls of a run
+        if failures:
+            return max(
+                min(
+                    settings.poll_interval * 2**failures,
+                    settings.max_poll_interval,
+                ),
+                self.next_poll_delay(),
+            )
+
+        return self.rate_limit.poll_delay(settings, len(self.runs.polled))
+
+    @asynccontextmanager
+    async def _request(self, method: str, url: str, **kwargs: Any):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with self._session().request(
+                method, url, **kwargs
+            ) as response:
+                status = str(response.status)
+                self.rate_limit.update(response.headers)
+                yield response
+        finally:
+            self.metrics.github_request_seconds.observe(
+                time.perf_counter() - started, method, status
+            )
+
+    async def get(self, path: str):
+        url = f"{self.base_url}{path}"
+        headers = {}
+        cached = self.cached.get(url)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+
+        async with self._request("GET", url, headers=headers) as response:
+            if response.status == HTTPStatus.NOT_MODIFIED and cached:
+                return cached[1]
+
+            if response.status >= HTTPStatus.BAD_REQUEST:
+                raise GitHubError(
+                    f"GET {path} failed with {response.status}:"
+                    f" {await response.text()}"
+                )
+
+            content = await response.json()
+            etag = response.headers.get("ETag")
+            if etag is not None:
+                self.cached[url] = (etag, content)
+
+            return content
+
+    async def post(self, path: str):
+        url = f"{self.base_url}{path}"
+
+        async with self._request("POST", url) as response:
+            if response.status >= HTTPStatus.BAD_REQUEST:
+                raise GitHubError(
+                    f"POST {path} failed with {response.status}:"
+                    f" {await response.text()}"
+                )
+
+    async def get_workflow_run(self, github: JobInfo):
+        return await self.get(
+            f"/repos/{github.repo_owner}/{github.repo_name}"
+            f"/actions/runs/{github.run_id}"
+        )
+
+    async def re_run_job_for_workflow_run(self, github: JobInfo):
+        # Re-running a job puts the run back in progress
+        self.runs.restarted(github.run_id)
+        await self.post(
+            f"/repos/{github.repo_owner}/{github.repo_name}"
+            f"/actions/jobs/{github.job_id}/rerun"
+        )
+
+    async def _poll_run(self, github: JobInfo, polled_run: PolledRun):
+        run_id = github.run_id
+        completion = polled_run.completion
+        settings = self.settings
+        url = (
+            f"{self.base_url}/repos/{github.repo_owner}/{github.repo_name}"
+            f"/actions/runs/{run_id}"
+        )
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        failures = 0
+
+        try:
+            while True:
+                if settings.webhook_secret is not None:
+                    # Poll only when webhooks have gone silent for the run
+                    last_heard = max(
+                        started, polled_run.webhook_delivered or started
+                    )
+                    silent_for = loop.time() - last_heard
+                    if silent_for < settings.webhook_timeout:
+                        await asyncio.sleep(
+                            settings.webhook_timeout - silent_for
+                        )
+                        continue
+
+                try:
+                    run_info = await self.get_workflow_run(github)
+                    run = PolledWorkflowRun.model_validate(run_info)
+                except (
+                    GitHubError,
+                    aiohttp.ClientError,
+                    TimeoutError,
+                    ValidationError,
+                ) as error:
+                    # The run is shared by every booking waiting for it, so
+                    # it's polled until it completes whatever goes wrong
+                    failures += 1
+                    self.metrics.github_poll_failures.inc(type(error).__name__)
+                    print(
+                        f"Polling workflow run {run_id} failed"
+                        f" {failures} times in a row: {error!r}"
+                    )
+                else:
+                    failures = 0
+                    if run.status == "completed":
+                        completion.set_result(run_info)
+                        return
+
+                await asyncio.sleep(self.next_poll_delay(failures))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # Waiters fail with the error, counted as a failed re-run,
+            # instead of being cancelled
+            if not completion.done():
+                completion.set_exception(error)
+        finally:
+            del self.runs.polled[run_id]
+            self.cached.pop(url, None)
+            if not completion.done():
+                completion.cancel()
+
+    def run_webhook_delivered(self, run_id: int):
+        polled_run = self.runs.polled.get(run_id)
+        if polled_run is not None:
+            polled_run.webhook_delivered = asyncio.get_running_loop().time()
+
+    def run_completed(self, run_id: int, run_info: Any):
+        self.runs.add_completed(run_id, run_info)
+
+        polled_run = self.runs.polled.get(run_id)
+        if polled_run is not None and not polled_run.completion.done():
+            polled_run.completion.set_result(run_info)
+            if polled_run.poller is not None:
+                polled_run.poller.cancel()
+
+    def run_restarted(self, run_id: int):
+        self.runs.restarted(run_id)
+
+    async def wait_for_run_completion(self, github: JobInfo):
+        if github.run_id in self.runs.completed:
+            return self.runs.completed[github.run_id]
+
+        polled_run = self.runs.polled.get(github.run_id)
+
+        if polled_run is None:
+            polled_run = PolledRun(asyncio.get_running_loop().create_future())
+            self.runs.polled[github.run_id] = polled_run
+            polled_run.poller = asyncio.create_task(
+                self._poll_run(github, polled_run)
+            )
+
+        return await asyncio.shield(polled_run.completion)
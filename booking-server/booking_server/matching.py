@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from collections import deque
+from itertools import chain
+from typing import Callable, Container, Iterable, Mapping
+
+from booking_server.booking import Booking
+from booking_server.resource import Resource
+
+
+class Matching:
+    # Bookings are offered the resources one at a time in the order of the
+    # allocation policy. A booking finding no free resource can take one
+    # from an earlier booking that moves to another one instead, so earlier
+    # bookings keep getting a resource and the matching stays maximum.
+    def __init__(
+        self,
+        resources: Mapping[str, Resource],
+        fits: Callable[[Resource, Booking], bool],
+    ) -> None:
+        self.fits = fits
+        # Not copied, the resources by identifier stay the same for the
+        # round, so a round costs only as much as the bookings look at
+        self.resources = resources
+        # Resources are looked at in their order and stay held once taken,
+        # so the ones found held are left out of later looks
+        self.unlooked = iter(resources.items())
+        self.unheld: dict[str, Resource] = {}
+        self.holders: dict[str, Booking] = {}
+        self.held: dict[int, Resource] = {}
+        self.allowed: dict[int, None | Container[str]] = {}
+        # Resources reached by a search that found no free resource. Paths
+        # found later never go through them, so their holders stay and
+        # searches passing by can skip them.
+        self.exhausted: set[str] = set()
+
+    def _unheld(self):
+        for identifier, resource in list(self.unheld.items()):
+            if identifier in self.holders:
+                del self.unheld[identifier]
+            else:
+                yield resource
+        for identifier, resource in self.unlooked:
+            if identifier not in self.holders:
+                self.unheld[identifier] = resource
+                yield resource
+
+    def _usable(self, booking: Booking):
+        allowed = self.allowed[booking.info.id]
+        requested = booking.info.resource.identifier
+
+        if requested is not None:
+            resource = self.resources.get(requested)
+            candidates: Iterable[Resource] = (
+                () if resource is None else (resource,)
+            )
+        else:
+            # Unmatched ones first so that moving others is the last resort
+            candidates = chain(
+                self._unheld(),
+                (self.resources[identifier] for identifier in self.holders),
+            )
+
+        for resource in candidates:
+            identifier = resource.info.identifier
+            if (
+                identifier not in self.exhausted
+                and (allowed is None or identifier in allowed)
+                and self.fits(resource, booking)
+            ):
+                yield resource
+
+    def _take(self, identifier: str, reached: dict[str, Booking]):
+        # Every booking along the path takes the resource it reached and
+        # gives up the one it held to the booking before it
+        while True:
+            booking = reached[identifier]
+            previous = self.held.get(booking.info.id)
+            self.holders[identifier] = booking
+            self.held[booking.info.id] = self.resources[identifier]
+            if previous is None:
+                return
+            identifier = previous.info.identifier
+
+    def offer(self, booking: Booking, allowed: None | Container[str] = None):
+        self.allowed[booking.info.id] = allowed
+        reached: dict[str, Booking] = {}
+        # Breadth first, so that as few bookings as possible are moved
+        frontier = deque([booking])
+
+        while frontier:
+            current = frontier.popleft()
+            for resource in self._usable(current):
+                identifier = resource.info.identifier
+                if identifier in reached:
+                    continue
+
+                reached[identifier] = current
+                holder = self.holders.get(identifier)
+                if holder is None:
+                    self._take(identifier, reached)
+                    return identifier
+                if holder is not current:
+                    frontier.append(holder)
+
+        del self.allowed[booking.info.id]
+        self.exhausted.update(reached)
+        return None
+
+    def matched(self):
+        # In the order the bookings were offered
+        return [
+            (self.holders[resource.info.identifier], resource)
+            for resource in self.held.values()
+        ]
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+if TYPE_CHECKING:
+    from booking_server.server import ServerState
+
+# Metrics in the Prometheus text format. Everything is updated where it
+# happens, scraping only formats the current values.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+WAITING_BUCKETS = (
+    1,
+    5,
+    15,
+    30,
+    60,
+    120,
+    300,
+    600,
+    1800,
+    3600,
+    7200,
+    21600,
+    86400,
+)
+
+Sample = tuple[str, str, float]
+
+
+def escaped(value: str):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def formatted(value: float):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def label_text(names: Iterable[str], values: Iterable[str]):
+    pairs = ",".join(
+        f'{name}="{escaped(value)}"' for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(
+        self, name: str, description: str, labels: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = {}
+        if not labels:
+            self.values[()] = 0
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, value in self.values.items():
+            yield self.name, label_text(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values: str):
+        self.values[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # Observations per bucket, the last one above every bound, followed
+        # by the sum of observed values
+        self.series: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0.0] * (
+                len(self.buckets) + 2
+            )
+
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, series in self.series.items():
+            labels = label_text(self.labels, label_values)
+            count = 0.0
+            for bound, observed in zip((*self.buckets, "+Inf"), series):
+                count += observed
+                bucket_labels = label_text(
+                    (*self.labels, "le"), (*label_values, str(bound))
+                )
+                yield f"{self.name}_bucket", bucket_labels, count
+            yield f"{self.name}_sum", labels, series[-1]
+            yield f"{self.name}_count", labels, count
+
+
+Metric = Counter | Histogram
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.waiting_seconds = Histogram(
+            "booking_waiting_seconds",
+            "Time bookings waited before getting a resource.",
+            ("type",),
+            WAITING_BUCKETS,
+        )
+        self.request_seconds = Histogram(
+            "booking_http_request_seconds",
+            "Time taken to respond to HTTP requests.",
+            ("method", "route", "status"),
+        )
+        self.github_request_seconds = Histogram(
+            "booking_github_request_seconds",
+            "Time taken by GitHub API calls.",
+            ("method", "status"),
+        )
+        self.github_reruns = Counter(
+            "booking_github_reruns_total",
+            "Workflow jobs re-run for bookings that got a resource.",
+            ("result",),
+        )
+        self.github_poll_failures = Counter(
+            "booking_github_poll_failures_total",
+            "Failed polls of workflow runs, retried until the run completes.",
+            ("error",),
+        )
+        self.background_tasks = Gauge(
+            "booking_background_tasks",
+            "Background tasks running.",
+            ("kind",),
+        )
+        self.queued_tasks = Gauge(
+            "booking_queued_tasks",
+            "Background tasks waiting for a free slot of their kind.",
+            ("kind",),
+        )
+        self.task_failures = Counter(
+            "booking_task_failures_total",
+            "Background tasks that raised an exception.",
+            ("kind",),
+        )
+        self.websocket_waiters = Gauge(
+            "booking_websocket_waiters",
+            "Websocket clients waiting for bookings.",
+        )
+        self.allocator_rounds = Counter(
+            "booking_allocator_rounds_total",
+            "Matching rounds run by the allocator.",
+        )
+        self.allocator_events = Counter(
+            "booking_allocator_events_total",
+            "New bookings and freed resources handled by the allocator.",
+        )
+        self.loop_lag_seconds = Histogram(
+            "booking_loop_lag_seconds",
+            "Delay of event loop wake-ups past their due time.",
+        )
+        self.loop_stalls = Counter(
+            "booking_loop_stalls_total",
+            "Times the event loop was blocked longer than the threshold.",
+        )
+
+    def registered(self) -> list[Metric]:
+        return [
+            self.waiting_seconds,
+            self.request_seconds,
+            self.github_request_seconds,
+            self.github_reruns,
+            self.github_poll_failures,
+            self.background_tasks,
+            self.queued_tasks,
+            self.task_failures,
+            self.websocket_waiters,
+            self.allocator_rounds,
+            self.allocator_events,
+            self.loop_lag_seconds,
+            self.loop_stalls,
+        ]
+
+
+def state_gauges(server_state: ServerState):
+    # Read from the sizes kept by the queues and indexes, one value per
+    # resource type
+    waiting = Gauge(
+        "booking_waiting_bookings",
+        "Bookings waiting for a resource.",
+        ("type",),
+    )
+    for resource_type, depth in server_state.waiting_bookings.depths.items():
+        if depth:
+            waiting.set(depth, resource_type)
+
+    resources = Gauge(
+        "booking_resources",
+        "Resources by whether they are free or in use.",
+        ("type", "state"),
+    )
+    free_resources = server_state.free_resources.types_to_resources
+    for resource_type, of_type in server_state.types_to_resources.items():
+        free = len(free_resources.get(resource_type, ()))
+        resources.set(free, resource_type, "free")
+        resources.set(len(of_type) - free, resource_type, "busy")
+
+    return [waiting, resources]
+
+
+def exposition(metrics: Iterable[Metric]):
+    lines: list[str] = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(
+            f"{name}{labels} {formatted(value)}"
+            for name, labels, value in metric.samples()
+        )
+    return "\n".join(lines) + "\n"
+
+
+def route_of(scope: Scope):
+    # Route templates keep the number of label values bounded
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, metrics: Metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "websocket":
+            waiters = self.metrics.websocket_waiters
+            waiters.inc()
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                waiters.dec()
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.request_seconds.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route_of(scope),
+                str(status),
+            )
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from asyncio import Queue
+from typing import TYPE_CHECKING
+
+from booking_common.models import BookingNotification, BookingStatus
+
+if TYPE_CHECKING:
+    from booking_server.booking import Booking
+
+FINAL_STATUSES = (BookingStatus.FINISHED, BookingStatus.CANCELLED)
+
+
+def booking_notification(booking: Booking):
+    return BookingNotification(
+        id=booking.info.id,
+        version=booking.info.version,
+        status=booking.info.status,
+    )
+
+
+class NotificationHub:
+    def __init__(self) -> None:
+        self.subscribers: dict[int, set[Queue[BookingNotification]]] = {}
+
+    def subscribe(self, booking_id: int, queue: Queue[BookingNotification]):
+        self.subscribers.setdefault(booking_id, set()).add(queue)
+
+    def unsubscribe(self, booking_id: int, queue: Queue[BookingNotification]):
+        queues = self.subscribers.get(booking_id)
+        if queues is None:
+            return
+
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[booking_id]
+
+    def _queues(self, booking_id: int, status: BookingStatus):
+        if status in FINAL_STATUSES:
+            # Nothing can follow a final status
+            return self.subscribers.pop(booking_id, None)
+        return self.subscribers.get(booking_id)
+
+    def publish(self, booking: Booking):
+        queues = self._queues(booking.info.id, booking.info.status)
+        if not queues:
+            return
+
+        notification = booking_notification(booking)
+        for queue in queues:
+            queue.put_nowait(notification)
+
+    def notify(self, booking_id: int, version: int, status: BookingStatus):
+        queues = self._queues(booking_id, status)
+        if not queues:
+            return
+
+        notification = BookingNotification(
+            id=booking_id, version=version, status=status
+        )
+        for queue in queues:
+            queue.put_nowait(notification)
@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+import pickle
+import struct
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, TypeVar
+
+from booking_common.models import (
+    BookingInfo,
+    BookingStatus,
+    JobInfo,
+    RequestedResource,
+    ResourceInfo,
+)
+from booking_server.booking import Booking, shard_booking_id
+from booking_server.custom_asyncio import alist
+from booking_server.resource import Resource, index_resources
+from booking_server.scheduler import TimerKind
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from booking_server.server import ServerState
+
+SNAPSHOT_FILE = "snapshot"
+SEGMENT_SUFFIX = ".wal"
+FRAME_HEADER = struct.Struct("<I")
+
+STATUSES = {status.value: status for status in BookingStatus}
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class StateJournal:
+    def booking_added(self, booking: Booking):
+        pass
+
+    def booking_reserved(self, booking: Booking, resource: Resource):
+        pass
+
+    def booking_assigned(self, booking: Booking, resource: Resource):
+        pass
+
+    def booking_closed(self, booking: Booking, closing_time: datetime):
+        pass
+
+    def booking_archived(self, booking: Booking):
+        pass
+
+    def resource_added(self, resource: Resource):
+        pass
+
+    def resource_removed(self, resource: Resource):
+        pass
+
+    def resource_retired(self, resource: Resource):
+        pass
+
+    def resource_reinstated(self, resource: Resource):
+        pass
+
+
+def booking_row(info: BookingInfo):
+    github = info.github
+    return (
+        info.id,
+        info.name,
+        info.resource.type,
+        info.resource.identifier,
+        info.start_time,
+        info.end_time,
+        (
+            None
+            if github is None
+            else (
+                github.run_id,
+                github.job_id,
+                github.repo_owner,
+                github.repo_name,
+            )
+        ),
+        info.booking_time,
+        info.status.value,
+        info.version,
+        info.priority,
+    )
+
+
+def construct(model_type: type[ModelT], **values: Any) -> ModelT:
+    # Rows are only written from validated models, so they are not validated
+    # again. Every field is given, which makes them all set.
+    return model_type.model_construct(set(values), **values)
+
+
+def booking_info(row: tuple):
+    # Rows are only written from already validated models
+    github = row[6]
+    return construct(
+        BookingInfo,
+        name=row[1],
+        resource=construct(RequestedResource, type=row[2], identifier=row[3]),
+        start_time=row[4],
+        end_time=row[5],
+        github=(
+            None
+            if github is None
+            else construct(
+                JobInfo,
+                run_id=github[0],
+                job_id=github[1],
+                repo_owner=github[2],
+                repo_name=github[3],
+            )
+        ),
+        id=row[0],
+        booking_time=row[7],
+        status=STATUSES[row[8]],
+        version=row[9],
+        priority=row[10],
+    )
+
+
+def segment_path(directory: Path, segment: int):
+    return directory / f"{segment:010d}{SEGMENT_SUFFIX}"
+
+
+def segment_numbers(directory: Path):
+    return sorted(
+        int(path.stem) for path in directory.glob(f"*{SEGMENT_SUFFIX}")
+    )
+
+
+def read_frames(path: Path):
+    with open(path, "rb") as file:
+        data = file.read()
+
+    offset = 0
+    while offset + FRAME_HEADER.size <= len(data):
+        (length,) = FRAME_HEADER.unpack_from(data, offset)
+        offset += FRAME_HEADER.size
+        if offset + length > len(data):
+            # Torn write at the end of the last segment before a crash
+            break
+        yield data[offset : offset + length]
+        offset += length
+
+
+def write_frame(file: BinaryIO, payload: bytes):
+    file.write(FRAME_HEADER.pack(len(payload)))
+    file.write(payload)
+
+
+def empty_raw_state() -> dict[str, Any]:
+    return {
+        "segment": 0,
+        "booking_id_counter": 0,
+        "resources": {},
+        # Removed while in use, dropped for good once released
+        "retired_resources": set(),
+        "bookings": {},
+    }
+
+
+def transitioned(row: tuple, status: str):
+    return row[:8] + (status, row[9] + 1) + row[10:]
+
+
+def replay_record(raw_state: dict[str, Any], record: tuple):
+    kind = record[0]
+    # Booking entries are [row, used resource identifier, closing time,
+    # reserved resource identifier]
+    bookings: dict[int, list[Any]] = raw_state["bookings"]
+
+    retired: set[str] = raw_state["retired_resources"]
+
+    if kind == "resource_added":
+        raw_state["resources"][record[2]] = record[1:]
+        retired.discard(record[2])
+    elif kind == "resource_removed":
+        raw_state["resources"].pop(record[1], None)
+        retired.discard(record[1])
+    elif kind == "resource_retired":
+        retired.add(record[1])
+    elif kind == "resource_reinstated":
+        retired.discard(record[1])
+    elif kind == "booking_added":
+        row = record[1]
+        bookings[row[0]] = [row, None, None, None]
+        raw_state["booking_id_counter"] = max(
+            raw_state["booking_id_counter"], row[0] + 1
+        )
+    elif kind == "booking_reserved":
+        bookings[record[1]][3] = record[2]
+    elif kind == "booking_assigned":
+        booking = bookings[record[1]]
+        booking[0] = transitioned(booking[0], BookingStatus.ON.value)
+        booking[1] = record[2]
+    elif kind == "booking_closed":
+        booking = bookings[record[1]]
+        booking[0] = transitioned(booking[0], record[2])
+        booking[2] = record[3]
+    elif kind == "booking_archived":
+        bookings.pop(record[1], None)
+
+
+def load_raw_state(directory: Path, up_to_segment: None | int = None):
+    snapshot_path = directory / SNAPSHOT_FILE
+    if snapshot_path.exists():
+        raw_state = pickle.loads(next(read_frames(snapshot_path)))
+    else:
+        raw_state = empty_raw_state()
+
+    for segment in segment_numbers(directory):
+        if segment < raw_state["segment"]:
+            continue
+        if up_to_segment is not None and segment >= up_to_segment:
+            break
+        for frame in read_frames(segment_path(directory, segment)):
+            for record in pickle.loads(frame):
+                replay_record(raw_state, record)
+        raw_state["segment"] = segment + 1
+
+    return raw_state
+
+
+def compact(directory: Path, up_to_segment: int):
+    raw_state = load_raw_state(directory, up_to_segment)
+    raw_state["segment"] = up_to_segment
+
+    temporary_path = directory / f"{SNAPSHOT_FILE}.tmp"
+    with open(temporary_path, "wb") as snapshot:
+        write_frame(snapshot, pickle.dumps(raw_state, pickle.HIGHEST_PROTOCOL))
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(temporary_path, directory / SNAPSHOT_FILE)
+
+    for segment in segment_numbers(directory):
+        if segment < up_to_segment:
+            segment_path(directory, segment).unlink()
+
+
+@contextmanager
+def paused_gc():
+    # Collections triggered by an allocation burst would traverse the whole
+    # growing state each time
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+
+def restore_server_state(raw_state: dict[str, Any], server_state: ServerState):
+    server_state.booking_id_counter = shard_booking_id(
+        raw_state["booking_id_counter"], server_state
+    )
+
+    retired = raw_state["retired_resources"]
+    index_resources(
+        [
+            construct(
+                Resource,
+                info=construct(
+                    ResourceInfo,
+                    type=resource_type,
+                    identifier=identifier,
+                    label=label,
+                ),
+                used_by=None,
+                bookings=alist(),
+                encoded=None,
+                retired=identifier in retired,
+            )
+            for resource_type, identifier, label in raw_state[
+                "resources"
+            ].values()
+        ],
+        server_state,
+    )
+
+    closed_bookings: list[tuple[datetime, Booking]] = []
+    timers: list[tuple[datetime, TimerKind, int]] = []
+    for booking_id in sorted(raw_state["bookings"]):
+        row, used_identifier, closing_time, reserved_identifier = raw_state[
+            "bookings"
+        ][booking_id]
+        # Closed bookings can refer to resources removed since
+        used_resource = (
+            server_state.ids_to_resources.get(used_identifier)
+            if used_identifier is not None
+            else None
+        )
+        reserved_resource = (
+            server_state.ids_to_resources.get(reserved_identifier)
+            if reserved_identifier is not None
+            else None
+        )
+        booking = construct(
+            Booking,
+            info=booking_info(row),
+            used_resource=used_resource,
+            reserved_resource=reserved_resource,
+            encoded=None,
+        )
+        server_state.ids_to_bookings[booking_id] = booking
+        server_state.booking_indexes.add(booking)
+
+        status = booking.info.status
+        if status in (BookingStatus.WAITING, BookingStatus.ON):
+            timers.append(
+                (booking.info.end_time, TimerKind.EXPIRE, booking_id)
+            )
+
+        if status == BookingStatus.WAITING and reserved_resource is not None:
+            server_state.calendar.add(reserved_resource, booking)
+            server_state.waiting_bookings.reserved(booking)
+            timers.append(
+                (booking.info.start_time, TimerKind.ACTIVATE, booking_id)
+            )
+        elif status == BookingStatus.WAITING:
+            server_state.waiting_bookings.add(booking)
+        elif status == BookingStatus.ON and used_resource is not None:
+            used_resource.used_by = booking
+            server_state.free_resources.remove(used_resource)
+            server_state.calendar.add(used_resource, booking)
+        elif closing_time is not None:
+            closed_bookings.append((closing_time, booking))
+
+    closed_bookings.sort(key=lambda closed: closed[0])
+    server_state.closed_bookings.extend(closed_bookings)
+    server_state.timers.add_many(timers)
+
+
+class WriteAheadLog(StateJournal):
+    def __init__(
+        self,
+        directory: Path,
+        segment: int,
+        flush_interval: float,
+        snapshot_interval: float,
+    ) -> None:
+        self.directory = directory
+        self.segment = segment
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.pending: list[tuple] = []
+        self.has_pending = asyncio.Event()
+        self.write_lock = asyncio.Lock()
+        self.writing: None | asyncio.Future = None
+        self.file = open(  # pylint: disable=consider-using-with
+            segment_path(directory, segment), "ab"
+        )
+
+    def _append(self, record: tuple):
+        self.pending.append(record)
+        self.has_pending.set()
+
+    def booking_added(self, booking: Booking):
+        self._append(("booking_added", booking_row(booking.info)))
+
+    def booking_reserved(self, booking: Booking, resource: Resource):
+        self._append(
+            ("booking_reserved", booking.info.id, resource.info.identifier)
+        )
+
+    def booking_assigned(self, booking: Booking, resource: Resource):
+        self._append(
+            ("booking_assigned", booking.info.id, resource.info.identifier)
+        )
+
+    def booking_closed(self, booking: Booking, closing_time: datetime):
+        self._append(
+            (
+                "booking_closed",
+                booking.info.id,
+                booking.info.status.value,
+                closing_time,
+            )
+        )
+
+    def booking_archived(self, booking: Booking):
+        self._append(("booking_archived", booking.info.id))
+
+    def resource_added(self, resource: Resource):
+        self._append(
+            (
+                "resource_added",
+                resource.info.type,
+                resource.info.identifier,
+                resource.info.label,
+            )
+        )
+
+    def resource_removed(self, resource: Resource):
+        self._append(("resource_removed", resource.info.identifier))
+
+    def resource_retired(self, resource: Resource):
+        self._append(("resource_retired", resource.info.identifier))
+
+    def resource_reinstated(self, resource: Resource):
+        self._append(("resource_reinstated", resource.info.identifier))
+
+    def _write(self, records: list[tuple]):
+        write_frame(self.file, pickle.dumps(records, pickle.HIGHEST_PROTOCOL))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _rotate(self):
+        self.file.close()
+        self.segment += 1
+        self.file = open(  # pylint: disable=consider-using-with
+            segment_path(self.directory, self.segment), "ab"
+        )
+
+    async def _in_writer(self, function: Callable[..., None], *args: Any):
+        # A cancelled caller leaves its thread running on the file, so the
+        # next one waits for it to finish instead of writing alongside
+        while self.writing is not None and not self.writing.done():
+            await asyncio.wait([self.writing])
+        self.writing = asyncio.ensure_future(
+            asyncio.to_thread(function, *args)
+        )
+        await asyncio.shield(self.writing)
+
+    async def _flush(self):
+        if not self.pending:
+            return
+
+        records, self.pending = self.pending, []
+        self.has_pending.clear()
+        await self._in_writer(self._write, records)
+
+    async def flush(self):
+        async with self.write_lock:
+            await self._flush()
+
+    async def snapshot(self):
+        async with self.write_lock:
+            await self._flush()
+            await self._in_writer(self._rotate)
+            segment = self.segment
+        await asyncio.to_thread(compact, self.directory, segment)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_snapshot = loop.time() + self.snapshot_interval
+
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.has_pending.wait(),
+                    max(next_snapshot - loop.time(), 0),
+                )
+            except TimeoutError:
+                pass
+
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+            if loop.time() >= next_snapshot:
+                await self.snapshot()
+                next_snapshot = loop.time() + self.snapshot_interval
+
+
+async def open_write_ahead_log(
+    directory: Path,
+    server_state: ServerState,
+    flush_interval: float,
+    snapshot_interval: float,
+):
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with paused_gc():
+        raw_state = await asyncio.to_thread(load_raw_state, directory)
+        restore_server_state(raw_state, server_state)
+
+    return WriteAheadLog(
+        directory,
+        raw_state["segment"],
+        flush_interval,
+        snapshot_interval,
+    )
@@ -0,0 +1,406 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
+
+from booking_server.booking import (
+    Booking,
+    BookingFilter,
+    booking_response,
+    encoded_booking,
+)
+from booking_server.feed import ChangeEvent, ChangeFeed
+from booking_server.notifications import NotificationHub
+from booking_server.persistence import STATUSES
+from booking_server.resource import Resource, ResourceFilter, encoded_resource
+
+if TYPE_CHECKING:
+    from booking_server.server import ServerState
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS bookings (id INTEGER PRIMARY KEY,"
+    " status TEXT NOT NULL, type TEXT NOT NULL, identifier TEXT,"
+    " used_identifier TEXT, repo_owner TEXT, start_time REAL NOT NULL,"
+    " end_time REAL NOT NULL, version INTEGER NOT NULL,"
+    " booking BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS bookings_by_status ON bookings (status, id)",
+    "CREATE INDEX IF NOT EXISTS bookings_by_type ON bookings (type, id)",
+    "CREATE INDEX IF NOT EXISTS bookings_by_identifier"
+    " ON bookings (identifier, id)",
+    "CREATE INDEX IF NOT EXISTS bookings_by_used_identifier"
+    " ON bookings (used_identifier, id)",
+    "CREATE INDEX IF NOT EXISTS bookings_by_repo_owner"
+    " ON bookings (repo_owner, id)",
+    "CREATE TABLE IF NOT EXISTS resources (identifier TEXT PRIMARY KEY,"
+    " type TEXT NOT NULL, free INTEGER NOT NULL, resource BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS resources_by_type"
+    " ON resources (type, identifier)",
+    "CREATE TABLE IF NOT EXISTS changes (sequence INTEGER PRIMARY KEY,"
+    " booking_id INTEGER, version INTEGER, status TEXT,"
+    " event TEXT NOT NULL)",
+    # Bookings archived by the server, in the order they were archived
+    "CREATE TABLE IF NOT EXISTS archived_bookings (position INTEGER PRIMARY"
+    " KEY, id INTEGER NOT NULL UNIQUE, version INTEGER NOT NULL,"
+    " status TEXT NOT NULL, booking BLOB NOT NULL)",
+)
+
+UPSERT_BOOKING = (
+    "INSERT OR REPLACE INTO bookings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+UPSERT_RESOURCE = "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?)"
+INSERT_CHANGE = "INSERT OR REPLACE INTO changes VALUES (?, ?, ?, ?, ?)"
+ARCHIVE_BOOKING = (
+    "INSERT OR REPLACE INTO archived_bookings (id, version, status, booking)"
+    " SELECT id, version, status, booking FROM bookings WHERE id = ?"
+)
+
+T = TypeVar("T")
+
+
+def timestamp(value: str):
+    return datetime.fromisoformat(value).timestamp()
+
+
+def booking_columns(booking: Booking):
+    info = booking.info
+    used_resource = booking.used_resource
+    return (
+        info.id,
+        info.status.value,
+        info.resource.type,
+        info.resource.identifier,
+        used_resource.info.identifier if used_resource else None,
+        info.github.repo_owner if info.github else None,
+        info.start_time.timestamp(),
+        info.end_time.timestamp(),
+        info.version,
+        encoded_booking(booking),
+    )
+
+
+def decoded_booking_columns(response: dict[str, Any]):
+    info = response["info"]
+    used_resource = response["used_resource"]
+    github = info["github"]
+    return (
+        info["id"],
+        info["status"],
+        info["resource"]["type"],
+        info["resource"]["identifier"],
+        used_resource["identifier"] if used_resource else None,
+        github["repo_owner"] if github else None,
+        timestamp(info["start_time"]),
+        timestamp(info["end_time"]),
+        info["version"],
+        json.dumps(
+            response, ensure_ascii=False, separators=(",", ":")
+        ).encode(),
+    )
+
+
+def resource_columns(resource: Resource):
+    return (
+        resource.info.identifier,
+        resource.info.type,
+        resource.used_by is None,
+        encoded_resource(resource),
+    )
+
+
+def decoded_resource_columns(resource: dict[str, Any]):
+    info = resource["info"]
+    return (
+        info["identifier"],
+        info["type"],
+        resource["used_by"] is None,
+        json.dumps(
+            resource, ensure_ascii=False, separators=(",", ":")
+        ).encode(),
+    )
+
+
+class ReplicaStore:
+    # Read model of the server state shared with read worker processes.
+    # Only the allocating server process writes to it.
+    def __init__(self, path: Path, archived_kept: int = 0) -> None:
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False
+        )
+        self.write_lock = Lock()
+        # Archived bookings are still served by id like from the archive of
+        # the server, only the latest ones
+        self.archived_kept = archived_kept
+        # Read workers query on a thread of their own, off their event loop
+        self.reader = ThreadPoolExecutor(1, "replica-reader")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # The replica is rebuilt from the server state on every start
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    async def read(self, query: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.reader, query, *args
+        )
+
+    def last_sequence(self) -> int:
+        (sequence,) = self.connection.execute(
+            "SELECT coalesce(max(sequence), 0) FROM changes"
+        ).fetchone()
+        return sequence
+
+    def booking_versions(self) -> dict[int, int]:
+        return dict(
+            self.connection.execute("SELECT id, version FROM bookings")
+        )
+
+    def resync(
+        self,
+        bookings: list[tuple],
+        resources: list[tuple],
+        changes: list[tuple],
+        reset: bool,
+    ):
+        with self.write_lock, self.connection:
+            if reset:
+                self.connection.execute("DELETE FROM bookings")
+                self.connection.execute("DELETE FROM archived_bookings")
+            self.connection.executemany(UPSERT_BOOKING, bookings)
+            self.connection.execute("DELETE FROM resources")
+            self.connection.executemany(UPSERT_RESOURCE, resources)
+            self.connection.executemany(INSERT_CHANGE, changes)
+
+    def write_changes(self, events: list[tuple[int, str]], history_size: int):
+        bookings: list[tuple] = []
+        resources: list[tuple] = []
+        removed: list[tuple[str]] = []
+        changes: list[tuple] = []
+
+        for sequence, event in events:
+            decoded = json.loads(event)
+            booking = decoded["booking"]
+            resource = decoded["resource"]
+
+            if booking is not None:
+                info = booking["info"]
+                bookings.append(decoded_booking_columns(booking))
+                changes.append(
+                    (
+                        sequence,
+                        info["id"],
+                        info["version"],
+                        info["status"],
+                        event,
+                    )
+                )
+                continue
+
+            if decoded["resource_removed"]:
+                removed.append((resource["info"]["identifier"],))
+            else:
+                resources.append(decoded_resource_columns(resource))
+            changes.append((sequence, None, None, None, event))
+
+        with self.write_lock, self.connection:
+            self.connection.executemany(UPSERT_BOOKING, bookings)
+            self.connection.executemany(UPSERT_RESOURCE, resources)
+            self.connection.executemany(
+                "DELETE FROM resources WHERE identifier = ?", removed
+            )
+            self.connection.executemany(INSERT_CHANGE, changes)
+            self.connection.execute(
+                "DELETE FROM changes WHERE sequence <= ?",
+                (events[-1][0] - history_size,),
+            )
+
+    def archive_bookings(self, booking_ids: list[int]):
+        ids = [(booking_id,) for booking_id in booking_ids]
+        with self.write_lock, self.connection:
+            self.connection.executemany(ARCHIVE_BOOKING, ids)
+            self.connection.executemany(
+                "DELETE FROM bookings WHERE id = ?", ids
+            )
+            self.connection.execute(
+                "DELETE FROM archived_bookings WHERE position <="
+                " (SELECT max(position) FROM archived_bookings) - ?",
+                (self.archived_kept,),
+            )
+
+    def booking(self, booking_id: int) -> None | bytes:
+        row = self.connection.execute(
+            "SELECT booking FROM bookings WHERE id = ? UNION ALL"
+            " SELECT booking FROM archived_bookings WHERE id = ?",
+            (booking_id, booking_id),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def booking_status(self, booking_id: int):
+        row = self.connection.execute(
+            "SELECT version, status FROM bookings WHERE id = ? UNION ALL"
+            " SELECT version, status FROM archived_bookings WHERE id = ?",
+            (booking_id, booking_id),
+        ).fetchone()
+        return None if row is None else (row[0], STATUSES[row[1]])
+
+    def bookings(
+        self, booking_filter: BookingFilter, after: int, limit: int
+    ) -> list[tuple[int, bytes]]:
+        conditions = ["id > ?"]
+        parameters: list[Any] = [after]
+        if booking_filter.status is not None:
+            conditions.append("status = ?")
+            parameters.append(booking_filter.status.value)
+        if booking_filter.type is not None:
+            conditions.append("type = ?")
+            parameters.append(booking_filter.type)
+        if booking_filter.identifier is not None:
+            conditions.append("(identifier = ? OR used_identifier = ?)")
+            parameters += [booking_filter.identifier] * 2
+        if booking_filter.repo_owner is not None:
+            conditions.append("repo_owner = ?")
+            parameters.append(booking_filter.repo_owner)
+        if booking_filter.from_time is not None:
+            conditions.append("end_time > ?")
+            parameters.append(booking_filter.from_time.timestamp())
+        if booking_filter.until_time is not None:
+            conditions.append("start_time < ?")
+            parameters.append(booking_filter.until_time.timestamp())
+
+        return self.connection.execute(
+            f"SELECT id, booking FROM bookings WHERE {' AND '.join(conditions)}"
+            " ORDER BY id LIMIT ?",
+            (*parameters, limit),
+        ).fetchall()
+
+    def resources(
+        self, resource_filter: ResourceFilter, after: None | str, limit: int
+    ) -> list[tuple[str, bytes]]:
+        conditions = ["identifier > ?"]
+        parameters: list[Any] = ["" if after is None else after]
+        if resource_filter.type is not None:
+            conditions.append("type = ?")
+            parameters.append(resource_filter.type)
+        if resource_filter.identifier is not None:
+            conditions.append("identifier = ?")
+            parameters.append(resource_filter.identifier)
+        if resource_filter.free is not None:
+            conditions.append("free = ?")
+            parameters.append(resource_filter.free)
+
+        return self.connection.execute(
+            "SELECT identifier, resource FROM resources WHERE"
+            f" {' AND '.join(conditions)} ORDER BY identifier LIMIT ?",
+            (*parameters, limit),
+        ).fetchall()
+
+    def changes(self, after: int, limit: int):
+        return self.connection.execute(
+            "SELECT sequence, booking_id, version, status, event FROM changes"
+            " WHERE sequence > ? ORDER BY sequence LIMIT ?",
+            (after, limit),
+        ).fetchall()
+
+
+async def resync_replica(
+    store: ReplicaStore, server_state: ServerState, reset: bool
+):
+    # Bookings changed while no server was publishing get a change event so
+    # that waiters on read workers hear about them
+    versions = {} if reset else await asyncio.to_thread(store.booking_versions)
+    sequence = await asyncio.to_thread(store.last_sequence)
+
+    # Archived while no server was publishing
+    archived = [
+        booking_id
+        for booking_id in versions
+        if booking_id not in server_state.ids_to_bookings
+    ]
+    if archived:
+        await asyncio.to_thread(store.archive_bookings, archived)
+
+    bookings: list[tuple] = []
+    changes: list[tuple] = []
+    for booking in server_state.ids_to_bookings.values():
+        info = booking.info
+        if versions.get(info.id) == info.version:
+            continue
+
+        sequence += 1
+        event = ChangeEvent(
+            sequence=sequence, booking=booking_response(booking)
+        )
+        bookings.append(booking_columns(booking))
+        changes.append(
+            (
+                sequence,
+                info.id,
+                info.version,
+                info.status.value,
+                event.model_dump_json(),
+            )
+        )
+
+    resources = [
+        resource_columns(resource) for resource in server_state.resources
+    ]
+    await asyncio.to_thread(store.resync, bookings, resources, changes, reset)
+
+    return sequence
+
+
+async def publish_changes(store: ReplicaStore, feed: ChangeFeed):
+    # Unbounded so that the replica never misses an event while a batch is
+    # being written
+    subscriber, pending = feed.subscribe(feed.sequence, buffer_size=0)
+
+    try:
+        while True:
+            if not pending:
+                pending.append(await subscriber.queue.get())
+            while not subscriber.queue.empty():
+                pending.append(subscriber.queue.get_nowait())
+
+            await asyncio.to_thread(
+                store.write_changes, pending, feed.history.maxlen or 0
+            )
+            pending = []
+    finally:
+        feed.unsubscribe(subscriber)
+
+
+async def follow_changes(
+    store: ReplicaStore,
+    feed: ChangeFeed,
+    notifications: NotificationHub,
+    poll_interval: float = 0.02,
+    max_poll_interval: float = 0.5,
+    batch_size: int = 1000,
+):
+    # SQLite can't notify other processes of commits, so the change log is
+    # polled instead, less and less often while nothing changes
+    last_sequence = await store.read(store.last_sequence)
+    since = max(last_sequence - (feed.history.maxlen or 0), 0)
+    delay = poll_interval
+
+    while True:
+        changes = await store.read(store.changes, since, batch_size)
+
+        for sequence, booking_id, version, status, event in changes:
+            feed.replay(sequence, event)
+            if booking_id is not None:
+                notifications.notify(booking_id, version, STATUSES[status])
+
+        if changes:
+            since = changes[-1][0]
+            delay = poll_interval
+        if len(changes) < batch_size:
+            await asyncio.sleep(delay)
+        if not changes:
+            delay = min(2 * delay, max_poll_interval)
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import asyncio
+from asyncio import Task
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path
+from typing import Annotated, Any, cast
+
+import uvloop
+from booking_common.models import BookingNotification, BookingResponse
+from booking_server.api import (
+    MAX_PAGE_SIZE,
+    PAGE_SIZE,
+    BookingPage,
+    ChangeFeedFormat,
+    Cursor,
+    Message,
+    PageQuery,
+    ResourcePage,
+    booking_filter_query,
+    changes_response,
+    forward_notifications,
+    page_response,
+    resource_filter_query,
+    wait_for_booking,
+)
+from booking_server.booking import BookingFilter
+from booking_server.feed import ChangeFeed
+from booking_server.notifications import NotificationHub
+from booking_server.replica import ReplicaStore, follow_changes
+from booking_server.resource import ResourceFilter
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    WebSocket,
+)
+from fastapi.responses import Response, StreamingResponse
+from hypercorn import Config
+from hypercorn.app_wrappers import ASGIWrapper
+from hypercorn.asyncio.run import worker_serve
+from hypercorn.config import Sockets
+from hypercorn.typing import ASGIFramework
+from starlette.requests import Request
+
+# Read-only endpoints served by worker processes next to the allocating
+# server, from the replica it publishes its changes to
+
+replica_router = APIRouter()
+
+
+class ReplicaApp(FastAPI):
+    store: ReplicaStore
+    feed: ChangeFeed
+    notifications: NotificationHub
+    follower: None | Task[None]
+
+    def __init__(self, *, store: ReplicaStore, **fast_api_kwargs: Any) -> None:
+        super().__init__(**fast_api_kwargs)
+        self.store = store
+        self.feed = ChangeFeed()
+        self.notifications = NotificationHub()
+        self.follower = None
+
+
+class ReplicaRequest(Request):
+    app: ReplicaApp
+
+
+class ReplicaWebSocket(WebSocket):
+    app: ReplicaApp
+
+
+async def start_following(app: ReplicaApp):
+    app.follower = asyncio.create_task(
+        follow_changes(app.store, app.feed, app.notifications)
+    )
+
+
+async def read_pages(
+    store: ReplicaStore, query: PageQuery[Cursor], after: Cursor, limit: int
+):
+    while found := await store.read(query, after, limit):
+        yield b"".join(item + b"\n" for _, item in found)
+        after = found[-1][0]
+
+
+async def read_paged_response(
+    store: ReplicaStore,
+    key: str,
+    query: PageQuery[Cursor],
+    after: Cursor,
+    limit: int,
+    stream: bool,
+):
+    if stream:
+        return StreamingResponse(
+            read_pages(store, query, after, limit),
+            media_type="application/x-ndjson",
+        )
+
+    return page_response(key, await store.read(query, after, limit), limit)
+
+
+async def replica_notification(booking_id: int, store: ReplicaStore):
+    status = await store.read(store.booking_status, booking_id)
+    if status is None:
+        return None
+
+    version, booking_status = status
+    return BookingNotification(
+        id=booking_id, version=version, status=booking_status
+    )
+
+
+@replica_router.get(
+    "/resource/all",
+    response_model=ResourcePage,
+    status_code=HTTPStatus.OK,
+)
+async def get_all_resources(
+    request: ReplicaRequest,
+    resource_filter: Annotated[ResourceFilter, Depends(resource_filter_query)],
+    after: None | str = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE,
+    stream: bool = False,
+):
+    store = request.app.store
+    return await read_paged_response(
+        store,
+        "resources",
+        partial(store.resources, resource_filter),
+        after,
+        limit,
+        stream,
+    )
+
+
+@replica_router.get(
+    "/booking/all",
+    response_model=BookingPage,
+    status_code=HTTPStatus.OK,
+)
+async def get_all_bookings(
+    request: ReplicaRequest,
+    booking_filter: Annotated[BookingFilter, Depends(booking_filter_query)],
+    after: int = -1,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE,
+    stream: bool = False,
+):
+    store = request.app.store
+    return await read_paged_response(
+        store,
+        "bookings",
+        partial(store.bookings, booking_filter),
+        after,
+        limit,
+        stream,
+    )
+
+
+@replica_router.get(
+    "/booking/{booking_id}",
+    response_model=BookingResponse,
+    status_code=HTTPStatus.OK,
+    responses={HTTPStatus.NOT_FOUND: {"model": Message}},
+)
+async def get_booking_by_id(booking_id: int, request: ReplicaRequest):
+    store = request.app.store
+    booking = await store.read(store.booking, booking_id)
+    if booking is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail={"message": f"Booking id {booking_id} doesn't exist."},
+        )
+
+    return Response(booking, media_type="application/json")
+
+
+@replica_router.websocket("/booking/{booking_id}/wait")
+async def websocket_wait_booking(booking_id: int, websocket: ReplicaWebSocket):
+    app = websocket.app
+    await wait_for_booking(
+        booking_id,
+        websocket,
+        app.notifications,
+        partial(replica_notification, store=app.store),
+    )
+
+
+@replica_router.websocket("/booking/subscribe")
+async def websocket_subscribe_bookings(websocket: ReplicaWebSocket):
+    app = websocket.app
+    await forward_notifications(
+        websocket,
+        app.notifications,
+        partial(replica_notification, store=app.store),
+    )
+
+
+@replica_router.get(
+    "/changes",
+    status_code=HTTPStatus.OK,
+    responses={
+        HTTPStatus.BAD_REQUEST: {"model": Message},
+        HTTPStatus.GONE: {"model": Message},
+    },
+)
+async def get_changes(
+    request: ReplicaRequest,
+    since: None | int = None,
+    stream: ChangeFeedFormat = ChangeFeedFormat.NDJSON,
+):
+    return changes_response(request.app.feed, request, since, stream)
+
+
+def run_read_worker(replica_path: Path, config: Config, sockets: Sockets):
+    app = ReplicaApp(store=ReplicaStore(replica_path))
+    app.include_router(replica_router)
+    app.router.on_startup.append(partial(start_following, app))
+
+    uvloop.run(
+        worker_serve(
+            ASGIWrapper(cast(ASGIFramework, app)), config, sockets=sockets
+        )
+    )
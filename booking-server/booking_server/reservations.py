@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from booking_server.booking import Booking
+    from booking_server.resource import Resource
+
+
+class ResourceCalendar:
+    def __init__(self) -> None:
+        # Intervals never overlap, so ordering them by start orders them by
+        # end as well
+        self.starts: list[datetime] = []
+        self.intervals: list[tuple[datetime, datetime, int]] = []
+
+    def is_free(self, start: datetime, end: datetime):
+        # Only the last interval starting before the end can overlap
+        position = bisect_left(self.starts, end)
+        return position == 0 or self.intervals[position - 1][1] <= start
+
+    def add(self, start: datetime, end: datetime, booking_id: int):
+        insort(self.starts, start)
+        insort(self.intervals, (start, end, booking_id))
+
+    def remove(self, start: datetime, booking_id: int):
+        position = bisect_left(self.starts, start)
+        while position < len(self.starts) and self.starts[position] == start:
+            if self.intervals[position][2] == booking_id:
+                del self.starts[position]
+                del self.intervals[position]
+                return
+            position += 1
+
+
+class Calendar:
+    def __init__(self) -> None:
+        self.resources_to_calendars: dict[str, ResourceCalendar] = {}
+
+    def is_free(self, resource: Resource, start: datetime, end: datetime):
+        calendar = self.resources_to_calendars.get(resource.info.identifier)
+        return calendar is None or calendar.is_free(start, end)
+
+    def fits(self, resource: Resource, booking: Booking):
+        return self.is_free(
+            resource, booking.info.start_time, booking.info.end_time
+        )
+
+    def add_slot(
+        self,
+        resource: Resource,
+        start: datetime,
+        end: datetime,
+        booking_id: int,
+    ):
+        self.resources_to_calendars.setdefault(
+            resource.info.identifier, ResourceCalendar()
+        ).add(start, end, booking_id)
+
+    def remove_slot(
+        self, resource: Resource, start: datetime, booking_id: int
+    ):
+        calendar = self.resources_to_calendars.get(resource.info.identifier)
+        if calendar is not None:
+            calendar.remove(start, booking_id)
+
+    def add(self, resource: Resource, booking: Booking):
+        self.add_slot(
+            resource,
+            booking.info.start_time,
+            booking.info.end_time,
+            booking.info.id,
+        )
+
+    def remove(self, resource: Resource, booking: Booking):
+        self.remove_slot(resource, booking.info.start_time, booking.info.id)
+
+    def free_resources(
+        self, resources: Iterable[Resource], start: datetime, end: datetime
+    ):
+        return [
+            resource
+            for resource in resources
+            if self.is_free(resource, start, end)
+        ]
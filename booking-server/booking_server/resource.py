@@ -1,8 +1,11 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable
 
-from booking_common.models import BookingInfo, RequestedResource, ResourceInfo
+from booking_common.models import BookingInfo, ResourceInfo
 from booking_server.custom_asyncio import alist
 from booking_server.exceptions import AlreadyExistingId
 from pydantic import BaseModel, ConfigDict, Field
@@ -18,6 +21,27 @@ class Resource(BaseModel):
     info: ResourceInfo
     used_by: None | Booking = None
     bookings: alist[Booking] = alist()
+    encoded: None | bytes = Field(default=None, exclude=True, repr=False)
+    # Removed while in use, dropped for good once released
+    retired: bool = False
+
+
+class FreeResources:
+    def __init__(self) -> None:
+        self.types_to_resources: dict[str, OrderedDict[str, Resource]] = {}
+
+    def add(self, resource: Resource):
+        free_of_type = self.types_to_resources.setdefault(
+            resource.info.type, OrderedDict()
+        )
+        free_of_type[resource.info.identifier] = resource
+
+    def remove(self, resource: Resource):
+        free_of_type = self.types_to_resources.get(resource.info.type)
+        if free_of_type is None:
+            return
+
+        free_of_type.pop(resource.info.identifier, None)
 
 
 class NewResource(BaseModel):
@@ -25,6 +49,26 @@ class NewResource(BaseModel):
 
     type: str = Field(examples=["big_machine"])
     identifier: str = Field(examples=["floor_3"])
+    label: None | str = Field(examples=["runners_host_1"], default=None)
+
+
+class ResourceBatchRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    resources: list[NewResource] = Field(max_length=1000)
+
+
+class ResourceBatchResult(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    resource: None | ResourceInfo = None
+    error: None | str = None
+
+
+class ResourceBatchResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    results: list[ResourceBatchResult]
 
 
 class DumpableResource(BaseModel):
@@ -34,13 +78,82 @@ class DumpableResource(BaseModel):
     used_by: BookingInfo | None
 
 
+class ResourceFilter(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    type: None | str = None
+    identifier: None | str = None
+    free: None | bool = None
+
+    def matches(self, resource: Resource):
+        if self.type is not None and resource.info.type != self.type:
+            return False
+        if (
+            self.identifier is not None
+            and resource.info.identifier != self.identifier
+        ):
+            return False
+        if self.free is not None and (resource.used_by is None) != self.free:
+            return False
+        return True
+
+
+def by_identifier(resource: Resource):
+    return resource.info.identifier
+
+
+def query_resources(
+    resource_filter: ResourceFilter,
+    after: None | str,
+    limit: int,
+    server_state: ServerState,
+):
+    # Candidate lists are sorted by identifier, which makes the identifier
+    # a cursor that stays valid when resources come and go
+    candidates: list[Resource]
+    if resource_filter.identifier is not None:
+        resource = server_state.ids_to_resources.get(
+            resource_filter.identifier
+        )
+        candidates = [] if resource is None else [resource]
+    elif resource_filter.type is not None:
+        candidates = server_state.types_to_resources.get(
+            resource_filter.type, []
+        )
+    else:
+        candidates = server_state.resources
+
+    start = (
+        0
+        if after is None
+        else bisect_right(candidates, after, key=by_identifier)
+    )
+    return list(
+        islice(
+            filter(resource_filter.matches, islice(candidates, start, None)),
+            limit,
+        )
+    )
+
+
 async def dumpable_resource(resource: Resource):
     used_by = resource.used_by.info if resource.used_by else None
     return DumpableResource(info=resource.info, used_by=used_by)
 
 
+def encoded_resource(resource: Resource):
+    if resource.encoded is None:
+        used_by = resource.used_by.info if resource.used_by else None
+        resource.encoded = (
+            DumpableResource(info=resource.info, used_by=used_by)
+            .model_dump_json()
+            .encode()
+        )
+    return resource.encoded
+
+
 async def dumpable_resources(
-    resources: list[Resource],
+    resources: Iterable[Resource],
 ):
     return [await dumpable_resource(resource) for resource in resources]
 
@@ -52,39 +165,126 @@ async def dumpable_ids_to_resources(ids_to_resources: dict[str, Resource]):
     }
 
 
-async def add_new_resource(
-    new_resource: NewResource,
-    server_state: ServerState,
-):
+def index_resource(resource: Resource, server_state: ServerState):
+    insort(server_state.resources, resource, key=by_identifier)
+    insort(
+        server_state.types_to_resources.setdefault(resource.info.type, []),
+        resource,
+        key=by_identifier,
+    )
+    server_state.ids_to_resources[resource.info.identifier] = resource
+    if resource.used_by is None:
+        server_state.free_resources.add(resource)
+
+
+def index_resources(resources: list[Resource], server_state: ServerState):
+    # Sorted once after all are added, inserting them one by one in place
+    # would move the rest of the lists each time
+    for resource in resources:
+        server_state.ids_to_resources[resource.info.identifier] = resource
+        # Like retire_resource left them, reachable until released
+        if resource.retired:
+            continue
+
+        server_state.resources.append(resource)
+        server_state.types_to_resources.setdefault(
+            resource.info.type, []
+        ).append(resource)
+        if resource.used_by is None:
+            server_state.free_resources.add(resource)
+
+    server_state.resources.sort(key=by_identifier)
+    for of_type in server_state.types_to_resources.values():
+        of_type.sort(key=by_identifier)
+
+
+def unindex_resource(resource: Resource, server_state: ServerState):
+    identifier = resource.info.identifier
+    of_type = server_state.types_to_resources[resource.info.type]
+    for resources in (server_state.resources, of_type):
+        del resources[bisect_left(resources, identifier, key=by_identifier)]
+    if not of_type:
+        del server_state.types_to_resources[resource.info.type]
+
+    server_state.free_resources.remove(resource)
+
+
+def check_new_resource(new_resource: NewResource, server_state: ServerState):
     if new_resource.identifier in server_state.ids_to_resources:
         raise AlreadyExistingId(
             f"Resource with identifier {new_resource.identifier} already"
             " exists."
         )
 
+
+def create_resource(new_resource: NewResource, server_state: ServerState):
     resource = Resource(info=ResourceInfo(**new_resource.model_dump()))
 
-    server_state.resources.append(resource)
-    server_state.ids_to_resources.update({resource.info.identifier: resource})
+    index_resource(resource, server_state)
+    server_state.changes.resource_changed(resource)
+    server_state.feed.resource_changed(resource)
+    server_state.journal.resource_added(resource)
 
     return resource
 
 
-def find_free_resource(
-    requested: RequestedResource, resources: list[Resource]
+async def add_new_resource(
+    new_resource: NewResource,
+    server_state: ServerState,
+):
+    check_new_resource(new_resource, server_state)
+    return create_resource(new_resource, server_state)
+
+
+def add_new_resources(
+    new_resources: list[NewResource], server_state: ServerState
 ):
-    for resource in resources:
-        if resource.info.type != requested.type:
-            continue
+    added: list[Resource | AlreadyExistingId] = []
+    for new_resource in new_resources:
+        try:
+            check_new_resource(new_resource, server_state)
+        except AlreadyExistingId as error:
+            added.append(error)
+        else:
+            added.append(create_resource(new_resource, server_state))
+    return added
 
-        if (
-            resource.info.identifier != requested.identifier
-            and requested.identifier is not None
-        ):
-            continue
 
-        if resource.used_by is not None:
-            continue
+def retire_resource(resource: Resource, server_state: ServerState):
+    # Resources in use stay reachable by identifier until released so that
+    # finishing their booking works as usual
+    unindex_resource(resource, server_state)
+    if resource.used_by is not None:
+        resource.retired = True
+        server_state.journal.resource_retired(resource)
+        return
+
+    drop_resource(resource, server_state)
+
+
+def reinstate_resource(resource: Resource, server_state: ServerState):
+    resource.retired = False
+    index_resource(resource, server_state)
+    server_state.journal.resource_reinstated(resource)
+
+
+def drop_resource(resource: Resource, server_state: ServerState):
+    del server_state.ids_to_resources[resource.info.identifier]
+    server_state.calendar.resources_to_calendars.pop(
+        resource.info.identifier, None
+    )
+    server_state.changes.resource_changed(resource)
+    server_state.feed.resource_changed(resource, removed=True)
+    server_state.journal.resource_removed(resource)
+
+
+def release_resource(resource: Resource, server_state: ServerState):
+    resource.used_by = None
+    resource.encoded = None
+    if resource.retired:
+        drop_resource(resource, server_state)
+        return
 
-        return resource
-    return None
+    server_state.free_resources.add(resource)
+    server_state.changes.resource_changed(resource)
+    server_state.feed.resource_changed(resource)
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from datetime import datetime
+from enum import IntEnum
+
+
+class TimerKind(IntEnum):
+    # Expiry sorts first so that a booking ending exactly when the next
+    # reservation of the resource starts is gone by then
+    EXPIRE = 0
+    ACTIVATE = 1
+
+
+class BookingTimers:
+    def __init__(self) -> None:
+        self.heap: list[tuple[float, TimerKind, int]] = []
+        self.added = asyncio.Event()
+
+    def add(self, when: datetime, kind: TimerKind, booking_id: int):
+        deadline = when.timestamp()
+        if not self.heap or deadline < self.heap[0][0]:
+            self.added.set()
+        heapq.heappush(self.heap, (deadline, kind, booking_id))
+
+    def add_many(self, timers: list[tuple[datetime, TimerKind, int]]):
+        self.heap.extend(
+            (when.timestamp(), kind, booking_id)
+            for when, kind, booking_id in timers
+        )
+        heapq.heapify(self.heap)
+        self.added.set()
+
+    def pop_due(self, limit: int):
+        # Timers of closed bookings are left in the heap and skipped here
+        # instead of being searched for and removed
+        now = time.time()
+        due: list[tuple[TimerKind, int]] = []
+        while self.heap and self.heap[0][0] <= now and len(due) < limit:
+            _, kind, booking_id = heapq.heappop(self.heap)
+            due.append((kind, booking_id))
+        return due
+
+    async def wait(self):
+        self.added.clear()
+        timeout = self.heap[0][0] - time.time() if self.heap else None
+        try:
+            await asyncio.wait_for(self.added.wait(), timeout)
+        except TimeoutError:
+            pass
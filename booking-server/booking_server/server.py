@@ -1,38 +1,81 @@
 from __future__ import annotations
 
 import asyncio
-import json
-from asyncio import Task
+from collections import deque
+from datetime import datetime
+from pathlib import Path
 from typing import Any, Coroutine
 
 from aioconsole import aprint  # type: ignore
+from booking_server.allocator import Allocator
+from booking_server.archive import BookingArchive, archive_closed_bookings
 from booking_server.booking import (
     Booking,
+    BookingIndexes,
     BookingResponse,
+    WaitingBookings,
     dumpable_bookings,
     dumpable_ids_to_bookings,
 )
-from booking_server.custom_asyncio import alist
+from booking_server.broker import (
+    activate_reserved_booking,
+    expire_booking,
+    re_run_github_job,
+)
+from booking_server.changes import StateChanges
+from booking_server.diagnostics import LoopMonitor
+from booking_server.feed import ChangeFeed
+from booking_server.github import GitHubClient
+from booking_server.metrics import Metrics, MetricsMiddleware
+from booking_server.notifications import NotificationHub
+from booking_server.persistence import StateJournal, open_write_ahead_log
+from booking_server.replica import (
+    ReplicaStore,
+    publish_changes,
+    resync_replica,
+)
+from booking_server.reservations import Calendar
 from booking_server.resource import (
     DumpableResource,
+    FreeResources,
     Resource,
     dumpable_ids_to_resources,
     dumpable_resources,
 )
+from booking_server.scheduler import BookingTimers, TimerKind
+from booking_server.supervisor import TaskKind, TaskSupervisor
 from fastapi import FastAPI, WebSocket
-from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from starlette.requests import Request
 
 
 class ServerState(BaseModel):
-    model_config = ConfigDict(extra="forbid")
+    model_config = ConfigDict(extra="forbid", arbitrary_types_allowed=True)
 
+    # Booking ids of a shard are congruent to its index modulo the shard
+    # count, so that the shard of a booking is known from its id alone
+    shard_index: int = 0
+    shard_count: int = 1
     booking_id_counter: int = 0
-    bookings: list[Booking] = []
     resources: list[Resource] = []
+    types_to_resources: dict[str, list[Resource]] = {}
     ids_to_bookings: dict[int, Booking] = {}
+    booking_indexes: BookingIndexes = Field(default_factory=BookingIndexes)
     ids_to_resources: dict[str, Resource] = {}
+    free_resources: FreeResources = Field(default_factory=FreeResources)
+    waiting_bookings: WaitingBookings = Field(default_factory=WaitingBookings)
+    calendar: Calendar = Field(default_factory=Calendar)
+    timers: BookingTimers = Field(default_factory=BookingTimers)
+    closed_bookings: deque[tuple[datetime, Booking]] = Field(
+        default_factory=deque
+    )
+    changes: StateChanges = Field(default_factory=StateChanges)
+    journal: StateJournal = Field(default_factory=StateJournal)
+    notifications: NotificationHub = Field(default_factory=NotificationHub)
+    feed: ChangeFeed = Field(default_factory=ChangeFeed)
+    allocator: Allocator = Field(default_factory=Allocator)
+    metrics: Metrics = Field(default_factory=Metrics)
+    replica: None | ReplicaStore = None
 
 
 class DumpableServerState(BaseModel):
@@ -45,20 +88,66 @@ class DumpableServerState(BaseModel):
     ids_to_resources: dict[str, DumpableResource]
 
 
+class DumpableStateChanges(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    booking_id_counter: int
+    bookings: list[BookingResponse]
+    resources: list[DumpableResource]
+
+
 DumpableServerState.model_rebuild()
+DumpableStateChanges.model_rebuild()
 ServerState.model_rebuild()
 
 
 def fire_and_forget(
-    app: BookingApp, background_routine: Coroutine[Any, Any, None]
+    app: BookingApp,
+    background_routine: Coroutine[Any, Any, None],
+    kind: TaskKind = TaskKind.SERVICE,
+):
+    app.supervisor.spawn(kind, background_routine)
+
+
+async def restore_persisted_state(
+    app: BookingApp,
+    directory: Path,
+    flush_interval: float,
+    snapshot_interval: float,
 ):
-    background_task = asyncio.create_task(background_routine)
-    app.background_tasks.append(background_task)
+    server_state = app.server_state
+
+    journal = await open_write_ahead_log(
+        directory, server_state, flush_interval, snapshot_interval
+    )
+    server_state.journal = journal
+    fire_and_forget(app, journal.run())
+    app.router.on_shutdown.append(journal.flush)
+
+    for resource in server_state.resources:
+        server_state.allocator.resource_freed(resource)
+
+
+async def start_replica_publisher(app: BookingApp, path: Path, reset: bool):
+    server_state = app.server_state
+
+    store = await asyncio.to_thread(
+        ReplicaStore, path, app.booking_archive.capacity
+    )
+    # Sequence numbers continue from the replica so that read workers keep
+    # following it over restarts
+    server_state.feed.sequence = await resync_replica(
+        store, server_state, reset
+    )
+    server_state.replica = store
+    fire_and_forget(app, publish_changes(store, server_state.feed))
 
 
 async def dumpable_server_state(server_state: ServerState):
     return DumpableServerState(
-        bookings=await dumpable_bookings(server_state.bookings),
+        bookings=await dumpable_bookings(
+            server_state.ids_to_bookings.values()
+        ),
         resources=await dumpable_resources(server_state.resources),
         booking_id_counter=server_state.booking_id_counter,
         ids_to_bookings=await dumpable_ids_to_bookings(
@@ -70,49 +159,106 @@ async def dumpable_server_state(server_state: ServerState):
     )
 
 
+async def dumpable_state_changes(server_state: ServerState):
+    bookings, resources = server_state.changes.take()
+    return DumpableStateChanges(
+        booking_id_counter=server_state.booking_id_counter,
+        bookings=await dumpable_bookings(bookings.values()),
+        resources=await dumpable_resources(resources.values()),
+    )
+
+
 async def periodic_cleanup(
-    server_state: ServerState, background_tasks: alist[Task[Any]]
+    server_state: ServerState,
+    supervisor: TaskSupervisor,
+    booking_archive: BookingArchive,
 ):
-    # TODO: Implement
     # TODO: Could be also ran from endpoint handlers when lists get too big
     while True:
         await aprint(
             "===============================CLEANUP=============================="
         )
+        archived = await archive_closed_bookings(server_state, booking_archive)
+        await aprint(f"Archived {archived} closed bookings.")
+        state_changes = await dumpable_state_changes(server_state)
         await aprint(
-            "I could clean something, but here is current server data:"
+            f"Changed {len(state_changes.bookings)} bookings and"
+            f" {len(state_changes.resources)} resources:"
         )
-        server_state_snapshot = await dumpable_server_state(server_state)
-        await aprint(
-            json.dumps(jsonable_encoder(server_state_snapshot), indent=2)
-        )
-        await aprint(f"Background tasks running {len(background_tasks)}.")
-        background_tasks[:] = [
-            task async for task in background_tasks if not task.done()
-        ]
-        await aprint(f"Background tasks left {len(background_tasks)}.")
+        if state_changes.bookings or state_changes.resources:
+            await aprint(state_changes.model_dump_json())
+        for kind, (running, queued) in supervisor.counts().items():
+            await aprint(
+                f"Background {kind.value} tasks running {running}, queued"
+                f" {queued}."
+            )
         await asyncio.sleep(10)
 
 
+async def run_booking_timers(app: BookingApp, batch_size: int = 1000):
+    server_state = app.server_state
+    timers = server_state.timers
+
+    while True:
+        due = timers.pop_due(batch_size)
+
+        for kind, booking_id in due:
+            booking = server_state.ids_to_bookings.get(booking_id)
+            if booking is None:
+                continue
+
+            if kind == TimerKind.ACTIVATE:
+                github = booking.info.github
+                if (
+                    activate_reserved_booking(booking, server_state)
+                    and github is not None
+                ):
+                    fire_and_forget(
+                        app,
+                        re_run_github_job(github, app.github_client),
+                        TaskKind.GITHUB,
+                    )
+            else:
+                freed_resource = expire_booking(booking, server_state)
+                if freed_resource is not None:
+                    server_state.allocator.resource_freed(freed_resource)
+
+        if len(due) == batch_size:
+            # Let requests through between batches of a backlog of timers
+            await asyncio.sleep(0)
+        else:
+            await timers.wait()
+
+
 class BookingApp(FastAPI):
     server_state: ServerState
-    background_tasks: alist[Task[Any]]
-    github_token: str
+    supervisor: TaskSupervisor
+    booking_archive: BookingArchive
+    github_client: GitHubClient
+    loop_monitor: LoopMonitor
+    admin_token: None | str
 
     def __init__(
         self,
         *,
-        github_token: str,
+        github_client: GitHubClient,
+        booking_archive: BookingArchive,
         server_state: ServerState = ServerState(),
-        background_tasks: alist[Task] = alist([]),
+        supervisor: None | TaskSupervisor = None,
+        loop_monitor: None | LoopMonitor = None,
+        admin_token: None | str = None,
         **fast_api_kwargs: Any,
     ) -> None:
         super().__init__(
             **fast_api_kwargs,
         )
         self.server_state = server_state
-        self.background_tasks = background_tasks
-        self.github_token = github_token
+        self.supervisor = supervisor or TaskSupervisor(server_state.metrics)
+        self.booking_archive = booking_archive
+        self.github_client = github_client
+        self.loop_monitor = loop_monitor or LoopMonitor(server_state.metrics)
+        self.admin_token = admin_token
+        self.add_middleware(MetricsMiddleware, metrics=server_state.metrics)
 
 
 class AppRequest(Request):
@@ -0,0 +1,749 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import heapq
+import json
+import zlib
+from dataclasses import dataclass
+from functools import partial
+from http import HTTPStatus
+from itertools import islice
+from typing import Any, Callable, Iterable, cast
+
+import aiohttp
+import uvloop
+from booking_common.models import (
+    BookingBatchRequest,
+    BookingBatchResponse,
+    BookingBatchResult,
+    BookingRequest,
+    BookingSubscription,
+    ResourceInventory,
+    ResourceInventoryChanges,
+)
+from booking_server.api import PAGE_SIZE
+from booking_server.resource import (
+    NewResource,
+    ResourceBatchRequest,
+    ResourceBatchResponse,
+)
+from fastapi import (
+    APIRouter,
+    FastAPI,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from hypercorn import Config
+from hypercorn.app_wrappers import ASGIWrapper
+from hypercorn.asyncio.run import worker_serve
+from hypercorn.typing import ASGIFramework
+from pydantic import BaseModel, ConfigDict
+from starlette.requests import Request
+from starlette.status import WS_1011_INTERNAL_ERROR
+
+# Front-end forwarding requests to booking servers that each own a part of
+# the resource types. Run as python -m booking_server.shard_router.
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+WEBHOOK_HEADERS = ("Content-Type", "X-GitHub-Event", "X-Hub-Signature-256")
+
+shard_router = APIRouter()
+
+
+class Shard(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    url: str
+    types: list[str] = []
+
+
+class ShardRouterApp(FastAPI):
+    shards: list[Shard]
+    types_to_shards: dict[str, int]
+    session: None | aiohttp.ClientSession
+
+    def __init__(self, *, shards: list[Shard], **fast_api_kwargs: Any) -> None:
+        super().__init__(**fast_api_kwargs)
+        self.shards = shards
+        self.types_to_shards = {
+            resource_type: index
+            for index, shard in enumerate(shards)
+            for resource_type in shard.types
+        }
+        self.session = None
+
+
+class RouterRequest(Request):
+    app: ShardRouterApp
+
+
+class RouterWebSocket(WebSocket):
+    app: ShardRouterApp
+
+
+async def open_session(app: ShardRouterApp):
+    app.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+    )
+
+
+async def close_session(app: ShardRouterApp):
+    if app.session is not None:
+        await app.session.close()
+
+
+def shard_of_type(resource_type: str, app: ShardRouterApp):
+    # Types not assigned to any shard are spread over all of them
+    shard = app.types_to_shards.get(resource_type)
+    if shard is None:
+        shard = zlib.crc32(resource_type.encode()) % len(app.shards)
+    return shard
+
+
+def shard_of_booking(booking_id: int, app: ShardRouterApp):
+    return booking_id % len(app.shards)
+
+
+def session_of(app: ShardRouterApp):
+    assert app.session is not None
+    return app.session
+
+
+def shard_unavailable(url: str, error: aiohttp.ClientError):
+    return HTTPException(
+        status_code=HTTPStatus.BAD_GATEWAY,
+        detail={"message": f"Shard {url} is unavailable: {error}"},
+    )
+
+
+@dataclass
+class ShardCall:
+    method: str
+    path: str
+    params: None | list[tuple[str, str]] = None
+    data: None | bytes | str = None
+    headers: None | dict[str, str] = None
+
+
+def json_call(method: str, path: str, body: BaseModel):
+    return ShardCall(
+        method, path, data=body.model_dump_json(), headers=JSON_HEADERS
+    )
+
+
+async def shard_request(app: ShardRouterApp, shard: int, call: ShardCall):
+    url = f"{app.shards[shard].url}{call.path}"
+    try:
+        async with session_of(app).request(
+            call.method,
+            url,
+            params=call.params,
+            data=call.data,
+            headers=call.headers,
+        ) as upstream:
+            return (
+                upstream.status,
+                await upstream.read(),
+                upstream.content_type,
+            )
+    except aiohttp.ClientError as error:
+        raise shard_unavailable(url, error) from error
+
+
+async def forward(app: ShardRouterApp, shard: int, call: ShardCall):
+    status, content, media_type = await shard_request(app, shard, call)
+    return Response(content, status, media_type=media_type)
+
+
+async def requested_from_shards(
+    app: ShardRouterApp,
+    calls: dict[int, ShardCall],
+    accepted: Iterable[HTTPStatus],
+):
+    # Contents answered by each shard, or the first answer that was not
+    # accepted to pass on as is
+    shards = list(calls)
+    responses = await asyncio.gather(
+        *(shard_request(app, shard, calls[shard]) for shard in shards)
+    )
+    contents: dict[int, bytes] = {}
+    for shard, (status, content, media_type) in zip(shards, responses):
+        if status not in accepted:
+            return Response(content, status, media_type=media_type)
+        contents[shard] = content
+    return contents
+
+
+def indexes_by_shard(shards: Iterable[int]):
+    indexes: dict[int, list[int]] = {}
+    for index, shard in enumerate(shards):
+        indexes.setdefault(shard, []).append(index)
+    return indexes
+
+
+def release_all(upstreams: list[aiohttp.ClientResponse]):
+    for upstream in upstreams:
+        upstream.release()
+
+
+async def opened_streams(
+    app: ShardRouterApp,
+    shards: list[int],
+    path: str,
+    params: list[tuple[str, str]],
+):
+    upstreams: list[aiohttp.ClientResponse] = []
+    try:
+        for shard in shards:
+            url = f"{app.shards[shard].url}{path}"
+            try:
+                upstreams.append(await session_of(app).get(url, params=params))
+            except aiohttp.ClientError as error:
+                raise shard_unavailable(url, error) from error
+    except BaseException:
+        release_all(upstreams)
+        raise
+    return upstreams
+
+
+async def streamed_from_shards(upstreams: list[aiohttp.ClientResponse]):
+    # A shard failing midway raises, which aborts the response instead of
+    # ending it as if it was complete
+    try:
+        for upstream in upstreams:
+            async for chunk in upstream.content.iter_any():
+                yield chunk
+    finally:
+        release_all(upstreams)
+
+
+async def streamed_listing(
+    app: ShardRouterApp,
+    shards: list[int],
+    path: str,
+    params: list[tuple[str, str]],
+):
+    # Every shard has answered before the response starts, so that a shard
+    # being down fails the request with an error status. Streams of several
+    # shards follow each other instead of merging.
+    upstreams = await opened_streams(app, shards, path, params)
+    for upstream in upstreams:
+        if upstream.status != HTTPStatus.OK:
+            content = await upstream.read()
+            release_all(upstreams)
+            return Response(
+                content, upstream.status, media_type=upstream.content_type
+            )
+    return StreamingResponse(
+        streamed_from_shards(upstreams),
+        media_type="application/x-ndjson",
+    )
+
+
+def merged_pages(
+    contents: Iterable[bytes],
+    key: str,
+    cursor_of: Callable[[Any], Any],
+    limit: int,
+):
+    # Every shard pages in the same order after the same cursor, so merging
+    # their pages gives the first page over all shards
+    pages = [json.loads(content) for content in contents]
+    found = list(
+        islice(
+            heapq.merge(*(page[key] for page in pages), key=cursor_of), limit
+        )
+    )
+    return JSONResponse(
+        {
+            key: found,
+            "next_cursor": (
+                cursor_of(found[-1]) if len(found) == limit else None
+            ),
+        }
+    )
+
+
+async def listing(
+    request: RouterRequest,
+    path: str,
+    key: str,
+    cursor_of: Callable[[Any], Any],
+):
+    app = request.app
+    params = list(request.query_params.multi_items())
+
+    resource_type = request.query_params.get("type")
+    shards = (
+        [shard_of_type(resource_type, app)]
+        if resource_type is not None
+        else list(range(len(app.shards)))
+    )
+
+    stream = request.query_params.get("stream", "false").lower()
+    if stream in ("true", "1", "yes", "on"):
+        return await streamed_listing(app, shards, path, params)
+
+    call = ShardCall("GET", path, params)
+    if len(shards) == 1:
+        return await forward(app, shards[0], call)
+
+    contents = await requested_from_shards(
+        app, {shard: call for shard in shards}, [HTTPStatus.OK]
+    )
+    if isinstance(contents, Response):
+        return contents
+    return merged_pages(
+        contents.values(),
+        key,
+        cursor_of,
+        int(request.query_params.get("limit", PAGE_SIZE)),
+    )
+
+
+def booking_cursor(booking: Any):
+    return booking["info"]["id"]
+
+
+def resource_cursor(resource: Any):
+    return resource["info"]["identifier"]
+
+
+@shard_router.post("/resource", status_code=HTTPStatus.CREATED)
+async def post_resource(new_resource: NewResource, request: RouterRequest):
+    app = request.app
+    return await forward(
+        app,
+        shard_of_type(new_resource.type, app),
+        json_call("POST", "/resource", new_resource),
+    )
+
+
+@shard_router.post(
+    "/resource/batch",
+    response_model=ResourceBatchResponse,
+    status_code=HTTPStatus.CREATED,
+    responses={HTTPStatus.CONFLICT: {"model": ResourceBatchResponse}},
+)
+async def post_resource_batch(
+    batch: ResourceBatchRequest, request: RouterRequest
+):
+    app = request.app
+    indexes = indexes_by_shard(
+        shard_of_type(resource.type, app) for resource in batch.resources
+    )
+
+    contents = await requested_from_shards(
+        app,
+        {
+            shard: json_call(
+                "POST",
+                "/resource/batch",
+                ResourceBatchRequest(
+                    resources=[batch.resources[i] for i in shard_indexes]
+                ),
+            )
+            for shard, shard_indexes in indexes.items()
+        },
+        [HTTPStatus.CREATED, HTTPStatus.CONFLICT],
+    )
+    if isinstance(contents, Response):
+        return contents
+
+    results: list[Any] = [None] * len(batch.resources)
+    for shard, content in contents.items():
+        shard_results = ResourceBatchResponse.model_validate_json(content)
+        for index, result in zip(indexes[shard], shard_results.results):
+            results[index] = result
+
+    response = ResourceBatchResponse(results=results)
+    created = any(result.resource is not None for result in results)
+    return Response(
+        response.model_dump_json(),
+        HTTPStatus.CREATED if created or not results else HTTPStatus.CONFLICT,
+        media_type="application/json",
+    )
+
+
+def partly_set(app: ShardRouterApp, label: str, failed: list[int]):
+    applied = [
+        app.shards[shard].url
+        for shard in range(len(app.shards))
+        if shard not in failed
+    ]
+    failed_urls = [app.shards[shard].url for shard in failed]
+    return HTTPException(
+        status_code=HTTPStatus.BAD_GATEWAY,
+        detail={
+            "message": (
+                f"Inventory {label} was set only on shards {applied}, not on"
+                f" {failed_urls}. Set it again to finish it."
+            )
+        },
+    )
+
+
+def merged_changes(contents: Iterable[bytes]):
+    changes = ResourceInventoryChanges(added=[], removed=[], kept=[])
+    for content in contents:
+        shard_changes = ResourceInventoryChanges.model_validate_json(content)
+        changes.added += shard_changes.added
+        changes.removed += shard_changes.removed
+        changes.kept += shard_changes.kept
+    return changes
+
+
+@shard_router.put(
+    "/resource/set",
+    response_model=ResourceInventoryChanges,
+    status_code=HTTPStatus.OK,
+)
+async def put_resource_set(
+    inventory: ResourceInventory, request: RouterRequest
+):
+    app = request.app
+
+    # Every shard syncs its part, shards without resources of the inventory
+    # remove the ones they have under its label
+    parts = [
+        ResourceInventory(label=inventory.label, resources=[])
+        for _ in app.shards
+    ]
+    for resource in inventory.resources:
+        parts[shard_of_type(resource.type, app)].resources.append(resource)
+
+    def synced(dry_run: bool):
+        return asyncio.gather(
+            *(
+                shard_request(
+                    app,
+                    shard,
+                    ShardCall(
+                        "PUT",
+                        "/resource/set",
+                        params=[("dry_run", "true")] if dry_run else None,
+                        data=part.model_dump_json(),
+                        headers=JSON_HEADERS,
+                    ),
+                )
+                for shard, part in enumerate(parts)
+            ),
+            return_exceptions=True,
+        )
+
+    # Checked on every shard first, so that an inventory that is wrong for
+    # some shard or a shard being down leaves all the shards as they were
+    for response in await synced(dry_run=True):
+        if isinstance(response, BaseException):
+            raise response
+        status, content, media_type = response
+        if status != HTTPStatus.OK:
+            return Response(content, status, media_type=media_type)
+
+    # Only a shard going down or a conflicting change in between can still
+    # fail a part. Setting the same inventory again finishes the rest.
+    responses = await synced(dry_run=False)
+    failed = [
+        shard
+        for shard, response in enumerate(responses)
+        if isinstance(response, BaseException) or response[0] != HTTPStatus.OK
+    ]
+    if failed:
+        raise partly_set(app, inventory.label, failed)
+
+    return merged_changes(
+        content
+        for _, content, _ in cast(list[tuple[int, bytes, str]], responses)
+    )
+
+
+@shard_router.get("/resource/all", status_code=HTTPStatus.OK)
+async def get_all_resources(request: RouterRequest):
+    return await listing(
+        request, "/resource/all", "resources", resource_cursor
+    )
+
+
+@shard_router.get("/resource/free", status_code=HTTPStatus.OK)
+async def get_free_resources(request: RouterRequest):
+    app = request.app
+    resource_type = request.query_params.get("type")
+    shard = 0 if resource_type is None else shard_of_type(resource_type, app)
+    return await forward(
+        app,
+        shard,
+        ShardCall("GET", "/resource/free", request.query_params.multi_items()),
+    )
+
+
+@shard_router.post("/booking", status_code=HTTPStatus.CREATED)
+async def post_booking(new_booking: BookingRequest, request: RouterRequest):
+    app = request.app
+    return await forward(
+        app,
+        shard_of_type(new_booking.resource.type, app),
+        json_call("POST", "/booking", new_booking),
+    )
+
+
+@shard_router.post(
+    "/booking/batch",
+    response_model=BookingBatchResponse,
+    status_code=HTTPStatus.CREATED,
+    responses={HTTPStatus.BAD_REQUEST: {"model": BookingBatchResponse}},
+)
+async def post_booking_batch(
+    batch: BookingBatchRequest, request: RouterRequest
+):
+    app = request.app
+    indexes = indexes_by_shard(
+        shard_of_type(booking.resource.type, app) for booking in batch.bookings
+    )
+
+    if batch.atomic and len(indexes) > 1:
+        error = "Atomic batches can only book resource types of one shard."
+        response = BookingBatchResponse(
+            results=[BookingBatchResult(error=error) for _ in batch.bookings]
+        )
+        return Response(
+            response.model_dump_json(),
+            HTTPStatus.BAD_REQUEST,
+            media_type="application/json",
+        )
+
+    contents = await requested_from_shards(
+        app,
+        {
+            shard: json_call(
+                "POST",
+                "/booking/batch",
+                BookingBatchRequest(
+                    bookings=[batch.bookings[i] for i in shard_indexes],
+                    atomic=batch.atomic,
+                ),
+            )
+            for shard, shard_indexes in indexes.items()
+        },
+        [HTTPStatus.CREATED, HTTPStatus.BAD_REQUEST],
+    )
+    if isinstance(contents, Response):
+        return contents
+
+    results: list[Any] = [None] * len(batch.bookings)
+    for shard, content in contents.items():
+        shard_results = BookingBatchResponse.model_validate_json(content)
+        for index, result in zip(indexes[shard], shard_results.results):
+            results[index] = result
+
+    response = BookingBatchResponse(results=results)
+    created = any(result.booking is not None for result in results)
+    return Response(
+        response.model_dump_json(),
+        (
+            HTTPStatus.CREATED
+            if created or not results
+            else HTTPStatus.BAD_REQUEST
+        ),
+        media_type="application/json",
+    )
+
+
+@shard_router.get("/booking/all", status_code=HTTPStatus.OK)
+async def get_all_bookings(request: RouterRequest):
+    return await listing(request, "/booking/all", "bookings", booking_cursor)
+
+
+@shard_router.get("/booking/{booking_id}", status_code=HTTPStatus.OK)
+async def get_booking_by_id(booking_id: int, request: RouterRequest):
+    app = request.app
+    return await forward(
+        app,
+        shard_of_booking(booking_id, app),
+        ShardCall("GET", f"/booking/{booking_id}"),
+    )
+
+
+@shard_router.post("/booking/{booking_id}/finish", status_code=HTTPStatus.OK)
+async def post_finish_booking(booking_id: int, request: RouterRequest):
+    app = request.app
+    return await forward(
+        app,
+        shard_of_booking(booking_id, app),
+        ShardCall("POST", f"/booking/{booking_id}/finish"),
+    )
+
+
+@shard_router.post("/booking/{booking_id}/cancel", status_code=HTTPStatus.OK)
+async def post_cancel_booking(booking_id: int, request: RouterRequest):
+    app = request.app
+    return await forward(
+        app,
+        shard_of_booking(booking_id, app),
+        ShardCall("POST", f"/booking/{booking_id}/cancel"),
+    )
+
+
+async def relay_to_client(
+    upstream: aiohttp.ClientWebSocketResponse, websocket: WebSocket
+):
+    async for message in upstream:
+        if message.type == aiohttp.WSMsgType.TEXT:
+            await websocket.send_text(message.data)
+
+
+@shard_router.websocket("/booking/{booking_id}/wait")
+async def websocket_wait_booking(booking_id: int, websocket: RouterWebSocket):
+    app = websocket.app
+    url = app.shards[shard_of_booking(booking_id, app)].url
+    await websocket.accept()
+
+    try:
+        async with session_of(app).ws_connect(
+            f"{url}/booking/{booking_id}/wait"
+        ) as upstream:
+            await relay_to_client(upstream, websocket)
+    except aiohttp.ClientError:
+        # Closed without an answer, so that clients wait again. Reasons
+        # can't be longer than 123 bytes, which leaves out the error.
+        return await websocket.close(
+            WS_1011_INTERNAL_ERROR, f"Shard {url} is unavailable"
+        )
+
+    await websocket.close()
+
+
+@shard_router.websocket("/booking/subscribe")
+async def websocket_subscribe_bookings(websocket: RouterWebSocket):
+    app = websocket.app
+    await websocket.accept()
+
+    upstreams: dict[int, aiohttp.ClientWebSocketResponse] = {}
+
+    async def upstream_of(shard: int, group: asyncio.TaskGroup):
+        # Connected on first use so that only shards owning subscribed
+        # bookings are followed
+        if shard not in upstreams:
+            upstreams[shard] = await session_of(app).ws_connect(
+                f"{app.shards[shard].url}/booking/subscribe"
+            )
+            group.create_task(relay_to_client(upstreams[shard], websocket))
+        return upstreams[shard]
+
+    async def receive_subscriptions(group: asyncio.TaskGroup):
+        while True:
+            subscription = BookingSubscription.model_validate_json(
+                await websocket.receive_text()
+            )
+
+            subscribes: dict[int, dict[int, int]] = {}
+            unsubscribes: dict[int, list[int]] = {}
+            for booking_id, last_seen in subscription.subscribe.items():
+                shard = shard_of_booking(booking_id, app)
+                subscribes.setdefault(shard, {})[booking_id] = last_seen
+            for booking_id in subscription.unsubscribe:
+                shard = shard_of_booking(booking_id, app)
+                unsubscribes.setdefault(shard, []).append(booking_id)
+
+            for shard in subscribes.keys() | unsubscribes.keys():
+                upstream = await upstream_of(shard, group)
+                await upstream.send_str(
+                    BookingSubscription(
+                        subscribe=subscribes.get(shard, {}),
+                        unsubscribe=unsubscribes.get(shard, []),
+                    ).model_dump_json()
+                )
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(receive_subscriptions(group))
+    except* WebSocketDisconnect:
+        pass
+    finally:
+        for upstream in upstreams.values():
+            await upstream.close()
+
+
+@shard_router.post("/github/webhook", status_code=HTTPStatus.NO_CONTENT)
+async def post_github_webhook(request: RouterRequest):
+    app = request.app
+    body = await request.body()
+    headers = {
+        header: request.headers[header]
+        for header in WEBHOOK_HEADERS
+        if header in request.headers
+    }
+
+    # Any shard can have bookings of the workflow run
+    call = ShardCall("POST", "/github/webhook", data=body, headers=headers)
+    contents = await requested_from_shards(
+        app,
+        {shard: call for shard in range(len(app.shards))},
+        [HTTPStatus.NO_CONTENT],
+    )
+    if isinstance(contents, Response):
+        return contents
+
+    return Response(status_code=HTTPStatus.NO_CONTENT)
+
+
+def parse_shard(value: str):
+    url, _, types = value.partition("=")
+    return Shard(
+        url=url.rstrip("/"),
+        types=[resource_type for resource_type in types.split(",") if types],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Forward booking server requests to shards owning the requested"
+            " resource types."
+        )
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        action="append",
+        required=True,
+        metavar="URL[=TYPE,...]",
+        help=(
+            "Booking server started with --shard-index set to the position"
+            " of this option and the resource types it owns. Types not given"
+            " to any shard are spread over all shards by their hash."
+        ),
+    )
+    parser.add_argument(
+        "--bind",
+        type=str,
+        default="127.0.0.1:8000",
+        help="Address the router listens on.",
+    )
+    args = parser.parse_args()
+    shards: list[Shard] = args.shard
+
+    owned: set[str] = set()
+    for shard in shards:
+        if owned & set(shard.types):
+            parser.error(
+                f"Types {sorted(owned & set(shard.types))} are given to more"
+                " than one shard"
+            )
+        owned |= set(shard.types)
+
+    app = ShardRouterApp(shards=shards)
+    app.include_router(shard_router)
+    app.router.on_startup.append(partial(open_session, app))
+    app.router.on_shutdown.append(partial(close_session, app))
+
+    config = Config()
+    config.bind = [args.bind]
+    config.accesslog = "-"
+    uvloop.run(worker_serve(ASGIWrapper(cast(ASGIFramework, app)), config))
+
+
+if __name__ == "__main__":
+    main()
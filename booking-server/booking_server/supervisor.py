@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import traceback
+from asyncio import Task
+from collections import deque
+from enum import Enum
+from functools import partial
+from typing import Any, Coroutine
+
+from booking_server.metrics import Metrics
+
+
+class TaskKind(str, Enum):
+    # Loops running for the lifetime of the server
+    SERVICE = "service"
+    GITHUB = "github"
+
+
+DEFAULT_LIMITS: dict[TaskKind, None | int] = {
+    TaskKind.SERVICE: None,
+    TaskKind.GITHUB: 32,
+}
+
+
+class TaskSupervisor:
+    # Background tasks by kind. Kinds with a limit run at most that many
+    # tasks at once, the rest wait as coroutines that haven't started, so a
+    # burst doesn't turn into a task for every request.
+    def __init__(
+        self,
+        metrics: Metrics,
+        limits: None | dict[TaskKind, None | int] = None,
+    ) -> None:
+        self.metrics = metrics
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.tasks: dict[Task[Any], TaskKind] = {}
+        self.running = {kind: 0 for kind in TaskKind}
+        self.queued: dict[TaskKind, deque[Coroutine[Any, Any, Any]]] = {
+            kind: deque() for kind in TaskKind
+        }
+        self.closed = False
+
+    def spawn(self, kind: TaskKind, routine: Coroutine[Any, Any, Any]):
+        if self.closed:
+            routine.close()
+            return
+
+        limit = self.limits[kind]
+        if limit is not None and self.running[kind] >= limit:
+            self.queued[kind].append(routine)
+            self.metrics.queued_tasks.inc(kind.value)
+            return
+
+        self._start(kind, routine)
+
+    def _start(self, kind: TaskKind, routine: Coroutine[Any, Any, Any]):
+        task = asyncio.create_task(routine)
+        self.tasks[task] = kind
+        self.running[kind] += 1
+        self.metrics.background_tasks.inc(kind.value)
+        task.add_done_callback(partial(self._done, kind))
+
+    def _done(self, kind: TaskKind, task: Task[Any]):
+        del self.tasks[task]
+        self.running[kind] -= 1
+        self.metrics.background_tasks.dec(kind.value)
+
+        if not task.cancelled() and (error := task.exception()) is not None:
+            self.metrics.task_failures.inc(kind.value)
+            print(f"Background task of kind {kind.value} failed:")
+            traceback.print_exception(error)
+
+        queued = self.queued[kind]
+        if queued and not self.closed:
+            self.metrics.queued_tasks.dec(kind.value)
+            self._start(kind, queued.popleft())
+
+    def counts(self):
+        return {
+            kind: (self.running[kind], len(self.queued[kind]))
+            for kind in TaskKind
+        }
+
+    async def drain(self, timeout: float):
+        # Work already accepted gets to finish, service loops keep running
+        # meanwhile since the work can depend on them
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while pending := [
+            task
+            for task, kind in self.tasks.items()
+            if kind != TaskKind.SERVICE
+        ]:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                print(f"Cancelling {len(pending)} unfinished tasks.")
+                break
+            await asyncio.wait(pending, timeout=remaining)
+
+        self.closed = True
+        for kind, queued in self.queued.items():
+            if queued:
+                print(f"Dropping {len(queued)} queued {kind.value} tasks.")
+            while queued:
+                queued.popleft().close()
+                self.metrics.queued_tasks.dec(kind.value)
+
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
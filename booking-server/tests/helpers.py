@@ -0,0 +1,107 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from booking_common.models import (
+    BookingInfo,
+    BookingStatus,
+    RequestedResource,
+)
+from booking_server.allocator import run_allocator
+from booking_server.api import router
+from booking_server.archive import BookingArchive
+from booking_server.booking import Booking
+from booking_server.github import GitHubClient, GitHubSettings
+from booking_server.server import (
+    BookingApp,
+    ServerState,
+    fire_and_forget,
+    run_booking_timers,
+)
+from fastapi.testclient import TestClient
+
+NOW = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+def waiting_booking(
+    booking_id: int,
+    name: str = "booking",
+    identifier: None | str = None,
+    priority: int = 0,
+):
+    return Booking(
+        info=BookingInfo(
+            id=booking_id,
+            name=name,
+            resource=RequestedResource(type="runner", identifier=identifier),
+            start_time=NOW,
+            end_time=NOW,
+            booking_time=NOW,
+            status=BookingStatus.WAITING,
+            priority=priority,
+        )
+    )
+
+
+def booking_app(server_state: None | ServerState = None):
+    # Served like by the server, with the timers and the allocator running
+    # but no GitHub to reach
+    app = BookingApp(
+        server_state=server_state or ServerState(),
+        github_client=GitHubClient(
+            "token", GitHubSettings(base_url="http://127.0.0.1:9")
+        ),
+        booking_archive=BookingArchive(timedelta(hours=1), 100),
+    )
+    app.include_router(router)
+
+    async def start():
+        fire_and_forget(app, run_booking_timers(app))
+        fire_and_forget(
+            app,
+            run_allocator(app.server_state, app.supervisor, app.github_client),
+        )
+
+    app.router.on_startup.append(start)
+    app.router.on_shutdown.append(app.github_client.close)
+    return app
+
+
+def booking_json(
+    start_in: timedelta = timedelta(0),
+    lasting: timedelta = timedelta(hours=1),
+    identifier: None | str = None,
+    **fields: Any,
+):
+    start_time = datetime.now(timezone.utc) + start_in
+    return {
+        "name": "booking",
+        "resource": {"type": "runner", "identifier": identifier},
+        "start_time": start_time.isoformat(),
+        "end_time": (start_time + lasting).isoformat(),
+        **fields,
+    }
+
+
+def add_resources(client: TestClient, *identifiers: str):
+    for identifier in identifiers:
+        response = client.post(
+            "/resource", json={"type": "runner", "identifier": identifier}
+        )
+        assert response.status_code == 201
+
+
+def eventually(check: Callable[[], Any], timeout: float = 5):
+    # The allocator and the timers run in the background of the test client
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def booking_status(client: TestClient, booking_id: int):
+    return client.get(f"/booking/{booking_id}").json()["info"]["status"]
+
+
+def wait_status(client: TestClient, booking_id: int, status: str):
+    eventually(lambda: booking_status(client, booking_id) == status)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from pathlib import Path
+
+from booking_server.archive import BookingArchive, archive_closed_bookings
+from fastapi.testclient import TestClient
+from tests.helpers import booking_app, booking_json
+
+
+def archived_app(max_age: timedelta, spill_path: None | Path = None):
+    app = booking_app()
+    app.booking_archive = BookingArchive(max_age, 1, spill_path)
+    return app
+
+
+def booking_ids(client: TestClient):
+    return [
+        booking["info"]["id"]
+        for booking in client.get("/booking/all").json()["bookings"]
+    ]
+
+
+def test_closed_bookings_are_archived(tmp_path: Path):
+    app = archived_app(timedelta(0), tmp_path / "spill.sqlite")
+    with TestClient(app) as client:
+        first, second, waiting = [
+            client.post("/booking", json=booking_json()).json()["info"]["id"]
+            for _ in range(3)
+        ]
+        client.post(f"/booking/{first}/cancel")
+        client.post(f"/booking/{second}/cancel")
+
+        archived = client.portal.call(
+            archive_closed_bookings, app.server_state, app.booking_archive
+        )
+
+        assert archived == 2
+        assert booking_ids(client) == [waiting]
+        # The first one was spilled past the capacity of the archive
+        for booking_id in (first, second):
+            response = client.get(f"/booking/{booking_id}")
+            assert response.json()["info"]["status"] == "CANCELLED"
+
+        with client.websocket_connect("/booking/subscribe") as websocket:
+            websocket.send_json({"subscribe": {first: -1}})
+
+            assert websocket.receive_json() == {
+                "id": first,
+                "version": 1,
+                "status": "CANCELLED",
+            }
+
+
+def test_recently_closed_bookings_are_kept():
+    app = archived_app(timedelta(hours=1))
+    with TestClient(app) as client:
+        booking_id = client.post("/booking", json=booking_json()).json()[
+            "info"
+        ]["id"]
+        client.post(f"/booking/{booking_id}/cancel")
+
+        archived = client.portal.call(
+            archive_closed_bookings, app.server_state, app.booking_archive
+        )
+
+        assert archived == 0
+        assert booking_ids(client) == [booking_id]
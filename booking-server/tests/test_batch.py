@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+from tests.helpers import add_resources, booking_app, booking_json
+
+LATER = timedelta(hours=2)
+PAST = -timedelta(hours=2)
+
+
+def batch_results(client: TestClient, *bookings: dict, atomic=False):
+    response = client.post(
+        "/booking/batch", json={"bookings": bookings, "atomic": atomic}
+    )
+    return response.status_code, response.json()["results"]
+
+
+def booking_ids(client: TestClient):
+    return [
+        booking["info"]["id"]
+        for booking in client.get("/booking/all").json()["bookings"]
+    ]
+
+
+def test_batch_is_matched_before_responding():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1", "r2")
+
+        status, results = batch_results(
+            client, booking_json(), booking_json(), booking_json()
+        )
+
+        assert status == 201
+        assert [result["booking"]["info"]["status"] for result in results] == [
+            "ON",
+            "ON",
+            "WAITING",
+        ]
+        assert [
+            result["booking"]["used_resource"]["identifier"]
+            for result in results[:2]
+        ] == ["r1", "r2"]
+
+
+def test_invalid_bookings_fail_alone():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+
+        status, results = batch_results(
+            client, booking_json(PAST), booking_json()
+        )
+
+        assert status == 201
+        assert "End date is in the past" in results[0]["error"]
+        assert results[0]["booking"] is None
+        assert results[1]["booking"]["info"]["status"] == "ON"
+        assert booking_ids(client) == [results[1]["booking"]["info"]["id"]]
+
+
+def test_atomic_batch_creates_none_on_error():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+
+        status, results = batch_results(
+            client, booking_json(), booking_json(PAST), atomic=True
+        )
+
+        assert status == 400
+        assert (
+            "Another booking of the batch was invalid" in results[0]["error"]
+        )
+        assert "End date is in the past" in results[1]["error"]
+        assert not booking_ids(client)
+
+
+def test_batch_cannot_reserve_a_slot_twice():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+
+        status, results = batch_results(
+            client, booking_json(LATER), booking_json(LATER)
+        )
+
+        assert status == 201
+        assert results[0]["booking"]["reserved_resource"]["identifier"] == "r1"
+        assert "No requested resource is free" in results[1]["error"]
+
+        # Nothing is left held by the failed booking
+        status, results = batch_results(
+            client, booking_json(LATER + timedelta(hours=1))
+        )
+
+        assert status == 201
+        assert results[0]["booking"]["reserved_resource"]["identifier"] == "r1"
+
+
+def test_failed_atomic_batch_holds_no_slots():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+
+        status, _ = batch_results(
+            client, booking_json(LATER), booking_json(PAST), atomic=True
+        )
+        assert status == 400
+
+        status, results = batch_results(client, booking_json(LATER))
+
+        assert status == 201
+        assert results[0]["booking"]["reserved_resource"]["identifier"] == "r1"
+
+
+def test_all_invalid_and_empty_batches():
+    with TestClient(booking_app()) as client:
+        status, results = batch_results(client, booking_json(PAST))
+
+        assert status == 400
+        assert results[0]["error"]
+
+        assert batch_results(client) == (201, [])
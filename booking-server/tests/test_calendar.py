@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+from tests.helpers import (
+    add_resources,
+    booking_app,
+    booking_json,
+    booking_status,
+    wait_status,
+)
+
+
+def test_booking_starting_about_now_queues_on_busy_type():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+        first = client.post("/booking", json=booking_json()).json()
+        wait_status(client, first["info"]["id"], "ON")
+
+        # The client's clock runs a bit ahead of the server's
+        response = client.post(
+            "/booking", json=booking_json(timedelta(seconds=2))
+        )
+
+        assert response.status_code == 201
+        second = response.json()
+        assert second["reserved_resource"] is None
+        assert booking_status(client, second["info"]["id"]) == "WAITING"
+
+        client.post(f"/booking/{first['info']['id']}/finish")
+        wait_status(client, second["info"]["id"], "ON")
+
+
+def test_later_bookings_reserve_free_slots():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+        later = booking_json(timedelta(hours=2))
+
+        response = client.post("/booking", json=later)
+
+        assert response.status_code == 201
+        reserved = response.json()
+        assert reserved["reserved_resource"]["identifier"] == "r1"
+        assert reserved["info"]["status"] == "WAITING"
+
+        overlapping = client.post(
+            "/booking", json=booking_json(timedelta(hours=2, minutes=30))
+        )
+
+        assert overlapping.status_code == 400
+        assert "No requested resource is free" in overlapping.text
+
+        after = client.post("/booking", json=booking_json(timedelta(hours=3)))
+
+        assert after.status_code == 201
+        assert after.json()["reserved_resource"]["identifier"] == "r1"
+
+        # Cancelling gives the slot back
+        client.post(f"/booking/{reserved['info']['id']}/cancel")
+
+        assert client.post("/booking", json=later).status_code == 201
+
+
+def test_queued_bookings_use_resources_until_a_reservation():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1", "r2")
+        reserved = client.post(
+            "/booking", json=booking_json(timedelta(hours=2), identifier="r1")
+        ).json()
+        now = client.post("/booking", json=booking_json()).json()
+
+        wait_status(client, now["info"]["id"], "ON")
+        assert reserved["reserved_resource"]["identifier"] == "r1"
+        assert booking_status(client, reserved["info"]["id"]) == "WAITING"
+
+
+def test_past_and_empty_slots_are_refused():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+
+        past = client.post("/booking", json=booking_json(-timedelta(hours=2)))
+        empty = client.post(
+            "/booking",
+            json=booking_json(timedelta(hours=2), lasting=timedelta(0)),
+        )
+
+        assert past.status_code == 400
+        assert "End date is in the past" in past.text
+        assert empty.status_code == 400
+        assert "End date is not after start date" in empty.text
@@ -0,0 +1,162 @@
+from datetime import timedelta
+
+from booking_server.fair_share import FairShareBookings, heap_in_order
+from booking_server.server import ServerState
+from fastapi.testclient import TestClient
+from tests.helpers import (
+    add_resources,
+    booking_app,
+    booking_json,
+    booking_status,
+    eventually,
+    waiting_booking,
+)
+
+
+def new_booking(
+    booking_id: int,
+    tenant: str,
+    priority: int = 0,
+    identifier: None | str = None,
+):
+    # Bookings without a GitHub job are the tenant of their name
+    return waiting_booking(booking_id, tenant, identifier, priority)
+
+
+def candidate_ids(bookings: FairShareBookings, *identifiers: str):
+    return [
+        booking.info.id
+        for booking in bookings.candidates("runner", identifiers)
+    ]
+
+
+def test_heap_in_order():
+    heap = [1, 3, 2, 7, 4, 5, 6]
+
+    assert list(heap_in_order(heap)) == [1, 2, 3, 4, 5, 6, 7]
+    assert heap == [1, 3, 2, 7, 4, 5, 6]
+
+
+def test_tenants_take_turns():
+    bookings = FairShareBookings()
+    for booking_id, tenant in enumerate(["a", "a", "a", "b"]):
+        bookings.add(new_booking(booking_id, tenant))
+
+    assert candidate_ids(bookings) == [0, 3, 1, 2]
+
+
+def test_weighted_tenants():
+    bookings = FairShareBookings({"a": 2})
+    for booking_id, tenant in enumerate(["a"] * 4 + ["b"] * 2):
+        bookings.add(new_booking(booking_id, tenant))
+
+    assert candidate_ids(bookings) == [0, 4, 1, 2, 5, 3]
+
+
+def test_priority_within_tenant():
+    bookings = FairShareBookings()
+    bookings.add(new_booking(0, "a"))
+    bookings.add(new_booking(1, "a", priority=1))
+    bookings.add(new_booking(2, "a"))
+
+    assert candidate_ids(bookings) == [1, 0, 2]
+
+
+def test_assigned_tenant_waits_for_others():
+    bookings = FairShareBookings()
+    first = new_booking(0, "a")
+    bookings.add(first)
+    bookings.add(new_booking(1, "a"))
+    bookings.add(new_booking(2, "b"))
+    bookings.assigned(first)
+
+    assert candidate_ids(bookings) == [2, 1]
+
+
+def test_identifier_queues_merge_with_type_queue():
+    bookings = FairShareBookings()
+    bookings.add(new_booking(0, "a", identifier="x"))
+    bookings.add(new_booking(1, "a"))
+    bookings.add(new_booking(2, "a", identifier="y"))
+
+    assert candidate_ids(bookings) == [1]
+    assert candidate_ids(bookings, "x") == [0, 1]
+    assert candidate_ids(bookings, "x", "y") == [0, 1, 2]
+
+
+def test_removed_bookings_are_skipped_then_compacted():
+    bookings = FairShareBookings()
+    added = [new_booking(booking_id, "a") for booking_id in range(6)]
+    for booking in added:
+        bookings.add(booking)
+    queue = bookings.queues["runner"]
+
+    bookings.remove(added[0])
+    bookings.remove(added[2])
+
+    # Left in the heap until half of it is removed
+    assert len(queue.bookings["a"]) == 6
+    assert candidate_ids(bookings) == [1, 3, 4, 5]
+
+    bookings.remove(added[3])
+
+    assert len(queue.bookings["a"]) == 3
+    assert "a" not in queue.left
+    assert candidate_ids(bookings) == [1, 4, 5]
+
+    for booking in added:
+        bookings.remove(booking)
+
+    assert not bookings.queues
+    assert not candidate_ids(bookings)
+
+
+def test_removing_twice_changes_nothing():
+    bookings = FairShareBookings()
+    booking = new_booking(0, "a")
+    bookings.add(booking)
+    bookings.add(new_booking(1, "a"))
+    bookings.add(new_booking(2, "a"))
+
+    bookings.remove(booking)
+    bookings.remove(booking)
+
+    assert bookings.queues["runner"].left == {"a": 1}
+    assert bookings.depths == {"runner": 2}
+    assert candidate_ids(bookings) == [1, 2]
+
+
+def test_tenants_without_fair_share():
+    with TestClient(booking_app()) as client:
+        response = client.get("/tenants")
+
+        assert response.status_code == 409
+        assert response.json()["detail"]["message"] == (
+            "Fair share policy is not enabled."
+        )
+
+
+def test_tenants_leave_out_reservations():
+    app = booking_app(ServerState(waiting_bookings=FairShareBookings()))
+    with TestClient(app) as client:
+        for name in ["a", "a", "b"]:
+            booking = client.post("/booking", json=booking_json(name=name))
+        add_resources(client, "r1", "r2")
+        client.post(
+            "/booking", json=booking_json(timedelta(hours=2), name="b")
+        )
+        # Tenants are served in turns, the last booking before the second
+        # one of the first tenant
+        eventually(
+            lambda: booking_status(client, booking.json()["info"]["id"])
+            == "ON"
+        )
+
+        stats = {
+            tenant["tenant"]: tenant
+            for tenant in client.get("/tenants").json()
+        }
+
+        # The reservation neither waits nor counts as assigned
+        assert (stats["a"]["assigned"], stats["a"]["waiting"]) == (1, 1)
+        assert (stats["b"]["assigned"], stats["b"]["waiting"]) == (1, 0)
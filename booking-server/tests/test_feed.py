@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+from booking_server.api import ChangeFeedFormat, changes_response
+from booking_server.feed import ChangeFeed
+from booking_server.server import ServerState
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from tests.helpers import add_resources, booking_app, waiting_booking
+
+
+def feed_request(last_event_id: None | str = None):
+    headers = (
+        []
+        if last_event_id is None
+        else [(b"last-event-id", last_event_id.encode())]
+    )
+    return Request({"type": "http", "headers": headers})
+
+
+async def first_chunks(response, count: int):
+    chunks = []
+    async for chunk in response.body_iterator:
+        chunks.append(chunk)
+        if len(chunks) == count:
+            break
+    await response.body_iterator.aclose()
+    return chunks
+
+
+def changed_feed(changes: int, history_size: int = 100):
+    feed = ChangeFeed(history_size)
+    for booking_id in range(changes):
+        feed.booking_changed(waiting_booking(booking_id))
+    return feed
+
+
+def test_changes_are_streamed_after_the_given_sequence():
+    feed = changed_feed(3)
+
+    async def streamed():
+        response = changes_response(
+            feed, feed_request(), 1, ChangeFeedFormat.NDJSON
+        )
+        return await first_chunks(response, 2)
+
+    events = [json.loads(line) for line in asyncio.run(streamed())]
+
+    assert [event["sequence"] for event in events] == [2, 3]
+    assert [event["booking"]["info"]["id"] for event in events] == [1, 2]
+
+
+def test_server_sent_events_resume_from_last_event_id():
+    feed = changed_feed(3)
+
+    async def streamed():
+        response = changes_response(
+            feed, feed_request("2"), None, ChangeFeedFormat.SSE
+        )
+        return await first_chunks(response, 1)
+
+    (event,) = asyncio.run(streamed())
+
+    assert event.startswith("id: 3\ndata: {")
+    assert event.endswith("}\n\n")
+
+
+def test_live_changes_follow_the_history():
+    feed = changed_feed(1)
+
+    async def streamed():
+        events = feed.events(0)
+        history = await anext(events)
+        feed.booking_changed(waiting_booking(1))
+        live = await anext(events)
+        await events.aclose()
+        return history, live
+
+    history, live = asyncio.run(streamed())
+
+    assert [history[0], live[0]] == [1, 2]
+    assert not feed.subscribers
+
+
+def test_slow_subscribers_are_cut_off():
+    feed = changed_feed(0)
+
+    async def overflowed():
+        subscriber, _ = feed.subscribe(0, buffer_size=2)
+        for booking_id in range(3):
+            feed.booking_changed(waiting_booking(booking_id))
+        return subscriber
+
+    subscriber = asyncio.run(overflowed())
+
+    assert subscriber.overflowed
+    assert subscriber not in feed.subscribers
+    # Still in the history for resuming from
+    assert [sequence for sequence, _ in feed.history] == [1, 2, 3]
+
+
+def test_invalid_and_unavailable_positions_are_refused():
+    app = booking_app(ServerState(feed=ChangeFeed(history_size=2)))
+    with TestClient(app) as client:
+        add_resources(client, "a", "b", "c")
+
+        invalid = client.get("/changes", headers={"Last-Event-ID": "abc"})
+        gone = client.get("/changes", params={"since": 0})
+
+        assert invalid.status_code == 400
+        assert "Invalid Last-Event-ID" in invalid.json()["detail"]["message"]
+        assert gone.status_code == 410
+        assert "no longer available" in gone.json()["detail"]["message"]
@@ -0,0 +1,252 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from booking_common.models import JobInfo
+from booking_server.github import GitHubClient, GitHubError, GitHubSettings
+
+JOB = JobInfo(run_id=7, job_id=3, repo_owner="owner", repo_name="repo")
+RUN_PATH = "/repos/owner/repo/actions/runs/7"
+RERUN_PATH = "/repos/owner/repo/actions/jobs/3/rerun"
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+class StubGitHub:
+    # Answers the polls of the run with the given responses in turn, the
+    # last one for good
+    def __init__(self, *responses: Handler) -> None:
+        self.responses = list(responses)
+        self.polls: list[web.Request] = []
+        self.reruns = 0
+
+    async def run(self, request: web.Request):
+        self.polls.append(request)
+        respond = self.responses[min(len(self.polls), len(self.responses)) - 1]
+        return await respond(request)
+
+    async def rerun(self, request: web.Request):
+        del request
+        self.reruns += 1
+        return web.Response(status=201)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get(RUN_PATH, self.run)
+        app.router.add_post(RERUN_PATH, self.rerun)
+        return app
+
+
+def run_status(status: str, **extra: Any):
+    async def respond(request: web.Request):
+        etag = f'"{status}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(
+            {"status": status, **extra}, headers={"ETag": etag}
+        )
+
+    return respond
+
+
+def failure(status: int):
+    async def respond(request: web.Request):
+        del request
+        return web.Response(status=status, text="failure")
+
+    return respond
+
+
+async def bad_payload(request: web.Request):
+    del request
+    return web.json_response({"unexpected": True})
+
+
+def delayed(seconds: float, respond: Handler):
+    async def delayed_respond(request: web.Request):
+        await asyncio.sleep(seconds)
+        return await respond(request)
+
+    return delayed_respond
+
+
+async def served(
+    stub: StubGitHub,
+    test: Callable[[GitHubClient], Awaitable[Any]],
+    **options: Any,
+):
+    server = TestServer(stub.app())
+    await server.start_server()
+    client = GitHubClient(
+        "token",
+        GitHubSettings(
+            base_url=str(server.make_url("")),
+            poll_interval=0.01,
+            max_poll_interval=0.05,
+            **options,
+        ),
+    )
+    try:
+        return await asyncio.wait_for(test(client), 10)
+    finally:
+        await client.close()
+        await server.close()
+
+
+def wait_for_run(client: GitHubClient):
+    return client.wait_for_run_completion(JOB)
+
+
+def test_polls_until_run_completes():
+    stub = StubGitHub(
+        run_status("in_progress"),
+        run_status("in_progress"),
+        run_status("completed", conclusion="success"),
+    )
+
+    run_info = asyncio.run(served(stub, wait_for_run))
+
+    assert run_info == {"status": "completed", "conclusion": "success"}
+    assert len(stub.polls) == 3
+    assert stub.polls[0].headers["Authorization"] == "Bearer token"
+    # The second poll got the in progress run as not modified
+    assert stub.polls[1].headers["If-None-Match"] == '"in_progress"'
+
+
+def test_waiters_share_one_poller():
+    stub = StubGitHub(run_status("in_progress"), run_status("completed"))
+
+    async def wait_twice(client: GitHubClient):
+        first, second = await asyncio.gather(
+            wait_for_run(client), wait_for_run(client)
+        )
+        assert not client.runs.polled
+        assert not client.cached
+        return first, second
+
+    first, second = asyncio.run(served(stub, wait_twice))
+
+    assert first == second == {"status": "completed"}
+    assert len(stub.polls) == 2
+
+
+@pytest.mark.parametrize(
+    "failed",
+    [
+        failure(500),
+        failure(404),
+        bad_payload,
+        delayed(1, run_status("in_progress")),
+    ],
+    ids=["server error", "client error", "bad payload", "timeout"],
+)
+def test_polls_again_after_failures(failed: Handler):
+    stub = StubGitHub(failed, failed, run_status("completed", conclusion="x"))
+
+    async def wait_with_timeout(client: GitHubClient):
+        client.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=0.1)
+        )
+        run_info = await wait_for_run(client)
+        assert sum(client.metrics.github_poll_failures.values.values()) == 2
+        return run_info
+
+    run_info = asyncio.run(served(stub, wait_with_timeout))
+
+    assert run_info == {"status": "completed", "conclusion": "x"}
+    assert len(stub.polls) == 3
+
+
+def test_waiters_fail_with_unexpected_errors():
+    stub = StubGitHub(run_status("in_progress"))
+
+    async def wait_failing(client: GitHubClient):
+        def failing_delay(failures: int = 0):
+            raise RuntimeError(failures)
+
+        client.next_poll_delay = failing_delay  # type: ignore[method-assign]
+        with pytest.raises(RuntimeError):
+            await wait_for_run(client)
+        assert not client.runs.polled
+
+    asyncio.run(served(stub, wait_failing))
+
+
+def test_webhook_completes_run_without_polling():
+    stub = StubGitHub(run_status("in_progress"))
+
+    async def completed_by_webhook(client: GitHubClient):
+        waiter = asyncio.create_task(wait_for_run(client))
+        await asyncio.sleep(0.05)
+        client.run_webhook_delivered(JOB.run_id)
+        client.run_completed(JOB.run_id, {"status": "completed"})
+        run_info = await waiter
+        # Completed runs are answered without waiting
+        assert await wait_for_run(client) is run_info
+        return run_info
+
+    run_info = asyncio.run(
+        served(stub, completed_by_webhook, webhook_secret="secret")
+    )
+
+    assert run_info == {"status": "completed"}
+    assert not stub.polls
+
+
+def test_polls_when_webhooks_go_silent():
+    stub = StubGitHub(run_status("completed"))
+
+    run_info = asyncio.run(
+        served(
+            stub,
+            wait_for_run,
+            webhook_secret="secret",
+            webhook_timeout=0.05,
+        )
+    )
+
+    assert run_info == {"status": "completed"}
+    assert len(stub.polls) == 1
+
+
+def test_re_run_job():
+    stub = StubGitHub(run_status("completed"))
+
+    async def re_run(client: GitHubClient):
+        client.run_completed(JOB.run_id, {"status": "completed"})
+        await client.re_run_job_for_workflow_run(JOB)
+        # The re-run is waited for instead of the earlier completion
+        assert JOB.run_id not in client.runs.completed
+
+    asyncio.run(served(stub, re_run))
+
+    assert stub.reruns == 1
+
+
+def test_failed_re_run():
+    stub = StubGitHub()
+
+    async def re_run(client: GitHubClient):
+        with pytest.raises(GitHubError, match="failed with 404"):
+            await client.re_run_job_for_workflow_run(
+                JOB.model_copy(update={"job_id": 4})
+            )
+
+    asyncio.run(served(stub, re_run))
+
+
+def test_poll_delay_follows_rate_limit():
+    client = GitHubClient(
+        "token", GitHubSettings(poll_interval=1, max_poll_interval=60)
+    )
+
+    assert client.next_poll_delay() == 1
+    assert client.next_poll_delay(failures=3) == 8
+    assert client.next_poll_delay(failures=10) == 60
+
+    client.rate_limit.update({"Retry-After": "30"})
+
+    assert 29 < client.next_poll_delay() <= 30
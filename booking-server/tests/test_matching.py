@@ -0,0 +1,269 @@
+import random
+from datetime import timedelta
+
+from booking_common.models import (
+    BookingRequest,
+    RequestedResource,
+    ResourceInfo,
+)
+from booking_server.booking import Booking, create_booking
+from booking_server.broker import match_type
+from booking_server.matching import Matching
+from booking_server.resource import NewResource, Resource, add_new_resources
+from booking_server.server import ServerState
+from tests.helpers import NOW, waiting_booking
+
+
+def new_booking(booking_id: int, identifier: None | str = None):
+    return waiting_booking(booking_id, identifier=identifier)
+
+
+def new_resources(*identifiers: str):
+    return {
+        identifier: Resource(
+            info=ResourceInfo(type="runner", identifier=identifier)
+        )
+        for identifier in identifiers
+    }
+
+
+def fitting(fits: dict[int, set[str]]):
+    # Bookings fit the resources listed for them, or any when not listed
+    def fit(resource: Resource, booking: Booking):
+        return resource.info.identifier in fits.get(
+            booking.info.id, {resource.info.identifier}
+        )
+
+    return fit
+
+
+def identifiers_of(matching: Matching):
+    return [
+        (booking.info.id, resource.info.identifier)
+        for booking, resource in matching.matched()
+    ]
+
+
+def test_offered_free_resources_in_order():
+    matching = Matching(new_resources("a", "b"), fitting({}))
+
+    assert matching.offer(new_booking(0)) == "a"
+    assert matching.offer(new_booking(1)) == "b"
+    assert matching.offer(new_booking(2)) is None
+    assert identifiers_of(matching) == [(0, "a"), (1, "b")]
+
+
+def test_earlier_booking_moves_to_make_room():
+    matching = Matching(new_resources("a", "b"), fitting({1: {"a"}}))
+
+    assert matching.offer(new_booking(0)) == "a"
+    # The only resource fitting the later booking is held by the earlier
+    # one, which moves to the other resource
+    assert matching.offer(new_booking(1)) == "b"
+    assert identifiers_of(matching) == [(0, "b"), (1, "a")]
+
+
+def test_moves_go_along_a_path_of_bookings():
+    matching = Matching(
+        new_resources("a", "b", "c"),
+        fitting({0: {"a", "b"}, 1: {"b", "c"}, 2: {"a"}}),
+    )
+
+    assert matching.offer(new_booking(0)) == "a"
+    assert matching.offer(new_booking(1)) == "b"
+    assert matching.offer(new_booking(2)) == "c"
+    assert identifiers_of(matching) == [(0, "b"), (1, "c"), (2, "a")]
+
+
+def test_earlier_bookings_keep_a_resource():
+    matching = Matching(new_resources("a"), fitting({}))
+
+    assert matching.offer(new_booking(0)) == "a"
+    assert matching.offer(new_booking(1)) is None
+    assert identifiers_of(matching) == [(0, "a")]
+
+
+def test_requested_identifier():
+    matching = Matching(new_resources("a", "b"), fitting({}))
+
+    assert matching.offer(new_booking(0, "b")) == "b"
+    assert matching.offer(new_booking(1, "missing")) is None
+    assert matching.offer(new_booking(2, "b")) is None
+    assert matching.offer(new_booking(3)) == "a"
+
+
+def test_allowed_resources():
+    matching = Matching(new_resources("a", "b"), fitting({}))
+
+    assert matching.offer(new_booking(0), allowed={"b"}) == "b"
+    # The earlier booking is allowed only the resource it holds
+    assert matching.offer(new_booking(1), allowed={"b"}) is None
+    assert matching.offer(new_booking(2)) == "a"
+    assert identifiers_of(matching) == [(0, "b"), (2, "a")]
+
+
+def test_failed_offer_changes_nothing():
+    matching = Matching(
+        new_resources("a", "b"), fitting({0: {"a"}, 1: {"a", "b"}, 2: {"a"}})
+    )
+
+    assert matching.offer(new_booking(0)) == "a"
+    assert matching.offer(new_booking(1)) == "b"
+    assert matching.offer(new_booking(2)) is None
+    assert identifiers_of(matching) == [(0, "a"), (1, "b")]
+    # Searches passing by skip what was reached without finding a free one
+    assert matching.exhausted == {"a"}
+
+
+def round_state(resources: dict[str, list[int]]):
+    # Resources by identifier, with the hours from now when they are
+    # reserved for an hour
+    server_state = ServerState()
+    for identifier, reserved_at in resources.items():
+        resource = add_new_resources(
+            [NewResource(type="runner", identifier=identifier)], server_state
+        )[0]
+        assert isinstance(resource, Resource)
+        for slot_id, hours in enumerate(reserved_at, start=-len(reserved_at)):
+            server_state.calendar.add_slot(
+                resource,
+                NOW + timedelta(hours=hours),
+                NOW + timedelta(hours=hours + 1),
+                slot_id,
+            )
+    return server_state
+
+
+def queued(
+    server_state: ServerState,
+    identifier: None | str = None,
+    hours: int = 1,
+):
+    return create_booking(
+        BookingRequest(
+            name="booking",
+            resource=RequestedResource(type="runner", identifier=identifier),
+            start_time=NOW,
+            end_time=NOW + timedelta(hours=hours),
+        ),
+        None,
+        NOW,
+        server_state,
+    )
+
+
+def matched_round(
+    server_state: ServerState,
+    freed: list[str],
+    new_bookings: list[Booking],
+):
+    return {
+        booking.info.id: booking.used_resource.info.identifier
+        for booking in match_type(
+            "runner",
+            [
+                server_state.ids_to_resources[identifier]
+                for identifier in freed
+            ],
+            new_bookings,
+            server_state,
+        )
+        if booking.used_resource is not None
+    }
+
+
+def test_freed_resource_goes_to_the_earliest_booking_it_fits():
+    server_state = round_state({"a": [], "b": []})
+    queued(server_state, "b")
+    queued(server_state)
+    queued(server_state, "a")
+
+    # The first booking waits for the other resource, the second one for
+    # any, which comes before the third one waiting for this one
+    assert matched_round(server_state, ["a"], []) == {1: "a"}
+
+
+def test_waiting_bookings_get_only_freed_resources():
+    server_state = round_state({"a": [], "b": []})
+    queued(server_state)
+    new = queued(server_state)
+
+    # The resource free before the round was offered to the waiting
+    # booking before, so only the new booking can have it
+    assert matched_round(server_state, ["b"], [new]) == {0: "b", 1: "a"}
+
+
+def test_waiting_booking_moves_for_a_new_one():
+    server_state = round_state({"a": [], "b": []})
+    queued(server_state)
+    new = queued(server_state, "a")
+
+    assert matched_round(server_state, ["a", "b"], [new]) == {0: "b", 1: "a"}
+
+
+def best_matching(eligible: dict[int, set[str]]):
+    # Of the matchings with the most bookings, the one of the earliest
+    # bookings, tried one by one
+    booking_ids = sorted(eligible)
+    best: tuple[int, list[int]] = (0, [])
+
+    def search(index: int, taken: set[str], matched: list[int]):
+        nonlocal best
+        if index == len(booking_ids):
+            best = max(best, (len(matched), [-i for i in matched]))
+            return
+        booking_id = booking_ids[index]
+        for identifier in eligible[booking_id] - taken:
+            search(index + 1, taken | {identifier}, matched + [booking_id])
+        search(index + 1, taken, matched)
+
+    search(0, set(), [])
+    return sorted(-i for i in best[1])
+
+
+def test_rounds_match_like_brute_force():
+    for seed in range(200):
+        rng = random.Random(seed)
+        identifiers = [f"r{i}" for i in range(rng.randint(1, 4))]
+        server_state = round_state(
+            {
+                identifier: rng.sample(range(1, 4), rng.randint(0, 1))
+                for identifier in identifiers
+            }
+        )
+        bookings = [
+            queued(
+                server_state,
+                rng.choice([None, None, *identifiers]),
+                rng.randint(1, 3),
+            )
+            for _ in range(rng.randint(1, 6))
+        ]
+        new_bookings = [booking for booking in bookings if rng.random() < 0.5]
+        freed = [
+            identifier for identifier in identifiers if rng.random() < 0.5
+        ]
+
+        # Bookings that waited before can only get the freed resources
+        eligible = {
+            booking.info.id: {
+                identifier
+                for identifier in (
+                    identifiers if booking in new_bookings else freed
+                )
+                if booking.info.resource.identifier in (None, identifier)
+                and server_state.calendar.fits(
+                    server_state.ids_to_resources[identifier], booking
+                )
+            }
+            for booking in bookings
+        }
+
+        matched = matched_round(server_state, freed, new_bookings)
+
+        assert sorted(matched) == best_matching(eligible), seed
+        assert len(set(matched.values())) == len(matched), seed
+        assert all(
+            identifier in eligible[booking_id]
+            for booking_id, identifier in matched.items()
+        ), seed
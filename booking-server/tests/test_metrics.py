@@ -0,0 +1,54 @@
+from fastapi.testclient import TestClient
+from tests.helpers import add_resources, booking_app, booking_json, wait_status
+
+
+def samples(client: TestClient):
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    return dict(
+        line.rsplit(" ", 1)
+        for line in response.text.splitlines()
+        if not line.startswith("#")
+    )
+
+
+def test_metrics_count_requests_by_route():
+    with TestClient(booking_app()) as client:
+        client.get("/booking/1")
+        client.get("/booking/2")
+        client.get("/no/such/path")
+
+        found = samples(client)
+
+        # Labeled by route template instead of path
+        assert (
+            found[
+                'booking_http_request_seconds_count{method="GET",'
+                'route="/booking/{booking_id}",status="404"}'
+            ]
+            == "2"
+        )
+        assert (
+            found[
+                'booking_http_request_seconds_count{method="GET",'
+                'route="unmatched",status="404"}'
+            ]
+            == "1"
+        )
+
+
+def test_metrics_show_the_state():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1", "r2")
+        booking_id = client.post("/booking", json=booking_json()).json()[
+            "info"
+        ]["id"]
+        wait_status(client, booking_id, "ON")
+        client.post("/booking", json=booking_json(identifier="r1"))
+
+        found = samples(client)
+
+        assert found['booking_resources{type="runner",state="free"}'] == "1"
+        assert found['booking_resources{type="runner",state="busy"}'] == "1"
+        assert found['booking_waiting_bookings{type="runner"}'] == "1"
+        assert found['booking_waiting_seconds_count{type="runner"}'] == "1"
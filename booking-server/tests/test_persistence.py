@@ -0,0 +1,264 @@
+import asyncio
+import pickle
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from booking_common.models import (
+    BookingInfo,
+    BookingRequest,
+    BookingStatus,
+    JobInfo,
+    RequestedResource,
+    ResourceInfo,
+)
+from booking_server.booking import Booking, add_new_bookings, cancel_booking
+from booking_server.broker import assign_to_each_others
+from booking_server.persistence import (
+    WriteAheadLog,
+    booking_info,
+    booking_row,
+    construct,
+    load_raw_state,
+    open_write_ahead_log,
+    read_frames,
+    segment_path,
+)
+from booking_server.resource import (
+    NewResource,
+    Resource,
+    add_new_resources,
+    retire_resource,
+)
+from booking_server.server import ServerState
+from pydantic import BaseModel, PrivateAttr
+from tests.helpers import waiting_booking
+
+
+def booking_request(name: str, identifier: None | str = None, later=False):
+    now = datetime.now(timezone.utc)
+    start_time = now + timedelta(hours=1) if later else now
+    return BookingRequest(
+        name=name,
+        resource=RequestedResource(type="runner", identifier=identifier),
+        start_time=start_time,
+        end_time=start_time + timedelta(hours=1),
+    )
+
+
+async def opened(directory: Path):
+    server_state = ServerState()
+    journal = await open_write_ahead_log(directory, server_state, 0, 3600)
+    server_state.journal = journal
+    return server_state, journal
+
+
+def summary(server_state: ServerState):
+    return {
+        "counter": server_state.booking_id_counter,
+        "resources": [
+            resource.info.model_dump() for resource in server_state.resources
+        ],
+        "bookings": {
+            booking_id: (
+                booking.info.model_dump(),
+                booking.used_resource
+                and booking.used_resource.info.identifier,
+                booking.reserved_resource
+                and booking.reserved_resource.info.identifier,
+            )
+            for booking_id, booking in server_state.ids_to_bookings.items()
+        },
+        "used": {
+            resource.info.identifier: resource.used_by.info.id
+            for resource in server_state.resources
+            if resource.used_by is not None
+        },
+        "free": {
+            resource_type: list(free)
+            for resource_type, free in (
+                server_state.free_resources.types_to_resources.items()
+            )
+        },
+        "waiting": [
+            booking.info.id
+            for booking in server_state.waiting_bookings.candidates(
+                "runner", ["c"]
+            )
+        ],
+        "closed": [
+            booking.info.id for _, booking in server_state.closed_bookings
+        ],
+    }
+
+
+async def changed_state(directory: Path, snapshot: bool):
+    server_state, journal = await opened(directory)
+    add_new_resources(
+        [
+            NewResource(type="runner", identifier=identifier, label="host")
+            for identifier in ["c", "a", "b"]
+        ],
+        server_state,
+    )
+    waiting, cancelled, assigned, reserved = add_new_bookings(
+        [
+            booking_request("waiting"),
+            booking_request("cancelled"),
+            booking_request("assigned", "b"),
+            booking_request("reserved", "c", later=True),
+        ],
+        False,
+        server_state,
+    )
+    if snapshot:
+        await journal.snapshot()
+
+    assign_to_each_others(
+        server_state.ids_to_resources["b"], assigned, server_state
+    )
+    cancel_booking(cancelled, server_state)
+    retire_resource(server_state.ids_to_resources["a"], server_state)
+    await journal.flush()
+    journal.file.close()
+
+    assert waiting.info.status == BookingStatus.WAITING
+    assert reserved.reserved_resource is not None
+    return server_state
+
+
+def restored(directory: Path):
+    async def restore():
+        server_state, journal = await opened(directory)
+        journal.file.close()
+        return server_state
+
+    return asyncio.run(restore())
+
+
+def test_restored_from_log(tmp_path: Path):
+    server_state = asyncio.run(changed_state(tmp_path, False))
+
+    assert summary(restored(tmp_path)) == summary(server_state)
+
+
+def test_restored_from_snapshot_and_log(tmp_path: Path):
+    server_state = asyncio.run(changed_state(tmp_path, True))
+
+    # Compacted up to the segment opened by the snapshot
+    assert load_raw_state(tmp_path, 1)["bookings"]
+    assert not segment_path(tmp_path, 0).exists()
+    assert summary(restored(tmp_path)) == summary(server_state)
+
+
+def test_restored_twice(tmp_path: Path):
+    server_state = asyncio.run(changed_state(tmp_path, True))
+    restored(tmp_path)
+
+    assert summary(restored(tmp_path)) == summary(server_state)
+
+
+def slots(model: BaseModel):
+    # Whatever slots pydantic keeps, those of restored models are filled in
+    # like those of validated ones
+    return {
+        name: (
+            list(getattr(model, name))
+            if name == "__dict__"
+            else getattr(model, name, "unset")
+        )
+        for name in BaseModel.__slots__
+    }
+
+
+def test_restored_models_are_built_as_validated(tmp_path: Path):
+    asyncio.run(changed_state(tmp_path, False))
+    server_state = restored(tmp_path)
+
+    for resource in server_state.ids_to_resources.values():
+        assert slots(resource) == slots(
+            Resource.model_validate(dict(resource))
+        )
+        info = ResourceInfo.model_validate(resource.info.model_dump())
+        assert resource.info == info
+        assert slots(resource.info) == slots(info)
+
+    for booking in server_state.ids_to_bookings.values():
+        assert slots(booking) == slots(Booking.model_validate(dict(booking)))
+
+
+def test_restored_booking_info_is_built_as_validated():
+    now = datetime.now(timezone.utc)
+    info = BookingInfo(
+        name="booking",
+        resource=RequestedResource(type="runner", identifier=None),
+        start_time=now,
+        end_time=now + timedelta(hours=1),
+        github=JobInfo(
+            run_id=1, job_id=2, repo_owner="owner", repo_name="repo"
+        ),
+        id=3,
+        booking_time=now,
+        status=BookingStatus.WAITING,
+        version=4,
+        priority=5,
+    )
+
+    restored_info = booking_info(booking_row(info))
+
+    assert restored_info == info
+    for restored_model, model in [
+        (restored_info, info),
+        (restored_info.resource, info.resource),
+        (restored_info.github, info.github),
+    ]:
+        assert slots(restored_model) == slots(model)
+
+
+class Private(BaseModel):
+    value: int
+    _private: list[int] = PrivateAttr(default_factory=list)
+
+
+def test_constructed_private_attributes_get_defaults():
+    model = construct(Private, value=1)
+
+    assert model.__pydantic_private__ == {"_private": []}
+    assert model == Private(value=1)
+
+
+class SlowWriteAheadLog(WriteAheadLog):
+    def __init__(self, directory: Path) -> None:
+        super().__init__(directory, 0, 0, 3600)
+        self.writers = 0
+        self.most_writers = 0
+
+    def _write(self, records: list[tuple]):
+        self.writers += 1
+        self.most_writers = max(self.most_writers, self.writers)
+        time.sleep(0.1)
+        super()._write(records)
+        self.writers -= 1
+
+
+def test_cancelled_flush_is_not_written_over(tmp_path: Path):
+    async def cancelled_then_flushed():
+        journal = SlowWriteAheadLog(tmp_path)
+        journal.booking_archived(waiting_booking(1))
+        flushing = asyncio.create_task(journal.flush())
+        await asyncio.sleep(0.05)
+        flushing.cancel()
+        journal.booking_archived(waiting_booking(2))
+
+        await journal.flush()
+        journal.file.close()
+        return journal
+
+    journal = asyncio.run(cancelled_then_flushed())
+
+    assert journal.most_writers == 1
+    assert [
+        record
+        for frame in read_frames(segment_path(tmp_path, 0))
+        for record in pickle.loads(frame)
+    ] == [("booking_archived", 1), ("booking_archived", 2)]
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from booking_server.archive import BookingArchive, archive_closed_bookings
+from booking_server.feed import ChangeFeed
+from booking_server.notifications import NotificationHub
+from booking_server.replica import (
+    ReplicaStore,
+    follow_changes,
+    publish_changes,
+    resync_replica,
+)
+from booking_server.replica_api import ReplicaApp, replica_router
+from booking_server.server import ServerState
+from fastapi.testclient import TestClient
+from tests.helpers import waiting_booking
+
+
+def replicated_state(store: ReplicaStore, *booking_ids: int):
+    server_state = ServerState(replica=store)
+    closed = datetime.now(timezone.utc) - timedelta(hours=1)
+    for booking_id in booking_ids:
+        booking = waiting_booking(booking_id)
+        server_state.ids_to_bookings[booking_id] = booking
+        server_state.booking_indexes.add(booking)
+        server_state.closed_bookings.append((closed, booking))
+    asyncio.run(resync_replica(store, server_state, True))
+    return server_state
+
+
+def replica_client(store: ReplicaStore):
+    app = ReplicaApp(store=store)
+    app.include_router(replica_router)
+    return TestClient(app)
+
+
+def listed_ids(client: TestClient):
+    return [
+        booking["info"]["id"]
+        for booking in client.get("/booking/all").json()["bookings"]
+    ]
+
+
+def test_replica_serves_bookings(tmp_path: Path):
+    store = ReplicaStore(tmp_path / "replica.sqlite")
+    replicated_state(store, 0, 1)
+
+    with replica_client(store) as client:
+        found = client.get("/booking/1")
+        missing = client.get("/booking/2")
+        streamed = client.get("/booking/all", params={"stream": "true"})
+
+        assert found.json()["info"]["id"] == 1
+        assert missing.status_code == 404
+        assert listed_ids(client) == [0, 1]
+        assert len(streamed.text.splitlines()) == 2
+
+
+def test_archived_bookings_leave_the_replica(tmp_path: Path):
+    store = ReplicaStore(tmp_path / "replica.sqlite", archived_kept=1)
+    server_state = replicated_state(store, 0, 1, 2)
+    archive = BookingArchive(max_age=timedelta(0), capacity=1)
+    server_state.closed_bookings.pop()
+
+    asyncio.run(archive_closed_bookings(server_state, archive))
+
+    with replica_client(store) as client:
+        # Only the latest archived ones are still found by id
+        assert listed_ids(client) == [2]
+        assert client.get("/booking/0").status_code == 404
+        assert client.get("/booking/1").json()["info"]["id"] == 1
+
+
+def test_bookings_archived_while_stopped_leave_the_replica(tmp_path: Path):
+    store = ReplicaStore(tmp_path / "replica.sqlite")
+    server_state = replicated_state(store, 0, 1)
+    del server_state.ids_to_bookings[0]
+
+    asyncio.run(resync_replica(store, server_state, False))
+
+    assert store.booking_versions() == {1: 0}
+    assert store.booking(0) is None
+
+
+class CountingStore(ReplicaStore):
+    polls = 0
+
+    def changes(self, after: int, limit: int):
+        self.polls += 1
+        return super().changes(after, limit)
+
+
+def test_idle_replica_is_polled_less_often(tmp_path: Path):
+    store = CountingStore(tmp_path / "replica.sqlite")
+    feed = ChangeFeed()
+    notifications = NotificationHub()
+
+    async def followed():
+        follower = asyncio.create_task(
+            follow_changes(store, feed, notifications, 0.01, 0.1)
+        )
+        await asyncio.sleep(1)
+        idle_polls = store.polls
+
+        published = ChangeFeed()
+        publisher = asyncio.create_task(publish_changes(store, published))
+        await asyncio.sleep(0)
+        published.booking_changed(waiting_booking(0))
+        changed = time.monotonic()
+        while not feed.sequence:
+            await asyncio.sleep(0.01)
+
+        follower.cancel()
+        publisher.cancel()
+        return idle_polls, time.monotonic() - changed
+
+    idle_polls, latency = asyncio.run(followed())
+
+    # Polled every 10 ms it would have been about 100 times
+    assert idle_polls < 20
+    assert latency < 0.5
@@ -0,0 +1,236 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from booking_common.models import (
+    BookingRequest,
+    RequestedResource,
+    ResourceInfo,
+    ResourceInventory,
+)
+from booking_server.booking import add_new_booking, finish_booking
+from booking_server.broker import assign_to_each_others, sync_resources
+from booking_server.persistence import WriteAheadLog, open_write_ahead_log
+from booking_server.server import ServerState
+from fastapi.testclient import TestClient
+from tests.helpers import (
+    booking_app,
+    booking_json,
+    booking_status,
+    wait_status,
+)
+
+
+def inventory(label: str, *identifiers: str, resource_type="runner"):
+    return {
+        "label": label,
+        "resources": [
+            {"type": resource_type, "identifier": identifier}
+            for identifier in identifiers
+        ],
+    }
+
+
+def resource_ids(client: TestClient):
+    return [
+        resource["info"]["identifier"]
+        for resource in client.get("/resource/all").json()["resources"]
+    ]
+
+
+def test_set_adds_keeps_and_removes():
+    with TestClient(booking_app()) as client:
+        first = client.put("/resource/set", json=inventory("host", "a", "b"))
+
+        assert first.json() == {"added": ["a", "b"], "removed": [], "kept": []}
+
+        second = client.put("/resource/set", json=inventory("host", "b", "c"))
+
+        assert second.json() == {
+            "added": ["c"],
+            "removed": ["a"],
+            "kept": ["b"],
+        }
+        assert resource_ids(client) == ["b", "c"]
+
+        # Setting the same inventory again changes nothing
+        again = client.put("/resource/set", json=inventory("host", "b", "c"))
+
+        assert again.json() == {"added": [], "removed": [], "kept": ["b", "c"]}
+
+
+def test_labels_are_synced_apart():
+    with TestClient(booking_app()) as client:
+        client.put("/resource/set", json=inventory("one", "a"))
+        client.put("/resource/set", json=inventory("two", "b"))
+
+        emptied = client.put("/resource/set", json=inventory("one"))
+
+        assert emptied.json()["removed"] == ["a"]
+        assert resource_ids(client) == ["b"]
+
+
+def test_dry_run_changes_nothing():
+    with TestClient(booking_app()) as client:
+        client.put("/resource/set", json=inventory("host", "a"))
+
+        planned = client.put(
+            "/resource/set",
+            params={"dry_run": "true"},
+            json=inventory("host", "b"),
+        )
+
+        assert planned.json() == {"added": ["b"], "removed": ["a"], "kept": []}
+        assert resource_ids(client) == ["a"]
+
+
+def test_invalid_inventories_are_refused_whole():
+    with TestClient(booking_app()) as client:
+        client.put("/resource/set", json=inventory("one", "a"))
+
+        for invalid, message in [
+            (inventory("two", "b", "a"), "already exists"),
+            (inventory("one", "a", resource_type="other"), "already exists"),
+            (inventory("two", "b", "b"), "listed twice"),
+            (
+                {
+                    "label": "two",
+                    "resources": [
+                        {"type": "runner", "identifier": "b", "label": "one"}
+                    ],
+                },
+                "labeled one",
+            ),
+        ]:
+            response = client.put("/resource/set", json=invalid)
+
+            assert response.status_code == 409
+            assert message in response.json()["detail"]["message"]
+
+        assert resource_ids(client) == ["a"]
+
+
+def test_added_resources_are_assigned():
+    with TestClient(booking_app()) as client:
+        booking_id = client.post("/booking", json=booking_json()).json()[
+            "info"
+        ]["id"]
+
+        client.put("/resource/set", json=inventory("host", "a"))
+
+        wait_status(client, booking_id, "ON")
+
+
+def test_removed_resource_in_use_is_dropped_once_released():
+    with TestClient(booking_app()) as client:
+        client.put("/resource/set", json=inventory("host", "a"))
+        booking_id = client.post("/booking", json=booking_json()).json()[
+            "info"
+        ]["id"]
+        wait_status(client, booking_id, "ON")
+
+        client.put("/resource/set", json=inventory("host"))
+
+        # Hidden from the listings but still finishing as usual
+        assert not resource_ids(client)
+        assert booking_status(client, booking_id) == "ON"
+        assert client.post(f"/booking/{booking_id}/finish").status_code == 200
+
+        waiting = client.post("/booking", json=booking_json()).json()
+        time.sleep(0.1)
+        assert booking_status(client, waiting["info"]["id"]) == "WAITING"
+
+
+def test_removed_resource_in_use_can_be_set_again():
+    with TestClient(booking_app()) as client:
+        client.put("/resource/set", json=inventory("host", "a"))
+        booking_id = client.post("/booking", json=booking_json()).json()[
+            "info"
+        ]["id"]
+        wait_status(client, booking_id, "ON")
+        client.put("/resource/set", json=inventory("host"))
+
+        kept = client.put("/resource/set", json=inventory("host", "a"))
+
+        assert kept.json()["kept"] == ["a"]
+        assert resource_ids(client) == ["a"]
+
+        client.post(f"/booking/{booking_id}/finish")
+        assert resource_ids(client) == ["a"]
+
+
+def test_removed_resource_cancels_its_reservations():
+    with TestClient(booking_app()) as client:
+        client.put("/resource/set", json=inventory("host", "a"))
+        reserved = client.post(
+            "/booking", json=booking_json(timedelta(hours=2))
+        ).json()
+
+        client.put("/resource/set", json=inventory("host"))
+
+        assert booking_status(client, reserved["info"]["id"]) == "CANCELLED"
+
+
+async def opened(directory: Path):
+    server_state = ServerState()
+    journal = await open_write_ahead_log(directory, server_state, 0, 3600)
+    server_state.journal = journal
+    return server_state, journal
+
+
+async def closed(journal: WriteAheadLog):
+    await journal.flush()
+    journal.file.close()
+
+
+def test_retirement_survives_restart(tmp_path: Path):
+    async def retired_in_use():
+        server_state, journal = await opened(tmp_path)
+        sync_resources(
+            ResourceInventory(
+                label="host",
+                resources=[ResourceInfo(type="runner", identifier="a")],
+            ),
+            server_state,
+        )
+        now = datetime.now(timezone.utc)
+        booking = await add_new_booking(
+            BookingRequest(
+                name="booking",
+                resource=RequestedResource(type="runner"),
+                start_time=now,
+                end_time=now + timedelta(hours=1),
+            ),
+            server_state,
+        )
+        assign_to_each_others(
+            server_state.ids_to_resources["a"], booking, server_state
+        )
+        sync_resources(
+            ResourceInventory(label="host", resources=[]), server_state
+        )
+        await closed(journal)
+
+    async def released_after_restart():
+        server_state, journal = await opened(tmp_path)
+        resource = server_state.ids_to_resources["a"]
+
+        assert resource.retired
+        assert resource.used_by is server_state.ids_to_bookings[0]
+        assert not server_state.resources
+        assert not server_state.free_resources.types_to_resources.get("runner")
+
+        finish_booking(resource.used_by, resource, server_state)
+        assert "a" not in server_state.ids_to_resources
+        await closed(journal)
+
+    async def dropped_after_restart():
+        server_state, journal = await opened(tmp_path)
+        await closed(journal)
+
+        assert not server_state.ids_to_resources
+
+    asyncio.run(retired_in_use())
+    asyncio.run(released_after_restart())
+    asyncio.run(dropped_after_restart())
@@ -0,0 +1,156 @@
+import asyncio
+import socket
+from contextlib import asynccontextmanager
+
+import aiohttp
+import httpx
+from booking_server.server import ServerState
+from booking_server.shard_router import (
+    Shard,
+    ShardRouterApp,
+    close_session,
+    open_session,
+    shard_router,
+)
+from hypercorn import Config
+from hypercorn.asyncio import serve
+from tests.helpers import booking_app, booking_json
+
+
+def free_port():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+
+async def started(url: str, session: aiohttp.ClientSession):
+    for _ in range(100):
+        try:
+            async with session.get(f"{url}/resource/all"):
+                return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.05)
+    raise TimeoutError(f"Shard {url} did not start")
+
+
+@asynccontextmanager
+async def routed(*shard_types: list[str]):
+    # Booking servers serving the shards, behind a router called in process
+    stopped = asyncio.Event()
+    shards: list[Shard] = []
+    serving: list[asyncio.Task] = []
+    for index, types in enumerate(shard_types):
+        config = Config()
+        config.bind = [f"127.0.0.1:{free_port()}"]
+        app = booking_app(
+            ServerState(
+                shard_index=index,
+                shard_count=len(shard_types),
+                booking_id_counter=index,
+            )
+        )
+        serving.append(
+            asyncio.create_task(
+                serve(app, config, shutdown_trigger=stopped.wait)
+            )
+        )
+        shards.append(Shard(url=f"http://{config.bind[0]}", types=types))
+
+    router = ShardRouterApp(shards=shards)
+    router.include_router(shard_router)
+    await open_session(router)
+    try:
+        assert router.session is not None
+        for shard in shards:
+            await started(shard.url, router.session)
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(router), base_url="http://router"
+        ) as client:
+            yield client
+    finally:
+        stopped.set()
+        await asyncio.gather(*serving)
+        await close_session(router)
+
+
+def of_type(resource_type: str, name: str = "booking"):
+    return booking_json(name=name, resource={"type": resource_type})
+
+
+def test_batches_are_split_by_type_and_listed_together():
+    async def booked():
+        async with routed(["cpu"], ["gpu"]) as client:
+            for resource_type, identifier in [("cpu", "c1"), ("gpu", "g1")]:
+                await client.post(
+                    "/resource",
+                    json={"type": resource_type, "identifier": identifier},
+                )
+            batch = await client.post(
+                "/booking/batch",
+                json={
+                    "bookings": [
+                        of_type("cpu", "first"),
+                        of_type("gpu", "second"),
+                        of_type("cpu", "third"),
+                    ]
+                },
+            )
+            page = await client.get("/booking/all", params={"limit": 2})
+            gpu_id = batch.json()["results"][1]["booking"]["info"]["id"]
+            by_id = await client.get(f"/booking/{gpu_id}")
+            return batch, page, by_id
+
+    batch, page, by_id = asyncio.run(booked())
+
+    assert batch.status_code == 201
+    infos = [result["booking"]["info"] for result in batch.json()["results"]]
+    # In the order of the batch, with ids telling their shards apart
+    assert [info["name"] for info in infos] == ["first", "second", "third"]
+    assert [info["id"] % 2 for info in infos] == [0, 1, 0]
+    assert [info["status"] for info in infos] == ["ON", "ON", "WAITING"]
+
+    assert [
+        booking["info"]["id"] for booking in page.json()["bookings"]
+    ] == sorted(info["id"] for info in infos)[:2]
+    assert page.json()["next_cursor"] == infos[1]["id"]
+    assert by_id.json()["info"]["name"] == "second"
+
+
+def test_atomic_batches_stay_on_one_shard():
+    async def booked():
+        async with routed(["cpu"], ["gpu"]) as client:
+            return await client.post(
+                "/booking/batch",
+                json={
+                    "bookings": [of_type("cpu"), of_type("gpu")],
+                    "atomic": True,
+                },
+            )
+
+    response = asyncio.run(booked())
+
+    assert response.status_code == 400
+    assert all(
+        "one shard" in result["error"] for result in response.json()["results"]
+    )
+
+
+def test_unavailable_shard_is_a_bad_gateway():
+    async def booked():
+        router = ShardRouterApp(
+            shards=[Shard(url=f"http://127.0.0.1:{free_port()}")]
+        )
+        router.include_router(shard_router)
+        await open_session(router)
+        try:
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(router), base_url="http://router"
+            ) as client:
+                return await client.post("/booking", json=of_type("cpu"))
+        finally:
+            await close_session(router)
+
+    response = asyncio.run(booked())
+
+    assert response.status_code == 502
+    assert "is unavailable" in response.json()["detail"]["message"]
@@ -0,0 +1,116 @@
+from fastapi.testclient import TestClient
+from starlette.testclient import WebSocketTestSession
+from tests.helpers import add_resources, booking_app, booking_json, wait_status
+
+UNKNOWN_ID = 10**9
+
+
+def synced(websocket: WebSocketTestSession):
+    # Messages are handled in order, so the ones sent before have been
+    # handled once this one is answered
+    websocket.send_json({"subscribe": {UNKNOWN_ID: -1}})
+    assert websocket.receive_json()["id"] == UNKNOWN_ID
+
+
+def test_notified_of_each_version():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+        booking_id = client.post("/booking", json=booking_json()).json()[
+            "info"
+        ]["id"]
+        wait_status(client, booking_id, "ON")
+
+        with client.websocket_connect("/booking/subscribe") as websocket:
+            websocket.send_json({"subscribe": {booking_id: -1}})
+            current = websocket.receive_json()
+            client.post(f"/booking/{booking_id}/finish")
+            finished = websocket.receive_json()
+
+        assert current == {"id": booking_id, "version": 1, "status": "ON"}
+        assert finished == {
+            "id": booking_id,
+            "version": 2,
+            "status": "FINISHED",
+        }
+
+
+def test_seen_versions_are_not_sent_again():
+    with TestClient(booking_app()) as client:
+        first = client.post("/booking", json=booking_json()).json()
+        second = client.post("/booking", json=booking_json()).json()
+
+        with client.websocket_connect("/booking/subscribe") as websocket:
+            websocket.send_json(
+                {
+                    "subscribe": {
+                        first["info"]["id"]: 0,
+                        second["info"]["id"]: -1,
+                    }
+                }
+            )
+            current = websocket.receive_json()
+            synced(websocket)
+            client.post(f"/booking/{first['info']['id']}/cancel")
+
+            cancelled = websocket.receive_json()
+
+        # The first one was seen at version 0, so only its next version is
+        # sent
+        assert current == {
+            "id": second["info"]["id"],
+            "version": 0,
+            "status": "WAITING",
+        }
+        assert cancelled == {
+            "id": first["info"]["id"],
+            "version": 1,
+            "status": "CANCELLED",
+        }
+
+
+def test_invalid_messages_and_unknown_bookings():
+    with TestClient(booking_app()) as client:
+        booking_id = client.post("/booking", json=booking_json()).json()[
+            "info"
+        ]["id"]
+
+        with client.websocket_connect("/booking/subscribe") as websocket:
+            websocket.send_text("not json")
+            invalid_json = websocket.receive_json()
+            websocket.send_json({"subscribe": {"one": "two"}})
+            invalid_subscription = websocket.receive_json()
+            websocket.send_json({"subscribe": {UNKNOWN_ID: -1}})
+            unknown = websocket.receive_json()
+
+            # Still subscribing after the errors
+            websocket.send_json({"subscribe": {booking_id: -1}})
+            current = websocket.receive_json()
+
+        assert invalid_json["message"].startswith("Invalid subscription")
+        assert invalid_subscription["message"].startswith(
+            "Invalid subscription"
+        )
+        assert unknown == {"id": UNKNOWN_ID, "message": "No such booking id"}
+        assert current == {"id": booking_id, "version": 0, "status": "WAITING"}
+
+
+def test_unsubscribed_bookings_are_not_sent():
+    with TestClient(booking_app()) as client:
+        first = client.post("/booking", json=booking_json()).json()["info"]
+        second = client.post("/booking", json=booking_json()).json()["info"]
+
+        with client.websocket_connect("/booking/subscribe") as websocket:
+            websocket.send_json({"subscribe": {first["id"]: 0}})
+            websocket.send_json({"unsubscribe": [first["id"]]})
+            websocket.send_json({"subscribe": {second["id"]: 0}})
+            synced(websocket)
+            client.post(f"/booking/{first['id']}/cancel")
+            client.post(f"/booking/{second['id']}/cancel")
+
+            notification = websocket.receive_json()
+
+        assert notification == {
+            "id": second["id"],
+            "version": 1,
+            "status": "CANCELLED",
+        }
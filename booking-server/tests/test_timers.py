@@ -0,0 +1,85 @@
+import time
+from datetime import timedelta
+
+import booking_server.booking
+import pytest
+from fastapi.testclient import TestClient
+from tests.helpers import (
+    add_resources,
+    booking_app,
+    booking_json,
+    booking_status,
+    wait_status,
+)
+
+SHORT = timedelta(milliseconds=300)
+
+
+def test_reserved_booking_activates_and_expires(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    # Reserved however soon it starts
+    monkeypatch.setattr(
+        booking_server.booking, "RESERVATION_GRACE", timedelta(0)
+    )
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+        reserved = client.post(
+            "/booking", json=booking_json(SHORT, lasting=SHORT)
+        ).json()
+        booking_id = reserved["info"]["id"]
+
+        assert reserved["reserved_resource"]["identifier"] == "r1"
+        assert booking_status(client, booking_id) == "WAITING"
+
+        wait_status(client, booking_id, "ON")
+        assert (
+            client.get(f"/booking/{booking_id}").json()["used_resource"][
+                "identifier"
+            ]
+            == "r1"
+        )
+
+        wait_status(client, booking_id, "FINISHED")
+
+
+def test_expired_booking_frees_its_resource():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+        short = client.post("/booking", json=booking_json(lasting=SHORT))
+        waiting = client.post("/booking", json=booking_json())
+
+        wait_status(client, short.json()["info"]["id"], "ON")
+        assert booking_status(client, waiting.json()["info"]["id"]) == (
+            "WAITING"
+        )
+
+        wait_status(client, short.json()["info"]["id"], "FINISHED")
+        wait_status(client, waiting.json()["info"]["id"], "ON")
+
+
+def test_waiting_booking_expires_cancelled():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+        long = client.post("/booking", json=booking_json())
+        short = client.post("/booking", json=booking_json(lasting=SHORT))
+
+        wait_status(client, short.json()["info"]["id"], "CANCELLED")
+        assert booking_status(client, long.json()["info"]["id"]) == "ON"
+
+
+def test_finished_booking_expires_no_more():
+    with TestClient(booking_app()) as client:
+        add_resources(client, "r1")
+        short = client.post("/booking", json=booking_json(lasting=SHORT))
+        booking_id = short.json()["info"]["id"]
+        wait_status(client, booking_id, "ON")
+
+        client.post(f"/booking/{booking_id}/finish")
+        later = client.post("/booking", json=booking_json())
+        wait_status(client, later.json()["info"]["id"], "ON")
+
+        # The timer of the finished booking leaves the next one alone
+        time.sleep(2 * SHORT.total_seconds())
+        assert booking_status(client, booking_id) == "FINISHED"
+        assert booking_status(client, later.json()["info"]["id"]) == "ON"
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import json
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+from tests.helpers import add_resources, booking_app, booking_json, wait_status
+
+SECRET = "secret"
+LATER = timedelta(hours=2)
+
+
+def of_run(run_id: int):
+    return {
+        "github": {
+            "run_id": run_id,
+            "job_id": 1,
+            "repo_owner": "owner",
+            "repo_name": "repo",
+        }
+    }
+
+
+def post_webhook(client: TestClient, event: str, payload: dict):
+    body = json.dumps(payload).encode()
+    signature = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return client.post(
+        "/github/webhook",
+        content=body,
+        headers={
+            "X-GitHub-Event": event,
+            "X-Hub-Signature-256": f"sha256={signature}",
+        },
+    )
+
+
+def test_cancelled_run_cancels_its_waiting_and_reserved_bookings():
+    app = booking_app()
+    app.github_client.settings.webhook_secret = SECRET
+    with TestClient(app) as client:
+        add_resources(client, "r1")
+        running = client.post("/booking", json=booking_json(**of_run(1)))
+        wait_status(client, running.json()["info"]["id"], "ON")
+        waiting = client.post("/booking", json=booking_json(**of_run(1)))
+        reserved = client.post(
+            "/booking", json=booking_json(LATER, **of_run(1))
+        )
+        other = client.post("/booking", json=booking_json(**of_run(2)))
+
+        response = post_webhook(
+            client,
+            "workflow_run",
+            {
+                "action": "completed",
+                "workflow_run": {
+                    "id": 1,
+                    "status": "completed",
+                    "conclusion": "cancelled",
+                },
+            },
+        )
+
+        assert response.status_code == 204
+        for cancelled in [waiting, reserved]:
+            wait_status(client, cancelled.json()["info"]["id"], "CANCELLED")
+        assert (
+            client.get(f"/booking/{other.json()['info']['id']}").json()[
+                "info"
+            ]["status"]
+            == "WAITING"
+        )
+
+        # The slot of the reserved booking is free again
+        again = client.post("/booking", json=booking_json(LATER))
+        assert again.json()["reserved_resource"]["identifier"] == "r1"
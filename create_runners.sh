@@ -2,18 +2,20 @@
 
 set -eu
 
-usage="$(basename "$0") [-h] [-o OWNER] [-r REPO] [-n RUNNERS]
+usage="$(basename "$0") [-h] [-o OWNER] [-r REPO] [-n RUNNERS] [-t TYPE]
 where:
     -h  show this help text
     -o  GitHub repo owner
     -r  GitHub repo name
-    -n  number of runners"
+    -n  number of runners
+    -t  register the runners to the booking server as resources of this type"
 
 REPO=resource-booking-gh-runner
 OWNER=JoakimJoensuu
 RUNNERS_N=10
+RESOURCE_TYPE=""
 
-while getopts ':o:r:h:n:' option; do
+while getopts ':o:r:h:n:t:' option; do
   case "$option" in
   h)
     echo "$usage"
@@ -22,6 +24,7 @@ while getopts ':o:r:h:n:' option; do
   r) REPO=$OPTARG ;;
   o) OWNER=$OPTARG ;;
   n) RUNNERS_N=$OPTARG ;;
+  t) RESOURCE_TYPE=$OPTARG ;;
   :)
     printf "missing argument for -%s\n" "$OPTARG" >&2
     echo "$usage" >&2
@@ -84,6 +87,16 @@ while [ "$RUNNER_NO" -lt $RUNNERS_N ]; do
   RUNNER_NO=$((RUNNER_NO + 1))
 done
 
+if [ -n "$RESOURCE_TYPE" ]; then
+  jq -n \
+    --arg name "runners_${OWNER}_${REPO}" \
+    --arg type "$RESOURCE_TYPE" \
+    --argjson count "$RUNNERS_N" \
+    '{label: $name, resources: [range($count) | {type: $type, identifier: "runner_\(.)"}]}' \
+    >resources.json
+  booking resource sync resources.json
+fi
+
 echo "This pid $$"
 echo "All pids"
 for PID in $CHILD_PIDS; do